@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""Benchmark the gradebook library and webapp."""
+
+import json
+import random
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+from importlib.util import find_spec
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Tuple
+
+from generate import generate_gradebook
+from overunder import GradeBook
+
+BASELINE_PATH = Path(__file__).parent.joinpath('benchmark-baseline.json')
+
+TIERS = {
+    'small': {'num_students': 25, 'num_assignments': 20, 'depth': 2, 'fanout': 4},
+    'medium': {'num_students': 100, 'num_assignments': 40, 'depth': 2, 'fanout': 4},
+    'large': {'num_students': 400, 'num_assignments': 80, 'depth': 3, 'fanout': 3},
+} # type: Dict[str, Dict[str, int]]
+
+GRADE_STRS = ['None', '0', '1', '5', '10', '50%', '75%', '85%', '100%', 'B+', 'A-']
+
+
+def time_call(function, repeat):
+    # type: (Callable[[], Any], int) -> float
+    """Get the fastest of several timed calls, in seconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def count_nodes(gradebook):
+    # type: (GradeBook) -> int
+    """Count the AssignmentGrade nodes in the GradeBook."""
+    return len(gradebook.grades) * sum(1 for _ in gradebook.assignments.traversal)
+
+
+def benchmark_tier(tier_params, directory, repeat=3, num_edits=200, seed=0):
+    # type: (Dict[str, int], Path, int, int, int) -> Dict[str, Dict[str, float]]
+    """Benchmark a single scale tier.
+
+    Parameters:
+        tier_params (Dict[str, int]): Keyword arguments for generate_gradebook().
+        directory (Path): A scratch directory.
+        repeat (int): The number of times to repeat each timing.
+        num_edits (int): The number of grade edits to time.
+        seed (int): The random seed.
+
+    Returns:
+        Dict[str, Dict[str, float]]: Seconds and throughput for each phase.
+    """
+    csv_path = directory.joinpath('grades.csv')
+    generate_gradebook(csv_path, seed=seed, **tier_params)
+    results = {} # type: Dict[str, Dict[str, float]]
+
+    def record(phase, seconds, count, unit):
+        # type: (str, float, int, str) -> None
+        results[phase] = {'seconds': seconds, 'throughput': count / seconds, 'unit': unit}
+
+    # load
+    num_nodes = count_nodes(GradeBook(csv_path))
+    record('load', time_call(lambda: GradeBook(csv_path), repeat), num_nodes, 'nodes/s')
+    # memory
+    tracemalloc.start()
+    gradebook = GradeBook(csv_path)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results['memory'] = {'peak_bytes': peak, 'bytes_per_node': current / num_nodes}
+    # set_grade with propagation
+    rng = random.Random(seed)
+    leaves = [assignment.qualified_name for assignment in gradebook.assignments.traversal if assignment.is_leaf]
+    aliases = list(gradebook.students)
+    # a different batch of edits for each repetition, so that none are no-ops
+    edit_batches = [
+        [(rng.choice(aliases), rng.choice(leaves), rng.choice(GRADE_STRS)) for _ in range(num_edits)]
+        for _ in range(repeat)
+    ] # type: List[List[Tuple[str, str, str]]]
+
+    def edit():
+        # type: () -> None
+        for alias, qualified_name, grade_str in edit_batches.pop():
+            gradebook.set_grade(alias, qualified_name, grade_str)
+
+    record('set_grade', time_call(edit, repeat), num_edits, 'edits/s')
+    # bulk import of one column for every student
+    import_gradebooks = [GradeBook(csv_path) for _ in range(repeat)]
+    score_sheet = '\n'.join([
+        f'email,{leaves[0]}',
+        *(f'{student.email},{rng.choice(GRADE_STRS)}' for student in gradebook.students.values()),
+    ])
+    record(
+        'import',
+        time_call(lambda: import_gradebooks.pop().import_grades(score_sheet), repeat),
+        len(gradebook.students),
+        'rows/s',
+    )
+    # projection reads, from a cold cache
+    fresh_gradebooks = [GradeBook(csv_path) for _ in range(repeat)]
+
+    def project():
+        # type: () -> None
+        for assignment_grade_root in fresh_gradebooks.pop().grades.values():
+            for assignment_grade in assignment_grade_root.traversal:
+                _ = assignment_grade.projection_str
+                _ = assignment_grade.as_color
+
+    record('projection', time_call(project, repeat), num_nodes, 'cells/s')
+    # grid render
+    if find_spec('flask') is not None:
+        import overunderapp # pylint: disable = import-outside-toplevel
+        overunderapp.configure_app(csv_path)
+        client = overunderapp.APP.test_client()
+
+        def render():
+            # type: () -> None
+            response = client.get('/assignments-students/all/all/')
+            assert response.status_code == 200
+            _ = response.get_data()
+
+        record('render', time_call(render, repeat), num_nodes, 'cells/s')
+    # write_csv
+    record(
+        'write_csv',
+        time_call(lambda: gradebook.write_csv(filename='output.csv'), repeat),
+        len(gradebook.students),
+        'rows/s',
+    )
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # type: (Dict[str, Dict[str, Dict[str, float]]], Dict[str, Dict[str, Dict[str, float]]], float) -> List[str]
+    """Print the results against the baseline and return any regressions."""
+    regressions = []
+    for tier, phases in results.items():
+        print(f'{tier}:')
+        for phase, measures in phases.items():
+            old_measures = baseline.get(tier, {}).get(phase, {})
+            if phase == 'memory':
+                keys = [('peak_bytes', 'B peak', ',.0f'), ('bytes_per_node', 'B/node', ',.1f')]
+            else:
+                keys = [('seconds', 's', '.4f')]
+            for key, unit, spec in keys:
+                line = f'    {phase:<12} {measures[key]:>14{spec}} {unit}'
+                if 'throughput' in measures and key == 'seconds':
+                    line += f' ({measures["throughput"]:,.0f} {measures["unit"]})'
+                if key in old_measures:
+                    ratio = measures[key] / old_measures[key]
+                    line += f' [{ratio:.2f}x baseline]'
+                    if ratio > 1 + tolerance:
+                        line += ' REGRESSION'
+                        regressions.append(f'{tier} {phase} {key}')
+                print(line)
+    return regressions
+
+
+def main():
+    # type: () -> None
+    """Run the benchmarks from the command line."""
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument('--tiers', nargs='+', choices=TIERS, default=list(TIERS), help='The tiers to run.')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='The number of times to repeat each timing.')
+    arg_parser.add_argument('--baseline', type=Path, default=BASELINE_PATH, help='The baseline JSON file.')
+    arg_parser.add_argument('--save-baseline', action='store_true', help='Overwrite the baseline with these results.')
+    arg_parser.add_argument('--tolerance', type=float, default=0.25, help='The allowed slowdown before failing.')
+    args = arg_parser.parse_args()
+    results = {} # type: Dict[str, Dict[str, Dict[str, float]]]
+    with TemporaryDirectory() as directory:
+        for tier in args.tiers:
+            results[tier] = benchmark_tier(TIERS[tier], Path(directory), repeat=args.repeat)
+    if args.baseline.exists():
+        with args.baseline.open() as fd:
+            baseline = json.load(fd)
+    else:
+        baseline = {}
+    regressions = compare(results, baseline, args.tolerance)
+    if args.save_baseline:
+        with args.baseline.open('w') as fd:
+            json.dump(results, fd, indent=4, sort_keys=True)
+            fd.write('\n')
+    elif regressions:
+        print('regressions: ' + ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Generate synthetic gradebooks."""
+
+import random
+from argparse import ArgumentParser
+from fractions import Fraction
+from pathlib import Path
+from typing import Optional, List, Tuple
+
+WEIGHT_TYPES = ('percent', 'points', 'mixed')
+
+
+def _weight_strs(num_siblings, weight_type, rng):
+    # type: (int, str, random.Random) -> List[str]
+    """Create weight strings for a group of siblings."""
+    if weight_type == 'mixed':
+        weight_type = rng.choice(('percent', 'points'))
+    if weight_type == 'percent':
+        return [f'{float(Fraction(100, num_siblings)):.2f}%'] * num_siblings
+    else:
+        return [str(rng.choice((1, 5, 10, 10, 20, 25, 50, 100))) for _ in range(num_siblings)]
+
+
+def generate_headings(num_assignments, depth=2, fanout=4, weight_type='mixed', extra_credit_ratio=0.05, rng=None):
+    # type: (int, int, int, str, float, Optional[random.Random]) -> List[Tuple[str, bool]]
+    """Create the headings of a synthetic assignment tree.
+
+    The categories form a complete tree of the given depth and fanout, and the
+    leaf assignments are dealt round-robin into the deepest categories.
+
+    Parameters:
+        num_assignments (int): The number of leaf assignments.
+        depth (int): The depth of the leaves below the root.
+        fanout (int): The number of subcategories of each category.
+        weight_type (str): One of "percent", "points", or "mixed".
+        extra_credit_ratio (float): The fraction of leaves that are extra credit.
+        rng (random.Random): The random number generator.
+
+    Returns:
+        List[Tuple[str, bool]]: The headings, each with whether it is a leaf.
+    """
+    if weight_type not in WEIGHT_TYPES:
+        raise ValueError(f'weight type must be one of {", ".join(WEIGHT_TYPES)}: {weight_type}')
+    if rng is None:
+        rng = random.Random()
+    # build the category skeleton as nested lists of names
+    categories = [('Course', [])] # type: List[Tuple[str, List]]
+    frontier = [categories[0]]
+    for level in range(1, depth):
+        next_frontier = []
+        for _, children in frontier:
+            for i in range(fanout):
+                child = (f'Category{level}-{i + 1}', [])
+                children.append(child)
+                next_frontier.append(child)
+        frontier = next_frontier
+    for i in range(num_assignments):
+        frontier[i % len(frontier)][1].append((f'Assignment{i + 1}', None))
+    headings = [] # type: List[Tuple[str, bool]]
+
+    def visit(name, children, indent, weight_str):
+        # type: (str, Optional[List], int, str) -> None
+        is_leaf = children is None
+        extra_credit = '*' if is_leaf and rng.random() < extra_credit_ratio else ''
+        headings.append((f'{indent * "__"}{name}{extra_credit} ({weight_str})', is_leaf))
+        if children:
+            for (child_name, grandchildren), child_weight in zip(children, _weight_strs(len(children), weight_type, rng)):
+                visit(child_name, grandchildren, indent + 1, child_weight)
+
+    visit(*categories[0], 0, '100%')
+    return headings
+
+
+def _grade_str(weight_str, missing_ratio, rng):
+    # type: (str, float, random.Random) -> str
+    """Create a plausible grade for an assignment."""
+    if rng.random() < missing_ratio:
+        return 'None'
+    fraction = min(max(rng.gauss(0.82, 0.12), 0), 1)
+    style = rng.random()
+    if style < 0.05:
+        return rng.choice(('A', 'A-', 'B+', 'B', 'B-', 'C+', 'C'))
+    elif style < 0.15 or weight_str.endswith('%'):
+        return f'{fraction:.0%}'
+    else:
+        return str(round(fraction * int(weight_str)))
+
+
+def generate_gradebook(
+        path, num_students, num_assignments, depth=2, fanout=4,
+        weight_type='mixed', extra_credit_ratio=0.05, missing_ratio=0.1, seed=None,
+): # pylint: disable = too-many-arguments
+    # type: (Path, int, int, int, int, str, float, float, Optional[int]) -> None
+    """Write a synthetic gradebook TSV.
+
+    Parameters:
+        path (Path): The file to write.
+        num_students (int): The number of students.
+        num_assignments (int): The number of leaf assignments.
+        depth (int): The depth of the leaves below the root.
+        fanout (int): The number of subcategories of each category.
+        weight_type (str): One of "percent", "points", or "mixed".
+        extra_credit_ratio (float): The fraction of leaves that are extra credit.
+        missing_ratio (float): The fraction of leaf grades that are missing.
+        seed (int): The random seed.
+    """
+    rng = random.Random(seed)
+    headings = generate_headings(
+        num_assignments, depth=depth, fanout=fanout, weight_type=weight_type,
+        extra_credit_ratio=extra_credit_ratio, rng=rng,
+    )
+    with path.open('w') as fd:
+        fd.write('\t'.join(['Student', *(heading for heading, _ in headings)]))
+        fd.write('\n')
+        for i in range(num_students):
+            cells = [f'Last{i + 1}, First{i + 1} <student{i + 1}@example.edu>']
+            for heading, is_leaf in headings:
+                if is_leaf:
+                    weight_str = heading[heading.rindex('(') + 1:-1]
+                    cells.append(_grade_str(weight_str, missing_ratio, rng))
+                else:
+                    cells.append('None')
+            fd.write('\t'.join(cells))
+            fd.write('\n')
+
+
+def main():
+    # type: () -> None
+    """Generate a synthetic gradebook from the command line."""
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument('grades_file', type=Path, help='The grades CSV file to write.')
+    arg_parser.add_argument('--students', type=int, default=100, help='The number of students.')
+    arg_parser.add_argument('--assignments', type=int, default=40, help='The number of leaf assignments.')
+    arg_parser.add_argument('--depth', type=int, default=2, help='The depth of the leaves below the root.')
+    arg_parser.add_argument('--fanout', type=int, default=4, help='The number of subcategories per category.')
+    arg_parser.add_argument('--weight-type', choices=WEIGHT_TYPES, default='mixed', help='How weights are written.')
+    arg_parser.add_argument('--extra-credit-ratio', type=float, default=0.05, help='The fraction of extra credit leaves.')
+    arg_parser.add_argument('--missing-ratio', type=float, default=0.1, help='The fraction of missing grades.')
+    arg_parser.add_argument('--seed', type=int, help='The random seed.')
+    args = arg_parser.parse_args()
+    generate_gradebook(
+        args.grades_file, args.students, args.assignments, depth=args.depth, fanout=args.fanout,
+        weight_type=args.weight_type, extra_credit_ratio=args.extra_credit_ratio,
+        missing_ratio=args.missing_ratio, seed=args.seed,
+    )
+
+
+if __name__ == '__main__':
+    main()
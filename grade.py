@@ -1,8 +1,11 @@
+from bisect import bisect_right
 from collections import namedtuple
 from fractions import Fraction
+from functools import lru_cache
 
 Score = namedtuple('Score', 'letter, gpa, percent, fraction')
 Conversion = namedtuple('Conversion', 'letter, gpa, minimum, representative')
+ConversionTable = namedtuple('ConversionTable', 'conversions, minimums, gpas, by_letter')
 
 
 def mixed(whole, numer=0, denom=1, percent=False):
@@ -31,9 +34,17 @@ DEFAULT_BOUNDS = [
 
 
 def create_conversions(boundaries=None):
+    return list(conversion_table(boundaries).conversions)
+
+
+def conversion_table(boundaries=None):
     if boundaries is None:
         boundaries = DEFAULT_BOUNDS
-    boundaries = tuple(boundaries)
+    return _conversion_table(tuple(boundaries))
+
+
+@lru_cache(maxsize=32)
+def _conversion_table(boundaries):
     if len(boundaries) != 11:
         raise ValueError(f'expected 11 lower boundaries, but got {len(boundaries)}')
     if boundaries[0] != 0:
@@ -53,29 +64,30 @@ def create_conversions(boundaries=None):
             in zip(boundaries[1:], (*boundaries[2:], 1))
         ),
     ]
-    return [Conversion(*parts) for parts in zip(LETTERS, GPAS, boundaries, reps)]
+    conversions = tuple(Conversion(*parts) for parts in zip(LETTERS, GPAS, boundaries, reps))
+    return ConversionTable(
+        conversions,
+        tuple(conversion.minimum for conversion in conversions),
+        tuple(conversion.gpa for conversion in conversions),
+        {conversion.letter: conversion for conversion in conversions},
+    )
 
 
 def from_letter(orig_letters, boundaries=None):
-    conversion = create_conversions(boundaries)
+    table = conversion_table(boundaries)
     fractions = []
     for orig_letter in orig_letters.split('/'):
         if orig_letter == '':
             orig_letter = 'F'
-        found = False
-        for letter, _, _, frac in conversion:
-            if orig_letter == letter:
-                fractions.append(frac)
-                found = True
-                break
-        if not found:
+        if orig_letter not in table.by_letter:
             raise ValueError(f'invalid letter grade "{orig_letter}"')
-    mean_frac = mean(fractions)
-    return from_fraction(mean_frac.numerator, mean_frac.denominator)
+        fractions.append(table.by_letter[orig_letter].representative)
+    mean_frac = sum(fractions) / len(fractions)
+    return from_fraction(mean_frac.numerator, mean_frac.denominator, boundaries)
 
 
 def from_fraction(numerator, denominator, boundaries=None):
-    conversion = create_conversions(boundaries)
+    table = conversion_table(boundaries)
     if numerator < 0 or denominator < 0:
         raise ValueError(' '.join([
             'both numerator and denominator must be positive',
@@ -84,35 +96,50 @@ def from_fraction(numerator, denominator, boundaries=None):
     frac = Fraction(numerator, denominator)
     if not 0 <= frac <= 1:
         raise ValueError(f'invalid fraction "{frac}"')
-    for letter, gpa, minimum, _ in reversed(conversion):
-        if frac >= minimum:
-            return Score(letter, gpa, float(frac), frac)
-    letter = conversion[0].letter
-    gpa = conversion[0].gpa
+    letter, gpa, _, _ = table.conversions[bisect_right(table.minimums, frac) - 1]
     return Score(letter, gpa, float(frac), frac)
 
 
 def from_percent(percent, boundaries=None):
-    conversion = create_conversions(boundaries)
+    table = conversion_table(boundaries)
     if not 0 <= percent <= 1:
         raise ValueError(f'invalid percentage "{repr(percent)}"')
-    for letter, gpa, minimum, _ in reversed(conversion):
-        if percent >= minimum:
-            return Score(letter, gpa, percent, Fraction('{:.5f}'.format(percent)))
-    letter = conversion[0].letter
-    gpa = conversion[0].gpa
+    letter, gpa, _, _ = table.conversions[bisect_right(table.minimums, percent) - 1]
     return Score(letter, gpa, percent, Fraction('{:.5f}'.format(percent)))
 
 
 def from_gpa(orig_gpa, boundaries=None):
-    conversion = create_conversions(boundaries)
+    table = conversion_table(boundaries)
     if not 0 <= orig_gpa <= 4:
         raise ValueError(f'invalid GPA "{orig_gpa}"')
-    prev_gpa = conversion[0].gpa
-    for letter, gpa, _, frac in conversion:
-        if prev_gpa <= orig_gpa < gpa:
-            return Score(letter, orig_gpa, float(frac), frac)
-    letter = conversion[-1].letter
-    frac = conversion[-1].frac
+    letter, _, _, frac = table.conversions[bisect_right(table.gpas, orig_gpa) - 1]
     return Score(letter, orig_gpa, float(frac), frac)
 
+
+def _to_columns(values, lower, upper, thresholds, table, name):
+    letters = []
+    gpas = []
+    for value in values:
+        if not lower <= value <= upper:
+            raise ValueError(f'invalid {name} "{value!r}"')
+        conversion = table.conversions[bisect_right(thresholds, value) - 1]
+        letters.append(conversion.letter)
+        gpas.append(conversion.gpa)
+    return letters, gpas
+
+
+def from_fractions(fractions, boundaries=None):
+    table = conversion_table(boundaries)
+    return _to_columns(fractions, 0, 1, table.minimums, table, 'fraction')
+
+
+def from_percents(percents, boundaries=None):
+    table = conversion_table(boundaries)
+    return _to_columns(percents, 0, 1, table.minimums, table, 'percentage')
+
+
+def from_gpas(orig_gpas, boundaries=None):
+    table = conversion_table(boundaries)
+    orig_gpas = list(orig_gpas)
+    letters, _ = _to_columns(orig_gpas, 0, 4, table.gpas, table, 'GPA')
+    return letters, orig_gpas
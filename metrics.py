@@ -0,0 +1,172 @@
+"""Lightweight counters and latency histograms."""
+
+from bisect import bisect_left
+from time import perf_counter
+from typing import Dict, Generator, List, Optional, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """A cumulative histogram of observed durations."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        # type: (Tuple[float, ...]) -> None
+        """Initialize the Histogram."""
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # type: (float) -> None
+        """Record an observation."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        # type: () -> Generator[Tuple[str, int], None, None]
+        """Yield the upper bound and cumulative count of each bucket."""
+        running = 0
+        for bound, count in zip((*(str(bucket) for bucket in self.buckets), '+Inf'), self.counts):
+            running += count
+            yield bound, running
+
+
+class Timer:
+    """A context manager that records its duration in a Histogram."""
+
+    def __init__(self, histogram):
+        # type: (Histogram) -> None
+        """Initialize the Timer."""
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self):
+        # type: () -> Timer
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        # type: (*object) -> None
+        self.histogram.observe(perf_counter() - self.start)
+
+
+class Metrics:
+    """A registry of counters and histograms.
+
+    Counters are plain dictionary entries. Hot paths register their counters
+    up front and then increment them in place (`METRICS.counters[name] += 1`),
+    which costs about as much as a dictionary update.
+    """
+
+    def __init__(self, prefix='overunder'):
+        # type: (str) -> None
+        """Initialize the Metrics."""
+        self.prefix = prefix
+        self.counters = {} # type: Dict[str, int]
+        self.histograms = {} # type: Dict[Tuple[str, Labels], Histogram]
+
+    def register(self, *names):
+        # type: (*str) -> None
+        """Create counters, starting at zero."""
+        for name in names:
+            self.counters.setdefault(name, 0)
+
+    def increment(self, name, amount=1):
+        # type: (str, int) -> None
+        """Increment a counter."""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def histogram(self, name, labels=None):
+        # type: (str, Optional[Dict[str, str]]) -> Histogram
+        """Get a histogram, creating it if necessary."""
+        key = (name, tuple(sorted(labels.items())) if labels else ())
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = Histogram()
+            self.histograms[key] = histogram
+        return histogram
+
+    def observe(self, name, value, labels=None):
+        # type: (str, float, Optional[Dict[str, str]]) -> None
+        """Record an observation in a histogram."""
+        self.histogram(name, labels).observe(value)
+
+    def timer(self, name, labels=None):
+        # type: (str, Optional[Dict[str, str]]) -> Timer
+        """Create a context manager that times its body into a histogram."""
+        return Timer(self.histogram(name, labels))
+
+    def reset(self):
+        # type: () -> None
+        """Zero all counters and clear all histograms."""
+        for name in self.counters:
+            self.counters[name] = 0
+        self.histograms.clear()
+
+    def merge(self, snapshot):
+        # type: (Dict[str, object]) -> None
+        """Add the values from the snapshot() of another registry, eg. from another process."""
+        for name, value in snapshot['counters'].items():
+            self.increment(name, value)
+        for entry in snapshot['histograms']:
+            histogram = self.histogram(entry['name'], entry['labels'])
+            previous = 0
+            for index, cumulative_count in enumerate(entry['buckets'].values()):
+                histogram.counts[index] += cumulative_count - previous
+                previous = cumulative_count
+            histogram.total += entry['sum']
+            histogram.count += entry['count']
+
+    def snapshot(self):
+        # type: () -> Dict[str, object]
+        """Get the current values as a JSON-serializable dictionary."""
+        return {
+            'counters': dict(self.counters),
+            'histograms': [
+                {
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': histogram.count,
+                    'sum': histogram.total,
+                    'buckets': dict(histogram.cumulative_counts()),
+                }
+                for (name, labels), histogram in self.histograms.items()
+            ],
+        }
+
+    def to_prometheus(self):
+        # type: () -> str
+        """Render the current values in the Prometheus text exposition format."""
+        lines = [] # type: List[str]
+        for name, value in sorted(self.counters.items()):
+            full_name = f'{self.prefix}_{name}_total'
+            lines.append(f'# TYPE {full_name} counter')
+            lines.append(f'{full_name} {value}')
+        typed = set()
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            full_name = f'{self.prefix}_{name}'
+            if full_name not in typed:
+                lines.append(f'# TYPE {full_name} histogram')
+                typed.add(full_name)
+            label_strs = [f'{key}="{_escape(value)}"' for key, value in labels]
+            for bound, count in histogram.cumulative_counts():
+                bucket_labels = ','.join([*label_strs, f'le="{bound}"'])
+                lines.append(f'{full_name}_bucket{{{bucket_labels}}} {count}')
+            suffix = '{' + ','.join(label_strs) + '}' if label_strs else ''
+            lines.append(f'{full_name}_sum{suffix} {histogram.total}')
+            lines.append(f'{full_name}_count{suffix} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    # type: (str) -> str
+    """Escape a Prometheus label value."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+METRICS = Metrics()
@@ -1,23 +1,54 @@
 """A gradebook library."""
 
+import csv
+import hashlib
+import json
+import os
 import re
+import sys
+from argparse import ArgumentParser
+from bisect import bisect_left, bisect_right
+from collections.abc import MutableMapping
 from colorsys import rgb_to_hsv, hsv_to_rgb
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from fractions import Fraction
+from io import StringIO
+from math import ceil, floor, sqrt
 from numbers import Real
 from pathlib import Path
-from typing import Optional, Generator, Iterable, Mapping, Tuple, List, Dict
+from sys import intern
+from tempfile import NamedTemporaryFile
+from typing import IO, Callable, Optional, Generator, Iterable, Iterator, Mapping, Tuple, List, Dict, Set
+
+from grade import LETTERS, from_fractions
+from metrics import METRICS
+
+METRICS.register(
+    'named_node_get_calls',
+    'parse_fraction_calls',
+    'propagate_calls',
+    'weighted_grade_cache_hits',
+    'weighted_grade_cache_misses',
+)
+COUNTERS = METRICS.counters
 
 
 class NamedNode:
     """A tree where nodes are named hierarchically."""
 
+    __slots__ = ('name', '_parent', '_depth', '_children')
+
+    # shared by all leaves until they get a child
+    NO_CHILDREN = () # type: Tuple[NamedNode, ...]
+
     def __init__(self, name):
         # type: (str) -> None
         """Initialize the NamedNode."""
         self.name = name
         self._parent = None # type: Optional[NamedNode]
         self._depth = 0
-        self._children = [] # type: List[NamedNode]
+        self._children = self.NO_CHILDREN # type: List[NamedNode]
 
     def __contains__(self, qualified_name):
         # type: (str) -> bool
@@ -106,6 +137,7 @@ class NamedNode:
     def get(self, qualified_name):
         # type: (str) -> NamedNode
         """Get the NamedNode."""
+        COUNTERS['named_node_get_calls'] += 1
         names = qualified_name.split('__')
         assert names[0] == self.name, f'"{names[0]}" != "{self.name}"'
         return self._get(names)
@@ -123,14 +155,35 @@ class NamedNode:
         """Propagate information to ancestors."""
         pass
 
-    def add_child(self, node):
-        # type: (NamedNode) -> None
+    def _structure_changed(self):
+        # type: () -> None
+        """Respond to a change in the children of this NamedNode."""
+        pass
+
+    def add_child(self, node, propagate=True, index=None):
+        # type: (NamedNode, bool, Optional[int]) -> None
         # pylint: disable = protected-access
-        """Add a child to this NamedNode."""
-        self._children.append(node)
+        """Add a child to this NamedNode, by default as the youngest."""
+        if self._children is self.NO_CHILDREN:
+            self._children = []
+        if index is None:
+            self._children.append(node)
+        else:
+            self._children.insert(index, node)
         node._parent = self
         node._depth = self._depth + 1
-        node._propagate()
+        for child in node._children:
+            child._update_depths()
+        self._structure_changed()
+        if propagate:
+            node._propagate()
+
+    def _update_depths(self):
+        # type: () -> None
+        """Recalculate the depths of this subtree after it has been attached."""
+        self._depth = self._parent._depth + 1 # pylint: disable = protected-access
+        for child in self._children:
+            child._update_depths()
 
     def add_descendant(self, qualified_name, node):
         # type: (str, NamedNode) -> None
@@ -165,6 +218,7 @@ class NamedNode:
         index = descendant.parent.index_of(names[-1])
         if index > 0:
             children[index - 1], children[index] = children[index], children[index - 1]
+            descendant.parent._structure_changed()
 
     def move_node_down(self, qualified_name):
         # type: (str) -> None
@@ -177,6 +231,7 @@ class NamedNode:
         index = descendant.parent.index_of(names[-1])
         if index < len(children) - 1:
             children[index], children[index + 1] = children[index + 1], children[index]
+            descendant.parent._structure_changed()
 
     def remove_node(self, qualified_name):
         # type: (str) -> NamedNode
@@ -185,8 +240,12 @@ class NamedNode:
         assert names[0] == self.name
         assert len(names) > 1
         descendant = self._get(names)
-        index = descendant.parent.index_of(names[-1])
-        return descendant.parent._children.pop(index) # pylint: disable = protected-access
+        parent = descendant.parent
+        index = parent.index_of(names[-1])
+        node = parent._children.pop(index) # pylint: disable = protected-access
+        parent._structure_changed() # pylint: disable = protected-access
+        parent._propagate() # pylint: disable = protected-access
+        return node
 
     def to_heading(self, indent='__'):
         # type: (str) -> str
@@ -230,6 +289,7 @@ DEFAULT_GRADE_SCALE = {
 def parse_fraction(string, full_points=None, grade_scale=None):
     # type: (str, Optional[Fraction], Optional[Mapping[str, Fraction]]) -> Tuple[Optional[Fraction], str]
     """Parse a string into a Fraction."""
+    COUNTERS['parse_fraction_calls'] += 1
     if string.lower() == 'none':
         return None, 'none'
     string = string.lstrip('+')
@@ -256,6 +316,8 @@ def parse_fraction(string, full_points=None, grade_scale=None):
     elif LETTER_REGEX.fullmatch(string):
         if grade_scale is None:
             grade_scale = DEFAULT_GRADE_SCALE
+        if any(letter not in grade_scale for letter in string.split('/')):
+            raise ValueError(f'letter grade not on the grade scale: {string}')
         if '/' in string:
             lower, upper = string.split('/')
             fraction = (
@@ -273,16 +335,583 @@ def parse_fraction(string, full_points=None, grade_scale=None):
         return fraction, fraction_type
 
 
+class GradeScale:
+    """A mapping from letter grades to their exclusive upper boundaries.
+
+    The GradeScale also holds a flyweight table of parsed grades, since
+    letter grades parse differently under different scales.
+    """
+
+    MAX_PARSED_GRADES = 4096
+
+    def __init__(self, boundaries=None):
+        # type: (Optional[Mapping[str, Fraction]]) -> None
+        """Initialize the GradeScale."""
+        self._boundaries = {} # type: Dict[str, Fraction]
+        self._letters = [] # type: List[str]
+        self._thresholds = [] # type: List[Fraction]
+        self._parsed_grades = {} # type: Dict[Tuple[str, Optional[Fraction]], Tuple[Optional[Fraction], str]]
+        if boundaries is None:
+            boundaries = DEFAULT_GRADE_SCALE
+        self.set_boundaries(boundaries)
+
+    def __getitem__(self, letter):
+        # type: (str) -> Fraction
+        return self._boundaries[letter]
+
+    def __contains__(self, letter):
+        # type: (str) -> bool
+        return letter in self._boundaries
+
+    def __eq__(self, other):
+        # type: (object) -> bool
+        if not isinstance(other, GradeScale):
+            return NotImplemented
+        return self._boundaries == other._boundaries
+
+    def __str__(self):
+        # type: () -> str
+        return '\t'.join([
+            'Scale',
+            *(f'{letter} ({self._fraction_str(boundary)})' for letter, boundary in self.items()),
+        ])
+
+    @staticmethod
+    def _fraction_str(fraction):
+        # type: (Fraction) -> str
+        if (fraction * 10000).denominator == 1:
+            return f'{float(fraction):.2%}'
+        else:
+            return f'{fraction.numerator}/{fraction.denominator}'
+
+    @staticmethod
+    def from_string(string):
+        # type: (str) -> GradeScale
+        """Parse a tab-separated scale line of "letter (boundary)" cells."""
+        boundaries = {}
+        for cell in string.split('\t')[1:]:
+            match = re.fullmatch(r'(?P<letter>[^ ]+) \((?P<boundary>[^)]*)\)', cell)
+            if match is None:
+                raise ValueError(f'invalid grade scale entry: {cell}')
+            boundaries[match.group('letter')] = parse_fraction(match.group('boundary'))[0]
+        return GradeScale(boundaries)
+
+    def items(self):
+        # type: () -> Generator[Tuple[str, Fraction], None, None]
+        """Yield the letters and boundaries, from lowest to highest."""
+        yield from zip(self._letters, self._thresholds)
+
+    @property
+    def lower_bounds(self):
+        # type: () -> List[Fraction]
+        """Get the inclusive lower boundary of each letter, from lowest to highest."""
+        return [Fraction(0), *self._thresholds[:-1]]
+
+    def set_boundaries(self, boundaries):
+        # type: (Mapping[str, Fraction]) -> None
+        """Replace the boundaries and recompile the threshold lookup."""
+        ordered = sorted(boundaries.items(), key=(lambda item: item[1]))
+        if not ordered:
+            raise ValueError('grade scale must have at least one letter')
+        for (_, lower), (letter, upper) in zip(ordered[:-1], ordered[1:]):
+            if lower == upper:
+                raise ValueError(f'grade scale boundary for {letter} is not unique: {upper}')
+        self._boundaries = dict(ordered)
+        self._letters = [letter for letter, _ in ordered]
+        self._thresholds = [boundary for _, boundary in ordered]
+        self._parsed_grades = {}
+
+    def parse(self, grade_str, full_points=None):
+        # type: (str, Optional[Fraction]) -> Tuple[Optional[Fraction], str]
+        """Parse a grade string, sharing the result with identical grades."""
+        key = (grade_str, full_points)
+        parsed = self._parsed_grades.get(key)
+        if parsed is None:
+            if len(self._parsed_grades) >= self.MAX_PARSED_GRADES:
+                self._parsed_grades = {}
+            parsed = parse_fraction(grade_str, full_points=full_points, grade_scale=self)
+            self._parsed_grades[key] = parsed
+        return parsed
+
+    def letter(self, fraction):
+        # type: (Fraction) -> str
+        """Get the letter grade associated with the fraction."""
+        index = bisect_right(self._thresholds, fraction)
+        if index == len(self._letters):
+            return self._letters[-1]
+        return self._letters[index]
+
+    def letters(self, fractions):
+        # type: (Iterable[Fraction]) -> List[str]
+        """Get the letter grades associated with each of the fractions."""
+        thresholds = self._thresholds
+        letters = self._letters
+        last = len(letters) - 1
+        return [letters[min(bisect_right(thresholds, fraction), last)] for fraction in fractions]
+
+
+class AssignmentStats:
+    """Running class statistics for an assignment."""
+
+    NUM_BUCKETS = 10
+
+    def __init__(self):
+        # type: () -> None
+        """Initialize the AssignmentStats."""
+        self.count = 0
+        self.total = Fraction(0)
+        self.total_squares = Fraction(0)
+        self.histogram = [0] * self.NUM_BUCKETS
+
+    def _bucket(self, grade):
+        # type: (Fraction) -> int
+        return min(max(floor(grade * self.NUM_BUCKETS), 0), self.NUM_BUCKETS - 1)
+
+    def add(self, grade):
+        # type: (Fraction) -> None
+        """Add a grade to the statistics."""
+        self.count += 1
+        self.total += grade
+        self.total_squares += grade * grade
+        self.histogram[self._bucket(grade)] += 1
+
+    def remove(self, grade):
+        # type: (Fraction) -> None
+        """Remove a previously added grade from the statistics."""
+        self.count -= 1
+        self.total -= grade
+        self.total_squares -= grade * grade
+        self.histogram[self._bucket(grade)] -= 1
+
+    def replace(self, old_grade, new_grade):
+        # type: (Optional[Fraction], Optional[Fraction]) -> None
+        """Replace a grade with another, where None means no grade."""
+        if old_grade is not None:
+            self.remove(old_grade)
+        if new_grade is not None:
+            self.add(new_grade)
+
+    @property
+    def mean(self):
+        # type: () -> Optional[Fraction]
+        """Get the mean grade."""
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    @property
+    def variance(self):
+        # type: () -> Optional[Fraction]
+        """Get the (population) variance of the grades."""
+        if self.count == 0:
+            return None
+        mean = self.total / self.count
+        return max(self.total_squares / self.count - mean * mean, Fraction(0))
+
+    @property
+    def std_dev(self):
+        # type: () -> Optional[float]
+        """Get the (population) standard deviation of the grades."""
+        variance = self.variance
+        if variance is None:
+            return None
+        return sqrt(variance)
+
+    @property
+    def median(self):
+        # type: () -> Optional[Fraction]
+        """Estimate the median grade by interpolating within the histogram."""
+        if self.count == 0:
+            return None
+        half = Fraction(self.count, 2)
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            if count and seen + count >= half:
+                return (bucket + (half - seen) / count) / self.NUM_BUCKETS
+            seen += count
+        return Fraction(1)
+
+    def to_dict(self):
+        # type: () -> Dict[str, object]
+        """Convert the statistics to a JSON-serializable dictionary."""
+        mean = self.mean
+        median = self.median
+        return {
+            'count': self.count,
+            'mean': None if mean is None else float(mean),
+            'median': None if median is None else float(median),
+            'std_dev': self.std_dev,
+            'histogram': list(self.histogram),
+        }
+
+
+class AssignmentRanking:
+    """An order-statistic index of the grades for an assignment.
+
+    The grades are kept in a sorted list. Queries bisect it in O(log n), but
+    an update shifts the list and so takes O(n); for class-sized n, that is a
+    short memmove, which is cheaper than the bisection's Fraction comparisons.
+    """
+
+    def __init__(self):
+        # type: () -> None
+        """Initialize the AssignmentRanking."""
+        # parallel lists, sorted by grade
+        self._grades = [] # type: List[Fraction]
+        self._aliases = [] # type: List[str]
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._grades)
+
+    def replace(self, alias, old_grade, new_grade):
+        # type: (str, Optional[Fraction], Optional[Fraction]) -> None
+        """Replace a student's grade, where None means no grade."""
+        if old_grade is not None:
+            index = self._aliases.index(
+                alias,
+                bisect_left(self._grades, old_grade),
+                bisect_right(self._grades, old_grade),
+            )
+            del self._grades[index]
+            del self._aliases[index]
+        if new_grade is not None:
+            index = bisect_right(self._grades, new_grade)
+            self._grades.insert(index, new_grade)
+            self._aliases.insert(index, alias)
+
+    def rank(self, grade):
+        # type: (Fraction) -> int
+        """Get the 1-based rank of the grade, where ties share the best rank."""
+        return len(self._grades) - bisect_right(self._grades, grade) + 1
+
+    def percentile(self, grade):
+        # type: (Fraction) -> Fraction
+        """Get the percentile rank of the grade, counting half of any ties."""
+        if not self._grades:
+            return Fraction(0)
+        below = bisect_left(self._grades, grade)
+        at_or_below = bisect_right(self._grades, grade)
+        return Fraction(below + at_or_below, 2 * len(self._grades))
+
+    @property
+    def median(self):
+        # type: () -> Optional[Fraction]
+        """Get the exact median grade."""
+        size = len(self._grades)
+        if size == 0:
+            return None
+        elif size % 2 == 1:
+            return self._grades[size // 2]
+        else:
+            return (self._grades[size // 2 - 1] + self._grades[size // 2]) / 2
+
+    def top(self, k):
+        # type: (int) -> List[Tuple[str, Fraction]]
+        """Get the aliases and grades of the k highest grades, best first."""
+        start = max(len(self._grades) - k, 0)
+        return list(zip(reversed(self._aliases[start:]), reversed(self._grades[start:])))
+
+    def bottom(self, k):
+        # type: (int) -> List[Tuple[str, Fraction]]
+        """Get the aliases and grades of the k lowest grades, worst first."""
+        return list(zip(self._aliases[:k], self._grades[:k]))
+
+    def top_percent(self, percent):
+        # type: (Fraction) -> List[Tuple[str, Fraction]]
+        """Get the aliases and grades in the top fraction of the class."""
+        return self.top(ceil(percent * len(self._grades)))
+
+    def bottom_percent(self, percent):
+        # type: (Fraction) -> List[Tuple[str, Fraction]]
+        """Get the aliases and grades in the bottom fraction of the class."""
+        return self.bottom(ceil(percent * len(self._grades)))
+
+    def aliases(self, descending=True):
+        # type: (bool) -> List[str]
+        """Get the aliases of all graded students in grade order."""
+        if descending:
+            return self._aliases[::-1]
+        else:
+            return list(self._aliases)
+
+
+class GradePolicy:
+    """How a category combines the grades of its children.
+
+    Policies are written after the weight in a heading, separated by commas,
+    eg. "Homeworks (30%, drop 2, cap)":
+        drop N: ignore the N lowest grades
+        keep K: only count the K highest grades
+        cap: limit the category to 100%, even with extra credit
+    Extra credit children are never dropped, and at least one grade is always kept.
+    """
+
+    def __init__(self, drop_lowest=0, keep_highest=None, capped=False):
+        # type: (int, Optional[int], bool) -> None
+        """Initialize the GradePolicy."""
+        self.drop_lowest = drop_lowest
+        self.keep_highest = keep_highest
+        self.capped = capped
+
+    def __bool__(self):
+        # type: () -> bool
+        return self.drop_lowest > 0 or self.keep_highest is not None or self.capped
+
+    def __str__(self):
+        # type: () -> str
+        options = []
+        if self.drop_lowest:
+            options.append(f'drop {self.drop_lowest}')
+        if self.keep_highest is not None:
+            options.append(f'keep {self.keep_highest}')
+        if self.capped:
+            options.append('cap')
+        return ', '.join(options)
+
+    @staticmethod
+    def split(string):
+        # type: (str) -> Tuple[str, GradePolicy]
+        """Split the parenthesized part of a heading into the weight string and the policy."""
+        weight_str, *options = string.split(',')
+        return weight_str.strip(), GradePolicy.from_strings(options)
+
+    @staticmethod
+    def from_strings(options):
+        # type: (Iterable[str]) -> GradePolicy
+        """Parse policy options like "drop 2", "keep 5", and "cap"."""
+        policy = GradePolicy()
+        for option in options:
+            match = re.fullmatch(r'(?P<policy>drop|keep|cap)( (?P<count>[0-9]+))?', option.strip())
+            if match is None or (match.group('policy') == 'cap') != (match.group('count') is None):
+                raise ValueError(f'invalid grade policy: {option}')
+            if match.group('policy') == 'drop':
+                policy.drop_lowest = int(match.group('count'))
+            elif match.group('policy') == 'keep':
+                policy.keep_highest = int(match.group('count'))
+            else:
+                policy.capped = True
+        return policy
+
+    @property
+    def info_str(self):
+        # type: () -> str
+        """Get a human-readable description of the policy."""
+        info = []
+        if self.drop_lowest:
+            info.append(f'Drops the lowest {self.drop_lowest}')
+        if self.keep_highest is not None:
+            info.append(f'Keeps the highest {self.keep_highest}')
+        if self.capped:
+            info.append('Capped at 100%')
+        return '\n'.join(info)
+
+    def num_dropped(self, count):
+        # type: (int) -> int
+        """Get the number of the lowest grades to drop, out of this many."""
+        dropped = self.drop_lowest
+        if self.keep_highest is not None:
+            dropped = max(dropped, count - self.keep_highest)
+        return max(min(dropped, count - 1), 0)
+
+
+class PolicyGrades:
+    """The grades of the children of a category with a GradePolicy.
+
+    For each projection (default grades of 0, None, and 1), the grades of the
+    regular children are kept in a sorted list with running totals, so that
+    a child's new grade is a bisection and the category grade only needs to
+    look at the dropped (or kept, whichever is fewer) end of the list.
+    Extra credit grades are only summed, since they are never dropped.
+    """
+
+    DEFAULT_GRADES = (0, None, 1)
+
+    def __init__(self, policy, weights, extra_credits):
+        # type: (GradePolicy, Dict[str, Fraction], Dict[str, bool]) -> None
+        """Initialize the PolicyGrades.
+
+        Parameters:
+            policy (GradePolicy): The policy of the category.
+            weights (Dict[str, Fraction]): The percent weight of each child, by name.
+            extra_credits (Dict[str, bool]): Whether each child is extra credit, by name.
+        """
+        self.policy = policy
+        self.weights = weights
+        self.extra_credits = extra_credits
+        # the (minimum, partial, maximum) grades currently counted for each child
+        self._entries = {} # type: Dict[str, Tuple[Fraction, Optional[Fraction], Fraction]]
+        self._sorted = {default: [] for default in self.DEFAULT_GRADES} # type: Dict[Optional[int], List[Tuple[Fraction, str]]]
+        self._total_grades = {default: Fraction(0) for default in self.DEFAULT_GRADES} # type: Dict[Optional[int], Fraction]
+        self._total_weights = {default: Fraction(0) for default in self.DEFAULT_GRADES} # type: Dict[Optional[int], Fraction]
+        self._extra_credit = {default: Fraction(0) for default in self.DEFAULT_GRADES} # type: Dict[Optional[int], Fraction]
+
+    def update(self, name, new_grades):
+        # type: (str, Tuple[Fraction, Optional[Fraction], Fraction]) -> None
+        """Update a child's (minimum, partial, maximum) grades, where a partial of None is not counted."""
+        old_grades = self._entries.get(name)
+        if old_grades == new_grades:
+            return
+        self._entries[name] = new_grades
+        weight = self.weights[name]
+        extra_credit = self.extra_credits[name]
+        for i, default in enumerate(self.DEFAULT_GRADES):
+            old_grade = None if old_grades is None else old_grades[i]
+            new_grade = None if new_grades is None else new_grades[i]
+            if old_grade == new_grade:
+                continue
+            if extra_credit:
+                if old_grade is not None:
+                    self._extra_credit[default] -= weight * old_grade
+                if new_grade is not None:
+                    self._extra_credit[default] += weight * new_grade
+                continue
+            entries = self._sorted[default]
+            if old_grade is not None:
+                del entries[bisect_left(entries, (old_grade, name))]
+                self._total_grades[default] -= weight * old_grade
+                self._total_weights[default] -= weight
+            if new_grade is not None:
+                entries.insert(bisect_left(entries, (new_grade, name)), (new_grade, name))
+                self._total_grades[default] += weight * new_grade
+                self._total_weights[default] += weight
+
+    def grade(self, default_grade):
+        # type: (Optional[int]) -> Fraction
+        """Get the category grade for a projection."""
+        entries = self._sorted[default_grade]
+        num_dropped = self.policy.num_dropped(len(entries))
+        weights = self.weights
+        if num_dropped <= len(entries) // 2:
+            total_grade = self._total_grades[default_grade]
+            total_weight = self._total_weights[default_grade]
+            for grade, name in entries[:num_dropped]:
+                total_grade -= weights[name] * grade
+                total_weight -= weights[name]
+        else:
+            total_grade = Fraction(0)
+            total_weight = Fraction(0)
+            for grade, name in entries[num_dropped:]:
+                total_grade += weights[name] * grade
+                total_weight += weights[name]
+        total_grade += self._extra_credit[default_grade]
+        if total_weight == 0:
+            result = Fraction(0)
+        else:
+            result = total_grade / total_weight
+        if self.policy.capped:
+            result = min(result, Fraction(1))
+        return result
+
+
 class Assignment(NamedNode):
     """An assignment with a specific weight."""
 
-    def __init__(self, name, weight_str, extra_credit=False):
-        # type: (str, str, bool) -> None
+    __slots__ = (
+        '_weight_str', 'extra_credit', 'policy', '_weight', '_weight_type', '_percent_weight',
+        'grade_scale', 'stats', 'ranking', '_preorder', '_preorder_entry', '_preorder_exit',
+    )
+
+    def __init__(self, name, weight_str, extra_credit=False, grade_scale=None, policy=None):
+        # type: (str, str, bool, Optional[GradeScale], Optional[GradePolicy]) -> None
         """Initialize the Assignment."""
         super().__init__(name)
         self._weight_str = weight_str
         self.extra_credit = extra_credit
+        # None for a plain weighted average of the children
+        self.policy = policy if policy else None
+        if grade_scale is None:
+            grade_scale = GradeScale()
+        self.grade_scale = grade_scale
         self._weight, self._weight_type = self._parse_weight_str(self._weight_str)
+        # cache, reset whenever the siblings change
+        self._percent_weight = None # type: Optional[Fraction]
+        self.stats = AssignmentStats()
+        self.ranking = AssignmentRanking()
+        # preorder index; the list is only kept by the root, and the interval
+        # [entry, exit) of each Assignment is the slice of its subtree
+        self._preorder = None # type: Optional[List[Assignment]]
+        self._preorder_entry = 0
+        self._preorder_exit = 1
+
+    @staticmethod
+    def from_strings(headings, grade_scale=None):
+        # type: (Iterable[str], Optional[GradeScale]) -> Assignment
+        """Create an Assignment tree from underscore-prefixed headings."""
+        heading_regex = r'(?P<indent>(__)*)(?P<name>[^*]*)(?P<extra_credit>\*?) \((?P<weight_str>[^)]*)\)'
+        if grade_scale is None:
+            grade_scale = GradeScale()
+        stack = [] # type: List[Assignment]
+        for heading in headings:
+            match = re.fullmatch(heading_regex, heading)
+            assert match is not None
+            depth = len(match.group('indent')) // 2
+            name = match.group('name')
+            extra_credit = bool(match.group('extra_credit'))
+            weight_str, policy = GradePolicy.split(match.group('weight_str'))
+            stack = stack[:depth]
+            assignment = Assignment(name, weight_str, extra_credit=extra_credit, grade_scale=grade_scale, policy=policy)
+            if len(stack) > 0:
+                stack[-1].add_child(assignment)
+            stack.append(assignment)
+        return stack[0]
+
+    @property
+    def root(self):
+        # type: () -> Assignment
+        """Get the root of the Assignment tree."""
+        curr = self
+        while curr.parent is not None:
+            curr = curr.parent
+        return curr
+
+    def _structure_changed(self):
+        # type: () -> None
+        """Invalidate the preorder index of the tree and the percent weights of the children."""
+        # pylint: disable = protected-access
+        self.root._preorder = None
+        for child in self._children:
+            child._percent_weight = None
+
+    @property
+    def preorder(self):
+        # type: () -> List[Assignment]
+        """Get the cached preorder list of the whole tree."""
+        return self._ensure_preorder()
+
+    def _ensure_preorder(self):
+        # type: () -> List[Assignment]
+        """Rebuild the preorder index of the tree if necessary."""
+        root = self.root
+        if root._preorder is None: # pylint: disable = protected-access
+            preorder = list(root.traversal)
+            for index, assignment in enumerate(preorder):
+                assignment._preorder_entry = index # pylint: disable = protected-access
+            for assignment in reversed(preorder):
+                if assignment.is_leaf:
+                    assignment._preorder_exit = assignment._preorder_entry + 1 # pylint: disable = protected-access
+                else:
+                    assignment._preorder_exit = assignment._children[-1]._preorder_exit # pylint: disable = protected-access
+            root._preorder = preorder # pylint: disable = protected-access
+        return root._preorder # pylint: disable = protected-access
+
+    @property
+    def subtree(self):
+        # type: () -> List[Assignment]
+        """Get this Assignment and its descendants in preorder."""
+        return self._ensure_preorder()[self._preorder_entry:self._preorder_exit]
+
+    def is_ancestor_of(self, other):
+        # type: (Assignment) -> bool
+        """Return whether this Assignment is the other or one of its ancestors."""
+        self._ensure_preorder()
+        return self._preorder_entry <= other._preorder_entry < self._preorder_exit
+
+    def to_headings(self):
+        # type: () -> Generator[str, None, None]
+        """Yield the underscore-prefixed headings of this Assignment and its descendants."""
+        for assignment in self.traversal:
+            yield assignment.to_heading()
 
     def _parse_weight_str(self, weight_str):
         # type: (str) -> Tuple[Fraction, str]
@@ -294,20 +923,31 @@ class Assignment(NamedNode):
 
     def __str__(self):
         # type: () -> str
+        if self.policy:
+            return f'{self.name}{"*" if self.extra_credit else ""} ({self._weight_str}, {self.policy})'
         return f'{self.name}{"*" if self.extra_credit else ""} ({self._weight_str})'
 
     @property
     def percent_weight(self):
         # type: () -> Fraction
         """Get the weight as a percentage of its siblings' total."""
+        if self._percent_weight is not None:
+            return self._percent_weight
         if self.parent is None:
             return Fraction(1)
         elif self._weight_str.endswith('%') or '/' in self._weight_str:
-            return self._weight
+            self._percent_weight = self._weight
         elif re.fullmatch('[0-9.]*', self._weight_str):
-            return self._weight / sum(child._weight for child in self.parent.children)
+            self._percent_weight = self._weight / sum(child._weight for child in self.parent.children)
         else:
             raise ValueError(f'invalid weight string: {self._weight_str}')
+        return self._percent_weight
+
+    @property
+    def full_points(self):
+        # type: () -> Fraction
+        """Get the weight that scores without a percent sign are out of."""
+        return self._weight
 
     @property
     def weight_display(self):
@@ -336,6 +976,8 @@ class Assignment(NamedNode):
             if child_weight_types == set(['points']):
                 points = sum(child._weight for child in self.children)
                 info.append(f'Total child weight: {points}pts')
+        if self.policy:
+            info.append(self.policy.info_str)
         return '\n'.join(info)
 
 
@@ -344,30 +986,60 @@ class ColorScale:
     def __init__(self, anchors, resolution=2):
         # type: (Iterable[Tuple[Fraction, str]], int) -> None
         """Initialize the ColorScale."""
-        hsv_anchors = [(int(100 * round(bound, resolution)), self.html_to_hsv(html)) for bound, html in anchors]
         self.resolution = resolution
-        self.lowest = Fraction(hsv_anchors[0][0], 100)
-        self.highest = Fraction(hsv_anchors[-1][0], 100)
-        self.percent_map = {} # type: Dict[Fraction, str]
+        self._steps = 10 ** resolution
+        hsv_anchors = [
+            (int(self._steps * round(bound, resolution)), self.html_to_hsv(html))
+            for bound, html in anchors
+        ]
+        self._lowest_step = hsv_anchors[0][0]
+        self._highest_step = hsv_anchors[-1][0]
+        self.lowest = Fraction(self._lowest_step, self._steps)
+        self.highest = Fraction(self._highest_step, self._steps)
+        # colors indexed by the number of steps above the lowest anchor
+        self._colors = [] # type: List[str]
         for (lower_bound, lower_hsv), (upper_bound, upper_hsv) in zip(hsv_anchors[:-1], hsv_anchors[1:]):
-            for percent in range(lower_bound, upper_bound):
-                fraction = Fraction(percent, 100)
-                weight = (percent - lower_bound) / (upper_bound - lower_bound)
-                html = self.hsv_to_html(*(
+            for step in range(lower_bound, upper_bound):
+                weight = (step - lower_bound) / (upper_bound - lower_bound)
+                self._colors.append(self.hsv_to_html(*(
                     (1 - weight) * lower_channel + weight * upper_channel
                     for lower_channel, upper_channel in zip(lower_hsv, upper_hsv)
-                ))
-                self.percent_map[fraction] = html
-        self.percent_map[self.highest] = self.hsv_to_html(*hsv_anchors[-1][1])
+                )))
+        self._colors.append(self.hsv_to_html(*hsv_anchors[-1][1]))
 
     def __getitem__(self, fraction):
         # type: (Fraction) -> str
-        if fraction < self.lowest:
-            return self.percent_map[self.lowest]
-        elif self.highest < fraction:
-            return self.percent_map[self.highest]
+        return self._colors[self._index(fraction)]
+
+    def _index(self, fraction):
+        # type: (Fraction) -> int
+        """Round the fraction to the nearest step (ties to even) and clamp it to the table."""
+        step, remainder = divmod(fraction.numerator * self._steps, fraction.denominator)
+        if 2 * remainder > fraction.denominator or (2 * remainder == fraction.denominator and step % 2 == 1):
+            step += 1
+        if step <= self._lowest_step:
+            return 0
+        elif step >= self._highest_step:
+            return self._highest_step - self._lowest_step
         else:
-            return self.percent_map[round(fraction, self.resolution)]
+            return step - self._lowest_step
+
+    def to_dict(self):
+        # type: () -> Dict[str, object]
+        """Get the lookup table as a JSON-serializable dictionary."""
+        return {
+            'steps': self._steps,
+            'lowest_step': self._lowest_step,
+            'highest_step': self._highest_step,
+            'colors': self._colors,
+        }
+
+    def colors(self, fractions, default='#FFFFFF'):
+        # type: (Iterable[Optional[Fraction]], str) -> List[str]
+        """Map many fractions onto the scale, using the default for None."""
+        colors = self._colors
+        index = self._index
+        return [default if fraction is None else colors[index(fraction)] for fraction in fractions]
 
     @staticmethod
     def html_to_hsv(color):
@@ -391,34 +1063,43 @@ class ColorScale:
 class AssignmentGrade(NamedNode):
     """A grade for a specific assignment."""
 
+    __slots__ = (
+        'assignment', 'alias', '_grade_str', '_has_grade', '_percent_grade',
+        '_minimum_grade', '_partial_grade', '_maximum_grade', '_stats_grade',
+        '_policy_grades',
+    )
+
     COLOR_SCALE = ColorScale([
         (Fraction(6, 10), '#F5C7C3'),
         (Fraction(8, 10), '#FCE8AF'),
         (Fraction(10, 10),'#B6E1CC'),
     ])
 
-    def __init__(self, assignment, grade_str):
-        # type: (Assignment, str) -> None
+    def __init__(self, assignment, grade_str, alias):
+        # type: (Assignment, str, str) -> None
         """Initialize this AssignmentGrade."""
         super().__init__(assignment.name)
         self.assignment = assignment
+        self.alias = alias
         # leaf variables
-        self._grade_str = grade_str
+        self._grade_str = intern(grade_str)
         # cache
         self._has_grade = False
         self._percent_grade = None # type: Optional[Fraction]
-        self._weight_grade_cache = {} # type: Dict[Optional[Real], Fraction]
+        # projections for default grades of 0, None, and 1 respectively
+        self._minimum_grade = None # type: Optional[Fraction]
+        self._partial_grade = None # type: Optional[Fraction]
+        self._maximum_grade = None # type: Optional[Fraction]
+        # the grade currently counted in the assignment statistics and ranking
+        self._stats_grade = None # type: Optional[Fraction]
+        # the children's grades, if the assignment has a GradePolicy
+        self._policy_grades = None # type: Optional[PolicyGrades]
         # initialize
         self.set_grade(grade_str)
 
     def _parse_grade_str(self, grade_str):
         # type: (str) -> Optional[Fraction]
-        # pylint: disable = no-self-use
-        return parse_fraction(
-            grade_str,
-            full_points=self.assignment._weight,
-            grade_scale=DEFAULT_GRADE_SCALE,
-        )[0]
+        return self.assignment.grade_scale.parse(grade_str, full_points=self.assignment._weight)[0]
 
     def __str__(self):
         # type: () -> str
@@ -449,26 +1130,137 @@ class AssignmentGrade(NamedNode):
         # type: () -> None
         self._has_grade = False
         self._percent_grade = None
-        self._weight_grade_cache = {}
+        self._minimum_grade = None
+        self._partial_grade = None
+        self._maximum_grade = None
+
+    def _structure_changed(self):
+        # type: () -> None
+        """Rebuild the children's grades for the policy when next needed."""
+        self._policy_grades = None
 
     def _propagate(self):
         # type: () -> None
         """Propagate information to ancestors."""
+        COUNTERS['propagate_calls'] += 1
+        self._recompute()
+        if self.parent is not None:
+            self.parent._propagate()
+
+    def _refresh(self):
+        # type: () -> None
+        """Recompute this grade and all its descendants, without propagating to ancestors."""
+        for child in self._children:
+            child._refresh()
+        self._recompute()
+
+    @staticmethod
+    def _propagate_all(assignment_grades):
+        # type: (Iterable[AssignmentGrade]) -> None
+        """Recompute many changed grades and their ancestors, each only once."""
+        # pylint: disable = protected-access
+        stale = set() # type: Set[AssignmentGrade]
+        for assignment_grade in assignment_grades:
+            while assignment_grade is not None and assignment_grade not in stale:
+                stale.add(assignment_grade)
+                assignment_grade = assignment_grade._parent
+        # deepest first, so children are always recomputed before their parents
+        for assignment_grade in sorted(stale, key=lambda node: node._depth, reverse=True):
+            assignment_grade._recompute()
+
+    def _recompute(self):
+        # type: () -> None
+        """Recompute this grade, assuming its children are up to date."""
         self._clear_cache()
         if self.is_leaf:
             self._percent_grade = self._parse_grade_str(self._grade_str)
             self._has_grade = self._percent_grade is not None
         else:
             self._has_grade = any(child.has_grade for child in self.children)
-        if self.parent is not None:
-            self.parent._propagate()
+        self._update_stats()
+        self._update_policy_entry()
+
+    def _ensure_policy_grades(self):
+        # type: () -> PolicyGrades
+        """Get the children's grades for the policy, building them if necessary."""
+        # pylint: disable = protected-access
+        if self._policy_grades is None:
+            policy_grades = PolicyGrades(
+                self.assignment.policy,
+                {child.name: child.percent_weight for child in self._children},
+                {child.name: child.extra_credit for child in self._children},
+            )
+            for child in self._children:
+                policy_grades.update(child.name, child._projections())
+            self._policy_grades = policy_grades
+        return self._policy_grades
+
+    def _projections(self):
+        # type: () -> Tuple[Fraction, Optional[Fraction], Fraction]
+        """Get the minimum, partial (None if ungraded), and maximum grades."""
+        return (self.minimum_grade, self.partial_grade if self.has_grade else None, self.maximum_grade)
+
+    def _update_policy_entry(self):
+        # type: () -> None
+        """Update the parent's PolicyGrades with the change in this grade."""
+        parent = self._parent
+        if parent is not None and parent._policy_grades is not None: # pylint: disable = protected-access
+            parent._policy_grades.update(self.name, self._projections()) # pylint: disable = protected-access
+
+    def _withdraw(self):
+        # type: () -> None
+        """Remove this grade and its descendants from the assignment statistics."""
+        for assignment_grade in self.traversal:
+            if assignment_grade._stats_grade is not None:
+                assignment_grade.assignment.stats.replace(assignment_grade._stats_grade, None)
+                assignment_grade.assignment.ranking.replace(assignment_grade.alias, assignment_grade._stats_grade, None)
+                assignment_grade._stats_grade = None
+
+    def _update_stats(self):
+        # type: () -> None
+        """Update the assignment statistics with the change in this grade."""
+        if self.has_grade:
+            grade = self.partial_grade
+        else:
+            grade = None
+        if grade != self._stats_grade:
+            self.assignment.stats.replace(self._stats_grade, grade)
+            self.assignment.ranking.replace(self.alias, self._stats_grade, grade)
+            self._stats_grade = grade
+
+    @property
+    def rank(self):
+        # type: () -> Optional[int]
+        """Get the rank of this grade in the class, or None if ungraded."""
+        if self._stats_grade is None:
+            return None
+        return self.assignment.ranking.rank(self._stats_grade)
+
+    @property
+    def percentile(self):
+        # type: () -> Optional[Fraction]
+        """Get the percentile rank of this grade in the class, or None if ungraded."""
+        if self._stats_grade is None:
+            return None
+        return self.assignment.ranking.percentile(self._stats_grade)
 
     def _weighted_grade(self, default_grade=None):
         # type: (Optional[Real]) -> Fraction
-        if default_grade in self._weight_grade_cache:
-            return self._weight_grade_cache[default_grade]
-        result = None
-        if not self.is_leaf:
+        if default_grade is None:
+            result = self._partial_grade
+        elif default_grade == 0:
+            result = self._minimum_grade
+        elif default_grade == 1:
+            result = self._maximum_grade
+        else:
+            result = None
+        if result is not None:
+            COUNTERS['weighted_grade_cache_hits'] += 1
+            return result
+        COUNTERS['weighted_grade_cache_misses'] += 1
+        if not self.is_leaf and self.assignment.policy is not None:
+            result = self._ensure_policy_grades().grade(default_grade)
+        elif not self.is_leaf:
             total_grade = Fraction(0)
             total_weight = Fraction(0)
             for child in self.children:
@@ -488,7 +1280,12 @@ class AssignmentGrade(NamedNode):
             result = Fraction(0)
         else:
             result = default_grade
-        self._weight_grade_cache[default_grade] = result
+        if default_grade is None:
+            self._partial_grade = result
+        elif default_grade == 0:
+            self._minimum_grade = result
+        elif default_grade == 1:
+            self._maximum_grade = result
         return result
 
     @property
@@ -549,23 +1346,42 @@ class AssignmentGrade(NamedNode):
         else:
             return self.COLOR_SCALE[self.partial_grade]
 
+    @classmethod
+    def as_colors(cls, assignment_grades):
+        # type: (Iterable[AssignmentGrade]) -> List[str]
+        """Map the partial grades of many AssignmentGrades onto the color scale."""
+        return cls.COLOR_SCALE.colors(
+            assignment_grade.partial_grade if assignment_grade.has_grade else None
+            for assignment_grade in assignment_grades
+        )
+
     def set_grade(self, grade_str):
         # type: (str) -> None
         """Set a new grade."""
-        grade_str = grade_str.strip()
-        if self._grade_str == grade_str:
+        grade_str = intern(grade_str.strip())
+        if self._grade_str is grade_str:
             return
-        self._grade_str = grade_str
+        if not self.is_leaf:
+            self._grade_str = grade_str
+        else:
+            # parse before changing anything, so an invalid grade leaves the cell as it was
+            percent_grade = self._parse_grade_str(grade_str)
+            self._grade_str = grade_str
+            # a different string for the same value (eg. "9" and "9.0") does not change anything else
+            if percent_grade == self._percent_grade and self._has_grade == (percent_grade is not None):
+                return
         self._propagate()
 
-    @staticmethod
-    def letter_grade(fraction):
+    @property
+    def is_letter_grade(self):
+        # type: () -> bool
+        """Return whether this grade was entered as a letter."""
+        return LETTER_REGEX.fullmatch(self._grade_str.lstrip('+-')) is not None
+
+    def letter_grade(self, fraction):
         # type: (Fraction) -> str
         """Get the letter grade associated with the percentage."""
-        for letter, boundary in DEFAULT_GRADE_SCALE.items():
-            if fraction < boundary:
-                return letter
-        return 'A'
+        return self.assignment.grade_scale.letter(fraction)
 
 
 class Student:
@@ -592,6 +1408,268 @@ class Student:
         return self._alias
 
 
+class StudentIndex(MutableMapping):
+    """The students of a GradeBook, by alias, with search and cached sort orders.
+
+    Grade orders come from the AssignmentRanking of each assignment, which is
+    updated for a single student whenever that student's grade changes.
+    """
+
+    def __init__(self):
+        # type: () -> None
+        """Initialize the StudentIndex."""
+        self._students = {} # type: Dict[str, Student]
+        self._search_keys = {} # type: Dict[str, str]
+        self._name_keys = {} # type: Dict[str, Tuple[str, str, str]]
+        self._name_order = None # type: Optional[List[Student]]
+
+    def __getitem__(self, alias):
+        # type: (str) -> Student
+        return self._students[alias]
+
+    def __setitem__(self, alias, student):
+        # type: (str, Student) -> None
+        self._students[alias] = student
+        self._search_keys[alias] = ' '.join([
+            student.first_name, student.last_name, student.email,
+        ]).lower()
+        self._name_keys[alias] = (student.last_name.lower(), student.first_name.lower(), alias)
+        self._name_order = None
+
+    def __delitem__(self, alias):
+        # type: (str) -> None
+        del self._students[alias]
+        del self._search_keys[alias]
+        del self._name_keys[alias]
+        self._name_order = None
+
+    def __iter__(self):
+        # type: () -> Iterator[str]
+        return iter(self._students)
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._students)
+
+    def add(self, student):
+        # type: (Student) -> None
+        """Add a student under their alias."""
+        self[student.alias] = student
+
+    def search(self, query):
+        # type: (str) -> List[Student]
+        """Get the students whose name or email contains every word of the query."""
+        words = query.lower().split()
+        return [
+            self._students[alias] for alias, search_key in self._search_keys.items()
+            if all(word in search_key for word in words)
+        ]
+
+    def by_name(self, descending=False):
+        # type: (bool) -> List[Student]
+        """Get the students ordered by last name, then first name."""
+        if self._name_order is None:
+            self._name_order = [
+                self._students[alias]
+                for alias in sorted(self._name_keys, key=self._name_keys.__getitem__)
+            ]
+        if descending:
+            return self._name_order[::-1]
+        else:
+            return list(self._name_order)
+
+    def by_grade(self, assignment, descending=True):
+        # type: (Assignment, bool) -> List[Student]
+        """Get the students ordered by their grade on an assignment.
+
+        Students without a grade are listed last, in their original order.
+        """
+        aliases = assignment.ranking.aliases(descending=descending)
+        ranked = set(aliases)
+        return [
+            *(self._students[alias] for alias in aliases),
+            *(student for alias, student in self._students.items() if alias not in ranked),
+        ]
+
+
+Change = List
+
+# headings of the student column of a score sheet, in order of preference
+IMPORT_STUDENT_HEADINGS = ('email', 'email address', 'alias', 'username', 'login', 'sis login id', 'student')
+
+
+class GradeHistory:
+    """A tree of versions of a GradeBook, each stored as a delta from its parent.
+
+    Every committed change creates a new version that records only what
+    changed (a cell, or one assignment subtree), so a snapshot shares all
+    unchanged state with its parent and costs O(change) memory. Undoing moves
+    to the parent version; a new change after an undo starts a new branch,
+    and named checkpoints can point to any version on any branch.
+
+    Changes are JSON-serializable lists:
+        ['grade', alias, qualified_name, old_grade_str, new_grade_str]
+        ['add', qualified_name, weight_str]
+        ['remove', qualified_name, index, headings, {alias: grade_strs}]
+        ['move_up', qualified_name] and ['move_down', qualified_name]
+        ['import', [[alias, qualified_name, old_grade_str, new_grade_str], ...]]
+    """
+
+    def __init__(self):
+        # type: () -> None
+        """Initialize the GradeHistory."""
+        self.parents = {0: None} # type: Dict[int, Optional[int]]
+        self.changes = {} # type: Dict[int, Change]
+        self.checkpoints = {} # type: Dict[str, int]
+        self.current = 0
+        self.saved = 0
+        self._next_version = 1
+        self._redo_stack = [] # type: List[int]
+
+    @property
+    def can_undo(self):
+        # type: () -> bool
+        """Return whether there is a change to undo."""
+        return self.parents[self.current] is not None
+
+    @property
+    def can_redo(self):
+        # type: () -> bool
+        """Return whether there is an undone change to redo."""
+        return bool(self._redo_stack)
+
+    def commit(self, change):
+        # type: (Change) -> int
+        """Record a change as a new version and return it.
+
+        Consecutive edits of the same cell are merged into a single version,
+        unless that version is saved, checkpointed, or has been branched from.
+        """
+        if self._can_merge(change):
+            version = self.current
+            previous = self.changes[version]
+            if previous[3] == change[4]:
+                # the edits cancel out
+                self.current = self.parents.pop(version)
+                del self.changes[version]
+            else:
+                self.changes[version] = [*previous[:4], change[4]]
+            return self.current
+        version = self._next_version
+        self._next_version += 1
+        self.parents[version] = self.current
+        self.changes[version] = change
+        self.current = version
+        self._redo_stack.clear()
+        return version
+
+    def _can_merge(self, change):
+        # type: (Change) -> bool
+        """Check if a grade change can be merged into the current version."""
+        # the newest version has no children, so nothing branches from it
+        if self.current != self._next_version - 1 or self.current == self.saved:
+            return False
+        previous = self.changes.get(self.current)
+        return (
+            change[0] == 'grade'
+            and previous is not None
+            and previous[:3] == change[:3]
+            and self.current not in self.checkpoints.values()
+        )
+
+    def undo(self):
+        # type: () -> Optional[Change]
+        """Move to the parent version and return the change to revert."""
+        if not self.can_undo:
+            return None
+        change = self.changes[self.current]
+        self._redo_stack.append(self.current)
+        self.current = self.parents[self.current]
+        return change
+
+    def redo(self):
+        # type: () -> Optional[Change]
+        """Move back to the last undone version and return the change to reapply."""
+        if not self.can_redo:
+            return None
+        self.current = self._redo_stack.pop()
+        return self.changes[self.current]
+
+    def checkpoint(self, name):
+        # type: (str) -> None
+        """Name the current version."""
+        self.checkpoints[name] = self.current
+
+    def _lineage(self, version):
+        # type: (int) -> List[int]
+        """Get the version and its ancestors, from the version up."""
+        lineage = []
+        while version is not None:
+            lineage.append(version)
+            version = self.parents[version]
+        return lineage
+
+    def move_to(self, version):
+        # type: (int) -> Tuple[List[Change], List[Change]]
+        """Move to another version.
+
+        Returns:
+            Tuple[List[Change], List[Change]]: The changes to revert, in
+                order, then the changes to reapply, in order.
+        """
+        source = self._lineage(self.current)
+        target = self._lineage(version)
+        common = set(source) & set(target)
+        reverts = [self.changes[ancestor] for ancestor in source if ancestor not in common]
+        reapplies = [self.changes[ancestor] for ancestor in reversed(target) if ancestor not in common]
+        self.current = version
+        self._redo_stack.clear()
+        return reverts, reapplies
+
+    def to_dict(self, file_hash):
+        # type: (str) -> Dict[str, object]
+        """Get the history as a JSON-serializable dictionary.
+
+        Only versions leading to the current version, the saved version, a
+        checkpoint, or an undone change are kept; abandoned branches are dropped.
+        """
+        keep = set() # type: Set[int]
+        for version in (self.current, self.saved, *self.checkpoints.values(), *self._redo_stack):
+            keep.update(self._lineage(version))
+        return {
+            'file_hash': file_hash,
+            'saved': self.saved,
+            'current': self.current,
+            'redo': self._redo_stack,
+            'checkpoints': self.checkpoints,
+            'versions': [
+                [version, self.parents[version], self.changes[version]]
+                for version in sorted(keep) if version != 0
+            ],
+        }
+
+    @staticmethod
+    def from_dict(data):
+        # type: (Dict[str, object]) -> GradeHistory
+        """Create a GradeHistory from the output of to_dict().
+
+        The current version is the saved version, since that is what the file
+        holds; undone changes can only be redone if that was also the current
+        version when the history was written.
+        """
+        history = GradeHistory()
+        for version, parent, change in data['versions']:
+            history.parents[version] = parent
+            history.changes[version] = change
+        history.checkpoints = dict(data['checkpoints'])
+        history.saved = data['saved']
+        history.current = history.saved
+        if data.get('current') == history.saved:
+            history._redo_stack = list(data.get('redo', []))
+        history._next_version = max(history.parents) + 1
+        return history
+
+
 class GradeBook:
     """A collection of assignment grades for students."""
 
@@ -599,41 +1677,144 @@ class GradeBook:
         # type: (Path) -> None
         """Initialize the GradeBook."""
         self.csv_path = csv_path.expanduser().resolve()
+        self.grade_scale = GradeScale()
         self.assignments = None # type: Optional[Assignment]
-        self.students = {} # type: Dict[str, Student]
+        self.students = StudentIndex()
         self.grades = {} # type: Dict[str, AssignmentGrade]
+        # what the file looked like when it was last read or written
+        self._file_stat = None # type: Optional[Tuple[int, int]]
+        self._header_hash = b''
+        self._row_hashes = {} # type: Dict[str, bytes]
+        # what differs from the file because of changes made since then
+        self._unsaved_aliases = set() # type: Set[str]
+        self._unsaved_structure = False
+        self.history = GradeHistory()
         self._read_csv()
+        self.read_history()
 
     def _read_csv(self):
         # type: () -> None
+        with METRICS.timer('load_seconds'):
+            header_lines, rows = self._read_lines()
+            self._load(header_lines, rows)
+
+    def _read_lines(self):
+        # type: () -> Tuple[List[str], List[str]]
+        """Read the file as normalized header lines and student rows."""
+        self._file_stat = self._stat_file()
         with self.csv_path.open() as fd:
-            headings = re.sub('  +', '\t', fd.readline().strip())
-            self.assignments = self._create_assignments(headings.split('\t')[1:])
-            for line in fd.readlines():
-                line = re.sub('  +', '\t', line.strip())
+            lines = [re.sub('  +', '\t', line.strip()) for line in fd]
+        lines = [line for line in lines if line]
+        num_header_lines = 2 if lines[0].startswith('Scale\t') else 1
+        return lines[:num_header_lines], lines[num_header_lines:]
+
+    def _stat_file(self):
+        # type: () -> Tuple[int, int]
+        stat = self.csv_path.stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _hash_line(line):
+        # type: (str) -> bytes
+        return hashlib.blake2b(line.encode('utf-8'), digest_size=16).digest()
+
+    def _load(self, header_lines, rows):
+        # type: (List[str], List[str]) -> None
+        """Build the GradeBook from scratch."""
+        if len(header_lines) == 2:
+            self.grade_scale = GradeScale.from_string(header_lines[0])
+        else:
+            self.grade_scale = GradeScale()
+        headings = header_lines[-1]
+        self.assignments = Assignment.from_strings(headings.split('\t')[1:], grade_scale=self.grade_scale)
+        self.students = StudentIndex()
+        self.grades = {}
+        self._header_hash = self._hash_line('\n'.join(header_lines))
+        self._row_hashes = {}
+        self._unsaved_aliases = set()
+        self._unsaved_structure = False
+        self.history = GradeHistory()
+        for line in rows:
+            student_str, *grade_strs = line.split('\t')
+            student = self._create_student(student_str)
+            self.students.add(student)
+            self.grades[student.alias] = self._create_grades(student.alias, self.assignments, grade_strs)
+            self._row_hashes[student.alias] = self._hash_line(line)
+
+    def reload(self):
+        # type: () -> None
+        """Reload the file, re-parsing only what changed.
+
+        Unsaved changes are discarded. If the header changed, or assignments
+        were changed since the file was read, the GradeBook is rebuilt.
+        Otherwise, only rows whose content changed or that have unsaved
+        changes are parsed, and their changed leaf grades are all recomputed
+        together with their ancestors, as when importing, so other students
+        keep their cached grades.
+
+        If the file itself did not change, the history is kept and moves back
+        to the saved version.
+        """
+        with METRICS.timer('reload_seconds'):
+            header_lines, rows = self._read_lines()
+            history = self.history
+            if self._unsaved_structure or self._hash_line('\n'.join(header_lines)) != self._header_hash:
+                header_hash, row_hashes = self._header_hash, self._row_hashes
+                self._load(header_lines, rows)
+                if (self._header_hash, self._row_hashes) == (header_hash, row_hashes):
+                    self.history = history
+                    self.history.move_to(self.history.saved)
+                return
+            students = StudentIndex()
+            grades = {} # type: Dict[str, AssignmentGrade]
+            row_hashes = {} # type: Dict[str, bytes]
+            changed = [] # type: List[AssignmentGrade]
+            for line in rows:
                 student_str, *grade_strs = line.split('\t')
+                line_hash = self._hash_line(line)
                 student = self._create_student(student_str)
-                self.students[student.alias] = student
-                self.grades[student.alias] = self._create_grades(self.assignments, grade_strs)
-
-    def _create_assignments(self, headings):
-        # type: (List[str]) -> Assignment
-        # pylint: disable = no-self-use
-        heading_regex = r'(?P<indent>(__)*)(?P<name>[^*]*)(?P<extra_credit>\*?) \((?P<weight_str>[^)]*)\)'
-        stack = [] # type: List[Assignment]
-        for heading in headings:
-            match = re.fullmatch(heading_regex, heading)
-            assert match is not None
-            depth = len(match.group('indent')) // 2
-            name = match.group('name')
-            extra_credit = bool(match.group('extra_credit'))
-            weight_str = match.group('weight_str')
-            stack = stack[:depth]
-            assignment = Assignment(name, weight_str, extra_credit=extra_credit)
-            if len(stack) > 0:
-                stack[-1].add_child(assignment)
-            stack.append(assignment)
-        return stack[0]
+                alias = student.alias
+                if alias not in self.grades:
+                    grades[alias] = self._create_grades(alias, self.assignments, grade_strs)
+                else:
+                    grades[alias] = self.grades[alias]
+                    if line_hash != self._row_hashes.get(alias) or alias in self._unsaved_aliases:
+                        # pylint: disable = protected-access
+                        for assignment_grade, grade_str in zip(grades[alias].traversal, grade_strs):
+                            if assignment_grade.is_leaf and assignment_grade._grade_str != grade_str:
+                                assignment_grade._grade_str = intern(grade_str)
+                                changed.append(assignment_grade)
+                    if str(student) == str(self.students[alias]):
+                        student = self.students[alias]
+                students.add(student)
+                row_hashes[alias] = line_hash
+            AssignmentGrade._propagate_all(changed) # pylint: disable = protected-access
+            for alias, assignment_grade_root in self.grades.items():
+                if alias not in grades:
+                    assignment_grade_root._withdraw() # pylint: disable = protected-access
+            if list(students) == list(self.students):
+                # keep the cached orders of the existing index
+                for alias, student in students.items():
+                    if student is not self.students[alias]:
+                        self.students[alias] = student
+            else:
+                self.students = students
+            if row_hashes != self._row_hashes:
+                # the recorded changes no longer apply to what is in memory
+                self.history = GradeHistory()
+            elif self._unsaved_aliases:
+                self.history.move_to(self.history.saved)
+            self._unsaved_aliases = set()
+            self.grades = grades
+            self._row_hashes = row_hashes
+
+    def reload_if_changed(self):
+        # type: () -> bool
+        """Reload the file if it changed since it was last read or written."""
+        if self._stat_file() == self._file_stat:
+            return False
+        self.reload()
+        return True
 
     def _create_student(self, student_str):
         # type: (str) -> Student
@@ -642,32 +1823,142 @@ class GradeBook:
         match = re.fullmatch(student_regex, student_str)
         return Student(match.group('first_name'), match.group('last_name'), match.group('email'))
 
-    def _create_grades(self, assignments, grade_strs):
-        # type: (Assignment, List[str]) -> AssignmentGrade
+    def _create_grades(self, alias, assignments, grade_strs):
+        # type: (str, Assignment, List[str]) -> AssignmentGrade
         # pylint: disable = no-self-use
         stack = [] # type: List[AssignmentGrade]
         for assignment, grade_str in zip(assignments.traversal, grade_strs):
-            stack = stack[:assignment.depth]
-            assignment_grade = AssignmentGrade(assignment, grade_str)
+            stack = stack[:assignment.depth - assignments.depth]
+            assignment_grade = AssignmentGrade(assignment, grade_str, alias)
             if len(stack) > 0:
-                stack[-1].add_child(assignment_grade)
+                stack[-1].add_child(assignment_grade, propagate=False)
             stack.append(assignment_grade)
+        stack[0]._refresh() # pylint: disable = protected-access
         return stack[0]
 
+    @property
+    def history_path(self):
+        # type: () -> Path
+        """Get the path of the file that holds the history and checkpoints."""
+        return self.csv_path.with_name(self.csv_path.name + '.history')
+
+    @staticmethod
+    def hash_file(path):
+        # type: (Path) -> str
+        """Get the hash that identifies the contents of a grades file in its history."""
+        with path.open('rb') as fd:
+            return hashlib.blake2b(fd.read(), digest_size=16).hexdigest()
+
+    def read_history(self):
+        # type: () -> None
+        """Restore the history, if it was written for the file as it is now."""
+        if not self.history_path.exists():
+            return
+        with self.history_path.open() as fd:
+            data = json.load(fd)
+        if data['file_hash'] == self.hash_file(self.csv_path):
+            self.history = GradeHistory.from_dict(data)
+
+    def write_history(self, file_hash=None):
+        # type: (Optional[str]) -> None
+        """Write the history and checkpoints as deltas from the saved file.
+
+        The hash of the saved file is computed if it is not given.
+        """
+        if file_hash is None:
+            file_hash = self.hash_file(self.csv_path)
+        with replace_atomically(self.history_path) as fd:
+            json.dump(self.history.to_dict(file_hash), fd, separators=(',', ':'))
+
+    def _apply(self, change, forward=True):
+        # type: (Change, bool) -> None
+        """Apply or revert a change without recording it."""
+        kind, qualified_name = change[0], change[1]
+        if kind == 'grade':
+            _, alias, qualified_name, old_grade_str, new_grade_str = change
+            self.grades[alias][qualified_name].set_grade(new_grade_str if forward else old_grade_str)
+            self._unsaved_aliases.add(alias)
+        elif kind == 'import':
+            self._set_grades(
+                (alias, qualified_name, new_grade_str if forward else old_grade_str)
+                for alias, qualified_name, old_grade_str, new_grade_str in change[1]
+            )
+        elif kind == 'add':
+            if forward:
+                self._add_assignment(qualified_name, change[2])
+            else:
+                self._remove_assignment(qualified_name)
+        elif kind == 'remove':
+            if forward:
+                self._remove_assignment(qualified_name)
+            else:
+                self._restore_assignment(*change[1:])
+        elif (kind == 'move_up') == forward:
+            self._move_assignment_up(qualified_name)
+        else:
+            self._move_assignment_down(qualified_name)
+
+    def undo(self):
+        # type: () -> bool
+        """Revert the last change, if any."""
+        change = self.history.undo()
+        if change is None:
+            return False
+        self._apply(change, forward=False)
+        return True
+
+    def redo(self):
+        # type: () -> bool
+        """Reapply the last undone change, if any."""
+        change = self.history.redo()
+        if change is None:
+            return False
+        self._apply(change)
+        return True
+
+    def checkpoint(self, name):
+        # type: (str) -> None
+        """Name the current state so it can be restored later."""
+        self.history.checkpoint(name)
+        self.write_history()
+
+    def restore_checkpoint(self, name):
+        # type: (str) -> None
+        """Return to a named state, reverting and reapplying only the changes in between."""
+        reverts, reapplies = self.history.move_to(self.history.checkpoints[name])
+        for change in reverts:
+            self._apply(change, forward=False)
+        for change in reapplies:
+            self._apply(change)
+
     def add_assignment(self, qualified_name, weight_str):
         # type: (str, str) -> None
         """Add an assignment to the GradeBook."""
-        assignment = Assignment(qualified_name.split('__')[-1], weight_str)
+        self._add_assignment(qualified_name, weight_str)
+        self.history.commit(['add', qualified_name, weight_str])
+
+    def _add_assignment(self, qualified_name, weight_str):
+        # type: (str, str) -> None
+        self._unsaved_structure = True
+        weight_str, policy = GradePolicy.split(weight_str)
+        assignment = Assignment(qualified_name.split('__')[-1], weight_str, grade_scale=self.grade_scale, policy=policy)
         self.assignments.add_descendant(qualified_name, assignment)
-        for assignment_grade_root in self.grades.values():
+        for alias, assignment_grade_root in self.grades.items():
             assignment_grade_root.add_descendant(
                 qualified_name,
-                AssignmentGrade(assignment, 'None'),
+                AssignmentGrade(assignment, 'None', alias),
             )
 
     def move_assignment_up(self, qualified_name):
         # type: (str) -> None
         """Swap the assignment with its closest elder sibling."""
+        if self.assignments[qualified_name].index > 0:
+            self._move_assignment_up(qualified_name)
+            self.history.commit(['move_up', qualified_name])
+
+    def _move_assignment_up(self, qualified_name):
+        # type: (str) -> None
+        self._unsaved_structure = True
         self.assignments.move_node_up(qualified_name)
         for assignment_grade_root in self.grades.values():
             assignment_grade_root.move_node_up(qualified_name)
@@ -675,6 +1966,14 @@ class GradeBook:
     def move_assignment_down(self, qualified_name):
         # type: (str) -> None
         """Swap the assignment with its closest younger sibling."""
+        assignment = self.assignments[qualified_name]
+        if assignment.index < assignment.parent.num_children - 1:
+            self._move_assignment_down(qualified_name)
+            self.history.commit(['move_down', qualified_name])
+
+    def _move_assignment_down(self, qualified_name):
+        # type: (str) -> None
+        self._unsaved_structure = True
         self.assignments.move_node_down(qualified_name)
         for assignment_grade_root in self.grades.values():
             assignment_grade_root.move_node_down(qualified_name)
@@ -682,10 +1981,41 @@ class GradeBook:
     def remove_assignment(self, qualified_name):
         # type: (str) -> None
         """Remove the assignment."""
+        assignment = self.assignments[qualified_name]
+        # pylint: disable = protected-access
+        change = [
+            'remove',
+            qualified_name,
+            assignment.index,
+            [heading[2 * assignment.depth:] for heading in assignment.to_headings()],
+            {
+                alias: [assignment_grade._grade_str for assignment_grade in assignment_grade_root[qualified_name].traversal]
+                for alias, assignment_grade_root in self.grades.items()
+            },
+        ]
+        self._remove_assignment(qualified_name)
+        self.history.commit(change)
+
+    def _remove_assignment(self, qualified_name):
+        # type: (str) -> None
+        self._unsaved_structure = True
         self.assignments.remove_node(qualified_name)
         for assignment_grade_root in self.grades.values():
             assignment_grade_root.remove_node(qualified_name)
 
+    def _restore_assignment(self, qualified_name, index, headings, grade_strs):
+        # type: (str, int, List[str], Dict[str, List[str]]) -> None
+        """Put a removed assignment subtree back where it was."""
+        self._unsaved_structure = True
+        parent_name = qualified_name.rsplit('__', 1)[0]
+        assignment = Assignment.from_strings(headings, grade_scale=self.grade_scale)
+        self.assignments[parent_name].add_child(assignment, index=index)
+        for alias, assignment_grade_root in self.grades.items():
+            assignment_grades = self._create_grades(
+                alias, assignment, grade_strs.get(alias, ['None'] * len(headings)),
+            )
+            assignment_grade_root[parent_name].add_child(assignment_grades, index=index)
+
     def get_grade(self, alias, qualified_name):
         # type: (str, str) -> AssignmentGrade
         """Get the grade for the student and assignment."""
@@ -694,28 +2024,601 @@ class GradeBook:
     def set_grade(self, alias, qualified_name, grade_str):
         # type: (str, str, str) -> None
         """Set the grade for the student and assignment."""
-        self.grades[alias][qualified_name].set_grade(grade_str)
+        assignment_grade = self.grades[alias][qualified_name]
+        old_grade_str = assignment_grade._grade_str # pylint: disable = protected-access
+        assignment_grade.set_grade(grade_str)
+        new_grade_str = assignment_grade._grade_str # pylint: disable = protected-access
+        if new_grade_str != old_grade_str:
+            self._unsaved_aliases.add(alias)
+            self.history.commit(['grade', alias, qualified_name, old_grade_str, new_grade_str])
+
+    def _set_grades(self, cells):
+        # type: (Iterable[Tuple[str, str, str]]) -> None
+        """Set many leaf grades, then recompute each affected grade once."""
+        changed = []
+        for alias, qualified_name, grade_str in cells:
+            assignment_grade = self.grades[alias][qualified_name]
+            assignment_grade._grade_str = intern(grade_str) # pylint: disable = protected-access
+            changed.append(assignment_grade)
+            self._unsaved_aliases.add(alias)
+        AssignmentGrade._propagate_all(changed) # pylint: disable = protected-access
+
+    def _match_students(self):
+        # type: () -> Dict[str, str]
+        """Map the lowercase aliases, emails, and names of students to their aliases."""
+        keys = {} # type: Dict[str, str]
+        for alias, student in self.students.items():
+            keys[str(student).lower()] = alias
+            keys[student.email.lower()] = alias
+            keys[alias.lower()] = alias
+        return keys
+
+    @staticmethod
+    def _match_column(heading, leaves):
+        # type: (str, Mapping[str, Assignment]) -> Optional[Assignment]
+        """Find the leaf assignment that a score sheet column is for.
+
+        A heading matches an assignment if it is the qualified name, or the end
+        of only one qualified name (eg. "HW1__Code" or "Code").
+        """
+        if heading in leaves:
+            return leaves[heading]
+        matches = [
+            assignment for qualified_name, assignment in leaves.items()
+            if qualified_name.endswith('__' + heading)
+        ]
+        if len(matches) == 1:
+            return matches[0]
+        return None
+
+    def preview_import(self, text, columns=None, student_column=None):
+        # type: (str, Optional[Mapping[str, str]], Optional[str]) -> Dict[str, object]
+        """Compare a score sheet against the GradeBook without changing anything.
+
+        The score sheet is CSV or TSV text with a header row. Each row is for
+        the student whose alias, email, or "Last, First <email>" is in the
+        student column; other columns are matched to leaf assignments, either
+        by heading (see _match_column()) or explicitly.
+
+        Parameters:
+            text (str): The score sheet.
+            columns (Mapping[str, str]): Headings to import, mapped to the
+                qualified names of their assignments. If omitted, every
+                heading that matches an assignment is imported.
+            student_column (str): The heading of the student column. If
+                omitted, the first of IMPORT_STUDENT_HEADINGS is used, or
+                otherwise the first column.
+
+        Returns:
+            Dict[str, object]: A report of the import, with keys:
+                columns: the imported headings and their qualified names
+                unmatched_columns: the headings that were not imported
+                unmatched_rows: the student column of rows with no student
+                invalid: [student, heading, value, error] for unparseable cells
+                changes: [alias, qualified_name, old, new] for each change
+                unchanged: the number of cells that already had the grade
+        """
+        # pylint: disable = too-many-locals, protected-access
+        lines = text.lstrip('\ufeff').splitlines()
+        if not lines:
+            raise ValueError('empty score sheet')
+        reader = csv.reader(lines, delimiter=('\t' if '\t' in lines[0] else ','))
+        headings = [heading.strip() for heading in next(reader)]
+        if student_column is None:
+            lowercase_headings = [heading.lower() for heading in headings]
+            student_index = next(
+                (
+                    lowercase_headings.index(heading) for heading in IMPORT_STUDENT_HEADINGS
+                    if heading in lowercase_headings
+                ),
+                0,
+            )
+        elif student_column in headings:
+            student_index = headings.index(student_column)
+        else:
+            raise ValueError(f'no student column: {student_column}')
+        # match columns to leaf assignments
+        leaves = {
+            assignment.qualified_name: assignment
+            for assignment in self.assignments.preorder if assignment.is_leaf
+        }
+        report_columns = {} # type: Dict[str, str]
+        column_indices = [] # type: List[Tuple[int, str]]
+        unmatched_columns = []
+        for index, heading in enumerate(headings):
+            if index == student_index:
+                continue
+            if columns is None:
+                assignment = self._match_column(heading, leaves)
+            else:
+                assignment = leaves.get(columns.get(heading))
+            if assignment is None:
+                unmatched_columns.append(heading)
+            else:
+                report_columns[heading] = assignment.qualified_name
+                column_indices.append((index, assignment.qualified_name))
+        # match rows to students and compare their grades
+        student_keys = self._match_students()
+        new_grade_strs = {} # type: Dict[Tuple[str, str], str]
+        unmatched_rows = []
+        invalid = []
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            key = row[student_index].strip() if student_index < len(row) else ''
+            alias = student_keys.get(key.lower())
+            if alias is None:
+                unmatched_rows.append(key)
+                continue
+            assignment_grade_root = self.grades[alias]
+            for index, qualified_name in column_indices:
+                grade_str = row[index].strip() if index < len(row) else ''
+                if not grade_str:
+                    continue
+                try:
+                    assignment_grade_root[qualified_name]._parse_grade_str(grade_str)
+                except (KeyError, ValueError) as err:
+                    invalid.append([key, headings[index], grade_str, str(err)])
+                    continue
+                # later rows for the same student take precedence
+                new_grade_strs[(alias, qualified_name)] = grade_str
+        changes = []
+        unchanged = 0
+        for (alias, qualified_name), grade_str in new_grade_strs.items():
+            old_grade_str = self.grades[alias][qualified_name]._grade_str
+            if grade_str == old_grade_str:
+                unchanged += 1
+            else:
+                changes.append([alias, qualified_name, old_grade_str, grade_str])
+        return {
+            'columns': report_columns,
+            'unmatched_columns': unmatched_columns,
+            'unmatched_rows': unmatched_rows,
+            'invalid': invalid,
+            'changes': changes,
+            'unchanged': unchanged,
+        }
+
+    def import_grades(self, text, columns=None, student_column=None):
+        # type: (str, Optional[Mapping[str, str]], Optional[str]) -> Dict[str, object]
+        """Set the grades in a score sheet, as a single change.
+
+        Invalid cells and unmatched rows and columns are skipped. Instead of
+        propagating every cell, each changed grade and each of its ancestors is
+        recomputed once. See preview_import() for the parameters and report.
+        """
+        report = self.preview_import(text, columns=columns, student_column=student_column)
+        changes = report['changes']
+        if changes:
+            self._set_grades((alias, qualified_name, new_grade_str) for alias, qualified_name, _, new_grade_str in changes)
+            self.history.commit(['import', changes])
+        return report
+
+    def set_grade_scale(self, boundaries):
+        # type: (Mapping[str, str]) -> None
+        """Change the grade scale and re-letter the class.
+
+        The boundaries are written as in the scale line of the file (eg.
+        "93.33%"), from the lowest letter to the highest. Only students with
+        grades entered as letters are recomputed, each in a single bottom-up
+        pass.
+
+        Raises:
+            ValueError: If a boundary is invalid, out of order, or outside 0%
+                to 100%, or if a letter that is entered as a grade is missing
+                from the new scale. Nothing is changed if so.
+        """
+        fractions = {}
+        previous = None
+        for letter, boundary in boundaries.items():
+            fraction, fraction_type = parse_fraction(boundary)
+            if fraction is None or fraction_type == 'letter':
+                raise ValueError(f'invalid grade scale boundary for {letter}: {boundary}')
+            if not 0 <= fraction <= 1:
+                raise ValueError(f'grade scale boundary for {letter} is not between 0% and 100%: {boundary}')
+            if previous is not None and fraction <= previous:
+                raise ValueError(f'grade scale boundary for {letter} is not above the one before it: {boundary}')
+            fractions[letter] = fraction
+            previous = fraction
+        # pylint: disable = protected-access
+        lettered_roots = []
+        for assignment_grade_root in self.grades.values():
+            letters = set()
+            for assignment_grade in assignment_grade_root.traversal:
+                if assignment_grade.is_leaf and assignment_grade.is_letter_grade:
+                    letters.update(assignment_grade._grade_str.lstrip('+-').split('/'))
+            missing = letters - fractions.keys()
+            if missing:
+                raise ValueError(f'grade scale is missing letters entered as grades: {", ".join(sorted(missing))}')
+            if letters:
+                lettered_roots.append(assignment_grade_root)
+        self.grade_scale.set_boundaries(fractions)
+        self._unsaved_structure = True
+        for assignment_grade_root in lettered_roots:
+            assignment_grade_root._refresh()
+
+    def sorted_students(self, qualified_name, descending=True):
+        # type: (str, bool) -> List[Student]
+        """Get the students ordered by their grade on an assignment.
+
+        Students without a grade are listed last, in their original order.
+        """
+        return self.students.by_grade(self.assignments[qualified_name], descending=descending)
 
     def write_csv(self, filename=None):
         # type: (Optional[str]) -> None
-        """Export the GradeBook to a csv file."""
+        """Export the GradeBook to a csv file.
+
+        When saving to its own file, the hashes of the header, the rows, and
+        the whole file are computed as the lines are written, instead of
+        reading the file back.
+        """
         if filename is None:
             outpath = self.csv_path
         else:
             outpath = self.csv_path.parent.joinpath(filename)
-        with outpath.open('w') as fd:
-            fd.write('\t'.join([
-                'Student',
-                *(assignment.to_heading() for assignment in self.assignments.traversal),
-            ]))
-            fd.write('\n')
-            for alias, assignment_grade_root in self.grades.items():
-                student = self.students[alias]
-                fd.write('\t'.join([
-                    f'{student.last_name}, {student.first_name} <{student.email}>',
-                    *(assignment_grade.export_str for assignment_grade in assignment_grade_root.traversal)
-                ]))
-                fd.write('\n')
+        if outpath != self.csv_path:
+            with METRICS.timer('save_seconds'):
+                self.export(outpath)
+            return
+        header_lines = [] # type: List[str]
+        row_hashes = {} # type: Dict[str, bytes]
+        file_hash = hashlib.blake2b(digest_size=16)
+        with METRICS.timer('save_seconds'), replace_atomically(outpath) as fd:
+            for line in export_lines(self):
+                fd.write(line)
+                file_hash.update(line.encode(fd.encoding))
+                # normalize the line as _read_lines() does
+                line = re.sub('  +', '\t', line.strip())
+                if not line:
+                    continue
+                if not header_lines or (len(header_lines) == 1 and header_lines[0].startswith('Scale\t')):
+                    header_lines.append(line)
+                else:
+                    row_hashes[self._create_student(line.split('\t', 1)[0]).alias] = self._hash_line(line)
+        self._file_stat = self._stat_file()
+        self._header_hash = self._hash_line('\n'.join(header_lines))
+        self._row_hashes = row_hashes
+        self._unsaved_aliases = set()
+        self._unsaved_structure = False
+        self.history.saved = self.history.current
+        self.write_history(file_hash.hexdigest())
+
+    def export(self, outpath, export_format='native', columns='all'):
+        # type: (Path, str, str) -> None
+        """Stream the GradeBook to a file in one of the EXPORT_FORMATS."""
+        with replace_atomically(outpath) as fd:
+            for line in export_lines(self, export_format=export_format, columns=columns):
+                fd.write(line)
+
+
+@contextmanager
+def replace_atomically(path):
+    # type: (Path) -> Generator[IO[str], None, None]
+    """Write to a temporary file that replaces the path only once it is complete.
+
+    An interrupted write leaves the original file untouched.
+    """
+    with NamedTemporaryFile('w', dir=path.parent, prefix=f'.{path.name}.', delete=False, newline='') as fd:
+        temp_path = Path(fd.name)
+        try:
+            if path.exists():
+                os.chmod(temp_path, path.stat().st_mode)
+            yield fd
+        except BaseException:
+            fd.close()
+            temp_path.unlink()
+            raise
+    os.replace(temp_path, path)
+
+
+def select_columns(assignments, columns='all'):
+    # type: (Assignment, str) -> List[Assignment]
+    """Select the assignments to export.
+
+    Parameters:
+        assignments (Assignment): The root of the assignments.
+        columns (str): One of "all", "leaves", "categories", or "final"
+            (the course grade, which is exported with its letter).
+
+    Returns:
+        List[Assignment]: The selected assignments, in preorder.
+    """
+    if columns == 'all':
+        return list(assignments.traversal)
+    elif columns == 'leaves':
+        return [assignment for assignment in assignments.traversal if assignment.is_leaf]
+    elif columns == 'categories':
+        return [assignment for assignment in assignments.traversal if not assignment.is_leaf]
+    elif columns == 'final':
+        return [assignments]
+    else:
+        raise ValueError(f'invalid column selection: {columns}')
+
+
+def iter_student_grades(gradebook, assignments):
+    # type: (GradeBook, List[Assignment]) -> Generator[Tuple[Student, List[AssignmentGrade]], None, None]
+    """Yield each student with their grades for the given assignments.
+
+    Each student's tree is walked exactly once, and only one row is held at a time.
+    """
+    selected = set(id(assignment) for assignment in assignments)
+    for alias, assignment_grade_root in gradebook.grades.items():
+        yield gradebook.students[alias], [
+            assignment_grade for assignment_grade in assignment_grade_root.traversal
+            if id(assignment_grade.assignment) in selected
+        ]
+
+
+class ExportFormat:
+    """A writer that turns exported rows into lines of text."""
+
+    extension = 'txt'
+    mimetype = 'text/plain'
+    # the column selections the format can export
+    column_selections = ('all', 'leaves', 'categories', 'final')
+
+    def header(self, gradebook, assignments):
+        # type: (GradeBook, List[Assignment]) -> Generator[str, None, None]
+        """Yield the lines before the first row."""
+        # pylint: disable = no-self-use, unused-argument
+        yield from ()
+
+    def row(self, student, assignment_grades):
+        # type: (Student, List[AssignmentGrade]) -> str
+        """Format the line for a student."""
+        raise NotImplementedError()
+
+
+class NativeFormat(ExportFormat):
+    """The tab-separated format that GradeBook reads."""
+
+    extension = 'csv'
+    mimetype = 'text/tab-separated-values'
+    # only the whole tree can be read back, and there is no place for letters
+    column_selections = ('all',)
+
+    def header(self, gradebook, assignments):
+        # type: (GradeBook, List[Assignment]) -> Generator[str, None, None]
+        if gradebook.grade_scale != GradeScale():
+            yield str(gradebook.grade_scale) + '\n'
+        yield '\t'.join(['Student', *(assignment.to_heading() for assignment in assignments)]) + '\n'
+
+    def row(self, student, assignment_grades):
+        # type: (Student, List[AssignmentGrade]) -> str
+        return '\t'.join([
+            str(student),
+            *(assignment_grade.export_str for assignment_grade in assignment_grades),
+        ]) + '\n'
+
+
+class LMSFormat(ExportFormat):
+    """A comma-separated upload file of percentages, for learning management systems.
+
+    The course column is followed by the letter grade.
+    """
+
+    extension = 'csv'
+    mimetype = 'text/csv'
+
+    def _csv_line(self, cells):
+        # type: (List[object]) -> str
+        # pylint: disable = no-self-use
+        buffer = StringIO()
+        csv.writer(buffer).writerow(cells)
+        return buffer.getvalue()
+
+    def header(self, gradebook, assignments):
+        # type: (GradeBook, List[Assignment]) -> Generator[str, None, None]
+        cells = ['Last Name', 'First Name', 'Email', 'Alias']
+        for assignment in assignments:
+            cells.append(' > '.join(assignment.qualified_name.split('__')))
+            if assignment.parent is None:
+                cells.append(f'{assignment.name} Letter')
+        yield self._csv_line(cells)
+
+    def row(self, student, assignment_grades):
+        # type: (Student, List[AssignmentGrade]) -> str
+        cells = [student.last_name, student.first_name, student.email, student.alias]
+        for assignment_grade in assignment_grades:
+            if assignment_grade.has_grade:
+                cells.append(f'{100 * float(assignment_grade.partial_grade):.2f}')
+            else:
+                cells.append('')
+            if assignment_grade.parent is None:
+                cells.append(assignment_grade.letter_grade(assignment_grade.partial_grade))
+        return self._csv_line(cells)
+
+
+class JSONLinesFormat(ExportFormat):
+    """One JSON object per student, with the projections of each grade."""
+
+    extension = 'jsonl'
+    mimetype = 'application/x-ndjson'
+
+    def row(self, student, assignment_grades):
+        # type: (Student, List[AssignmentGrade]) -> str
+        grades = {}
+        for assignment_grade in assignment_grades:
+            grades[assignment_grade.assignment.qualified_name] = {
+                'grade': assignment_grade.display_str,
+                'minimum': float(assignment_grade.minimum_grade),
+                'partial': float(assignment_grade.partial_grade),
+                'maximum': float(assignment_grade.maximum_grade),
+                'letter': assignment_grade.letter_grade(assignment_grade.partial_grade),
+            }
+        return json.dumps({
+            'student': str(student),
+            'alias': student.alias,
+            'email': student.email,
+            'grades': grades,
+        }) + '\n'
+
+
+class SummaryFormat(ExportFormat):
+    """A tab-separated summary of each student's partial grade and letter."""
+
+    extension = 'tsv'
+    mimetype = 'text/tab-separated-values'
+
+    def header(self, gradebook, assignments):
+        # type: (GradeBook, List[Assignment]) -> Generator[str, None, None]
+        yield '\t'.join([
+            'Student',
+            *(
+                f'{assignment.qualified_name} {suffix}'
+                for assignment in assignments for suffix in ('(%)', '(Letter)')
+            ),
+        ]) + '\n'
+
+    def row(self, student, assignment_grades):
+        # type: (Student, List[AssignmentGrade]) -> str
+        cells = [str(student)]
+        for assignment_grade in assignment_grades:
+            partial_grade = assignment_grade.partial_grade
+            cells.append(f'{float(partial_grade):.2%}')
+            cells.append(assignment_grade.letter_grade(partial_grade))
+        return '\t'.join(cells) + '\n'
+
+
+EXPORT_FORMATS = {
+    'native': NativeFormat,
+    'lms': LMSFormat,
+    'jsonl': JSONLinesFormat,
+    'summary': SummaryFormat,
+}
+
+
+def check_export(export_format, columns):
+    # type: (str, str) -> None
+    """Raise a ValueError if the format cannot export the column selection."""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'invalid export format: {export_format}')
+    if columns not in EXPORT_FORMATS[export_format].column_selections:
+        raise ValueError(
+            f'the {export_format} format cannot export {columns!r} columns; use one of: '
+            + ', '.join(
+                name for name, export_class in EXPORT_FORMATS.items()
+                if columns in export_class.column_selections
+            )
+        )
+
+
+def export_lines(gradebook, export_format='native', columns='all'):
+    # type: (GradeBook, str, str) -> Generator[str, None, None]
+    """Yield the lines of an export of the GradeBook.
+
+    Parameters:
+        gradebook (GradeBook): The GradeBook to export.
+        export_format (str): One of the keys of EXPORT_FORMATS.
+        columns (str): The columns to include; see select_columns().
+
+    Yields:
+        str: The lines of the export, including line endings.
+    """
+    check_export(export_format, columns)
+    writer = EXPORT_FORMATS[export_format]()
+    assignments = select_columns(gradebook.assignments, columns)
+    yield from writer.header(gradebook, assignments)
+    for student, assignment_grades in iter_student_grades(gradebook, assignments):
+        yield writer.row(student, assignment_grades)
+
+
+# fields of the data API, and how to compute each one; a field is only
+# computed if it is selected, so eg. unselected projections stay uncomputed
+STUDENT_FIELDS = {
+    'alias': lambda student: student.alias,
+    'name': str,
+    'first_name': lambda student: student.first_name,
+    'last_name': lambda student: student.last_name,
+    'email': lambda student: student.email,
+} # type: Dict[str, Callable[[Student], object]]
+
+ASSIGNMENT_FIELDS = {
+    'qualified_name': lambda assignment: assignment.qualified_name,
+    'parent': lambda assignment: None if assignment.parent is None else assignment.parent.qualified_name,
+    'is_leaf': lambda assignment: assignment.is_leaf,
+    'weight': lambda assignment: assignment.weight_display,
+    'percent_weight': lambda assignment: float(assignment.percent_weight),
+    'full_points': lambda assignment: float(assignment.full_points),
+    'extra_credit': lambda assignment: assignment.extra_credit,
+    'policy': lambda assignment: None if assignment.policy is None else str(assignment.policy),
+    'stats': lambda assignment: assignment.stats.to_dict(),
+} # type: Dict[str, Callable[[Assignment], object]]
+
+GRADE_FIELDS = {
+    'grade': lambda assignment_grade: assignment_grade.display_str,
+    'has_grade': lambda assignment_grade: assignment_grade.has_grade,
+    'minimum': lambda assignment_grade: float(assignment_grade.minimum_grade),
+    'partial': lambda assignment_grade: float(assignment_grade.partial_grade),
+    'maximum': lambda assignment_grade: float(assignment_grade.maximum_grade),
+    'letter': lambda assignment_grade: assignment_grade.letter_grade(assignment_grade.partial_grade),
+    'rank': lambda assignment_grade: assignment_grade.rank,
+    'percentile': lambda assignment_grade: (
+        None if assignment_grade.percentile is None else float(assignment_grade.percentile)
+    ),
+    'color': lambda assignment_grade: assignment_grade.as_color,
+} # type: Dict[str, Callable[[AssignmentGrade], object]]
+
+DEFAULT_STUDENT_FIELDS = ('alias', 'name', 'email')
+DEFAULT_ASSIGNMENT_FIELDS = ('qualified_name', 'parent', 'weight', 'percent_weight', 'extra_credit', 'policy')
+DEFAULT_GRADE_FIELDS = ('minimum', 'partial', 'maximum', 'letter')
+
+
+def select_fields(field_str, available, default):
+    # type: (Optional[str], Mapping[str, Callable], Tuple[str, ...]) -> List[str]
+    """Parse a comma-separated selection of fields, or use the default if there is none."""
+    if not field_str:
+        return list(default)
+    fields = [field.strip() for field in field_str.split(',') if field.strip()]
+    for field in fields:
+        if field not in available:
+            raise ValueError(f'invalid field: {field}')
+    return fields
+
+
+def student_records(students, fields=DEFAULT_STUDENT_FIELDS):
+    # type: (Iterable[Student], Iterable[str]) -> Generator[Dict[str, object], None, None]
+    """Yield a JSON-serializable dictionary of the selected fields of each student."""
+    getters = [(field, STUDENT_FIELDS[field]) for field in fields]
+    for student in students:
+        yield {field: getter(student) for field, getter in getters}
+
+
+def assignment_records(assignments, fields=DEFAULT_ASSIGNMENT_FIELDS):
+    # type: (Iterable[Assignment], Iterable[str]) -> Generator[Dict[str, object], None, None]
+    """Yield a JSON-serializable dictionary of the selected fields of each assignment."""
+    getters = [(field, ASSIGNMENT_FIELDS[field]) for field in fields]
+    for assignment in assignments:
+        yield {field: getter(assignment) for field, getter in getters}
+
+
+def grade_records(gradebook, subtree, students, fields=DEFAULT_GRADE_FIELDS):
+    # type: (GradeBook, Assignment, Iterable[Student], Iterable[str]) -> Generator[Dict[str, object], None, None]
+    """Yield the selected fields of each student's grades for an assignment subtree.
+
+    Parameters:
+        gradebook (GradeBook): The GradeBook.
+        subtree (Assignment): The root of the assignments to include.
+        students (Iterable[Student]): The students to include.
+        fields (Iterable[str]): Keys of GRADE_FIELDS.
+
+    Yields:
+        Dict[str, object]: The alias of a student, and their grades as a
+            dictionary from qualified names to the selected fields.
+    """
+    getters = [(field, GRADE_FIELDS[field]) for field in fields]
+    qualified_name = subtree.qualified_name
+    qualified_names = [assignment.qualified_name for assignment in subtree.subtree]
+    for student in students:
+        assignment_grades = gradebook.grades[student.alias][qualified_name].traversal
+        yield {
+            'alias': student.alias,
+            'grades': {
+                name: {field: getter(assignment_grade) for field, getter in getters}
+                for name, assignment_grade in zip(qualified_names, assignment_grades)
+            },
+        }
 
 
 def test():
@@ -739,10 +2642,85 @@ def test():
     gradebook.write_csv()
 
 
+REPORT_COLUMNS = ['course', 'student', 'alias', 'minimum', 'partial', 'maximum', 'letter', 'gpa']
+
+
+def course_report(csv_path, projection='partial'):
+    # type: (Path, str) -> List[Dict[str, object]]
+    """Compute the overall grade of every student in a course.
+
+    Parameters:
+        csv_path (Path): The gradebook file.
+        projection (str): The projection to assign letters and GPAs by; one of
+            "minimum", "partial", or "maximum".
+
+    Returns:
+        List[Dict[str, object]]: One row per student, with REPORT_COLUMNS as keys.
+            Letters come from the grade scale of the GradeBook; GPAs are None
+            unless the scale uses the standard letters.
+    """
+    gradebook = GradeBook(csv_path)
+    course = gradebook.assignments.name
+    rows = []
+    for alias, assignment_grade_root in gradebook.grades.items():
+        rows.append({
+            'course': course,
+            'student': str(gradebook.students[alias]),
+            'alias': alias,
+            'minimum': assignment_grade_root.minimum_grade,
+            'partial': assignment_grade_root.partial_grade,
+            'maximum': assignment_grade_root.maximum_grade,
+        })
+    grade_scale = gradebook.grade_scale
+    letters = grade_scale.letters(row[projection] for row in rows)
+    if [letter for letter, _ in grade_scale.items()] == LETTERS:
+        _, gpas = from_fractions(
+            (min(max(row[projection], Fraction(0)), Fraction(1)) for row in rows),
+            boundaries=grade_scale.lower_bounds,
+        )
+    else:
+        # GPAs are only defined for the standard letters
+        gpas = [None] * len(rows)
+    for row, letter, gpa in zip(rows, letters, gpas):
+        row['letter'] = letter
+        row['gpa'] = None if gpa is None else float(gpa)
+        for key in ('minimum', 'partial', 'maximum'):
+            row[key] = float(row[key])
+    return rows
+
+
 def main():
     # type: () -> None
-    """Initialize a GradeBook csv file."""
-    raise NotImplementedError() # FIXME
+    """Report the grades in one or more GradeBook files."""
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument('grades_files', type=Path, nargs='+', help='The grades CSV files.')
+    arg_parser.add_argument('--format', choices=['tsv', 'json'], default='tsv', help='The output format.')
+    arg_parser.add_argument(
+        '--projection', choices=['minimum', 'partial', 'maximum'], default='partial',
+        help='The projection to assign letters and GPAs by.',
+    )
+    arg_parser.add_argument('--jobs', type=int, default=None, help='The number of courses to process in parallel.')
+    args = arg_parser.parse_args()
+    if len(args.grades_files) == 1 or args.jobs == 1:
+        reports = [course_report(path, args.projection) for path in args.grades_files]
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            reports = list(executor.map(
+                course_report,
+                args.grades_files,
+                [args.projection] * len(args.grades_files),
+            ))
+    rows = [row for report in reports for row in report]
+    if args.format == 'json':
+        json.dump(rows, sys.stdout, indent=4)
+        sys.stdout.write('\n')
+    else:
+        sys.stdout.write('\t'.join(REPORT_COLUMNS) + '\n')
+        for row in rows:
+            sys.stdout.write('\t'.join(
+                f'{row[column]:.4f}' if isinstance(row[column], float) else str(row[column])
+                for column in REPORT_COLUMNS
+            ) + '\n')
 
 
 if __name__ == '__main__':
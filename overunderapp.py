@@ -2,15 +2,34 @@
 """A gradebook webapp."""
 
 import atexit
+import gzip
+import hashlib
 import json
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import zlib
 from argparse import ArgumentParser
 from datetime import datetime
 from pathlib import Path
-
-from overunder import GradeBook, parse_fraction
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Dict, Generator, Iterable, Optional, Tuple, List, Union
+
+from metrics import METRICS, Metrics
+from snapshots import GradeBookWriter, SnapshotReader, SnapshotStore, WriterClient, WriterError
+from overunder import (
+    EXPORT_FORMATS, ASSIGNMENT_FIELDS, DEFAULT_ASSIGNMENT_FIELDS, DEFAULT_GRADE_FIELDS, DEFAULT_STUDENT_FIELDS,
+    GRADE_FIELDS, STUDENT_FIELDS, Assignment, AssignmentGrade, Student, GradeBook,
+    assignment_records, check_export, export_lines, grade_records, select_columns, select_fields,
+    student_records,
+)
 
 try:
-    from flask import Flask, render_template, abort, request, send_from_directory, url_for, redirect
+    from flask import Flask, render_template, abort, request, url_for, redirect, g, stream_with_context
+    from werkzeug.serving import make_server
 except (ModuleNotFoundError, ImportError) as err:
 
     def run_with_venv(venv):
@@ -39,6 +58,235 @@ except (ModuleNotFoundError, ImportError) as err:
 
 APP = Flask(__name__)
 
+# the number of characters to buffer before flushing a streamed page
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# responses of these types are gzipped, if they are large enough to benefit
+COMPRESSIBLE_MIMETYPES = {'text/html', 'application/json', 'application/x-ndjson', 'text/css', 'text/javascript'}
+MIN_COMPRESS_SIZE = 512
+COMPRESS_LEVEL = 6
+
+# static files by path, as (modification time, contents, content hash)
+STATIC_FILES = {} # type: Dict[Path, Tuple[int, bytes, str]]
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+
+# with several processes, how often each shares its metrics, in seconds
+METRICS_SHARE_INTERVAL = 5.0
+
+
+@APP.before_request
+def start_timer():
+    # type: () -> None
+    """Record when the request started."""
+    g.start_time = perf_counter()
+
+
+@APP.before_request
+def refresh_gradebook():
+    # type: () -> None
+    """Bring the GradeBook up to date with the latest snapshot or, if watching, the file."""
+    if 'snapshots' in APP.config:
+        APP.config['gradebook'] = APP.config['snapshots'].sync()
+    elif APP.config.get('watch'):
+        APP.config['gradebook'].reload_if_changed()
+
+
+@APP.after_request
+def record_latency(response):
+    # type: (Response) -> Response
+    """Record the latency of the request by route."""
+    if request.url_rule is not None and 'start_time' in g:
+        METRICS.observe(
+            'request_seconds',
+            perf_counter() - g.start_time,
+            labels={'route': request.url_rule.rule, 'method': request.method},
+        )
+    return response
+
+
+@APP.teardown_request
+def share_metrics(_):
+    # type: (Optional[BaseException]) -> None
+    """Share the metrics of this process with the others, if there are several.
+
+    The metrics are only written out every METRICS_SHARE_INTERVAL seconds;
+    /metrics shares the metrics of the process that serves it right away.
+    """
+    if 'snapshots' not in APP.config:
+        return
+    last_shared = APP.config.get('metrics_shared')
+    if last_shared is None or perf_counter() - last_shared >= METRICS_SHARE_INTERVAL:
+        APP.config['snapshots'].store.write_metrics(str(os.getpid()), METRICS.snapshot())
+        APP.config['metrics_shared'] = perf_counter()
+
+
+@APP.after_request
+def compress(response):
+    # type: (Response) -> Response
+    """Gzip HTML, JSON, CSS, and JavaScript responses if the client accepts it.
+
+    Streamed responses are compressed chunk by chunk, with each chunk flushed
+    so that the browser can still render the page as it arrives. Since the
+    gzipped and identity bodies share an ETag, the ETag is made weak.
+    """
+    if response.direct_passthrough or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+    if response.is_streamed:
+        response.response = gzip_chunks(response.response)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return response
+        response.set_data(gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def gzip_chunks(chunks):
+    # type: (Iterable[Union[str, bytes]]) -> Generator[bytes, None, None]
+    """Gzip a stream, flushing after every chunk."""
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def join_chunks(pieces):
+    # type: (Iterable[str]) -> Generator[str, None, None]
+    """Join small pieces of a streamed response into chunks of about STREAM_CHUNK_SIZE."""
+    chunk = [] # type: List[str]
+    size = 0
+    for piece in pieces:
+        chunk.append(piece)
+        size += len(piece)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def stream_template(template_name, **context):
+    # type: (str, **Any) -> Response
+    """Render a template as it is sent, instead of building the whole page first.
+
+    Jinja yields each piece of the template as it is evaluated; these are
+    joined into chunks so that the headers go out right away and the rows
+    follow as they are computed, with only one chunk held in memory.
+    """
+    APP.update_template_context(context)
+    template = APP.jinja_env.get_template(template_name)
+    return APP.response_class(stream_with_context(join_chunks(template.generate(context))), mimetype='text/html')
+
+
+def client_schema(gradebook):
+    # type: (GradeBook) -> Dict[str, Any]
+    """Describe the assignments and scales so the browser can recompute grades.
+
+    Assignments are listed in preorder as [qualified name, parent index,
+    percent weight, full points, extra credit, policy], where the policy is
+    null or [drop lowest, keep highest, capped].
+    """
+    preorder = gradebook.assignments.preorder
+    positions = {id(assignment): i for i, assignment in enumerate(preorder)}
+    return {
+        'assignments': [
+            [
+                assignment.qualified_name,
+                None if assignment.parent is None else positions[id(assignment.parent)],
+                float(assignment.percent_weight),
+                float(assignment.full_points),
+                assignment.extra_credit,
+                None if assignment.policy is None else [
+                    assignment.policy.drop_lowest, assignment.policy.keep_highest, assignment.policy.capped,
+                ],
+            ]
+            for assignment in preorder
+        ],
+        'grade_scale': [[letter, float(boundary)] for letter, boundary in gradebook.grade_scale.items()],
+        'color_scale': AssignmentGrade.COLOR_SCALE.to_dict(),
+    }
+
+
+def filter_assignments(gradebook, assignment_filter):
+    # type: (GradeBook, str) -> List[Assignment]
+    """Get the assignments that match the filter."""
+    if assignment_filter == 'all':
+        return list(gradebook.assignments.preorder)
+    try:
+        return gradebook.assignments[assignment_filter].subtree
+    except (KeyError, AssertionError):
+        return abort(404)
+
+
+def filter_students(gradebook, student_filter):
+    # type: (GradeBook, str) -> List[Student]
+    """Get the students that match the filter."""
+    if student_filter == 'all':
+        students = list(gradebook.students.values())
+    elif student_filter in gradebook.students:
+        students = [gradebook.students[student_filter]]
+    else:
+        students = []
+    query = request.args.get('q')
+    if query:
+        matches = set(student.alias for student in gradebook.students.search(query))
+        students = [student for student in students if student.alias in matches]
+    return students
+
+
+def get_sort_order():
+    # type: () -> Tuple[Optional[str], bool]
+    """Get what to sort students by ("name" or an assignment), and whether to sort descending."""
+    sort = request.args.get('sort')
+    order = request.args.get('order')
+    if order is None:
+        # names read best A to Z, grades best to worst
+        return sort, sort != 'name'
+    return sort, order != 'asc'
+
+
+def sort_students(gradebook, students, sort, descending=True):
+    # type: (GradeBook, List[Student], str, bool) -> List[Student]
+    """Order the students by name or by their grade on an assignment."""
+    if sort == 'name':
+        ordered = gradebook.students.by_name(descending=descending)
+    else:
+        try:
+            ordered = gradebook.sorted_students(sort, descending=descending)
+        except (KeyError, AssertionError):
+            return students
+    if len(students) == len(gradebook.students):
+        return ordered
+    aliases = set(student.alias for student in students)
+    return [student for student in ordered if student.alias in aliases]
+
+
+@APP.template_global()
+def grade_cells(gradebook, students, assignments):
+    # type: (GradeBook, List[Student], List[Assignment]) -> List[Tuple[AssignmentGrade, str]]
+    """Get the grades of a row of the grid, each with its color.
+
+    The colors of the whole row are looked up at once, with AssignmentGrade.as_colors().
+    """
+    grades = [
+        gradebook.get_grade(student.alias, assignment.qualified_name)
+        for student in students for assignment in assignments
+    ]
+    return list(zip(grades, AssignmentGrade.as_colors(grades)))
+
 
 @APP.route('/')
 def root():
@@ -52,20 +300,11 @@ def view_students_assignments(student_filter, assignment_filter):
     # type: (str, str) -> Response
     """Respond to a Flask route."""
     gradebook = APP.config['gradebook']
-    if assignment_filter == 'all':
-        assignments = list(gradebook.assignments.traversal)
-    else:
-        assignments = list(
-            assignment for assignment in gradebook.assignments.traversal
-            if assignment.qualified_name.startswith(assignment_filter)
-        )
-    if student_filter == 'all':
-        students = list(gradebook.students.values())
-    else:
-        students = list(
-            student for student in gradebook.students.values()
-            if student.alias == student_filter
-        )
+    assignments = filter_assignments(gradebook, assignment_filter)
+    students = filter_students(gradebook, student_filter)
+    sort, descending = get_sort_order()
+    if sort is not None:
+        students = sort_students(gradebook, students, sort, descending)
     context = {
         'student_filter': student_filter,
         'assignment_filter': assignment_filter,
@@ -73,8 +312,11 @@ def view_students_assignments(student_filter, assignment_filter):
         'min_depth': assignments[0].depth,
         'assignments': assignments,
         'students': students,
+        'sort': sort,
+        'descending': descending,
+        'schema': client_schema(gradebook),
     }
-    return render_template('students-assignments.html', **context)
+    return stream_template('students-assignments.html', **context)
 
 
 @APP.route('/assignments-students/<assignment_filter>/<student_filter>/')
@@ -82,20 +324,11 @@ def view_assignments_students(assignment_filter, student_filter):
     # type: (str, str) -> Response
     """Respond to a Flask route."""
     gradebook = APP.config['gradebook']
-    if assignment_filter == 'all':
-        assignments = list(gradebook.assignments.traversal)
-    else:
-        assignments = list(
-            assignment for assignment in gradebook.assignments.traversal
-            if assignment.qualified_name.startswith(assignment_filter)
-        )
-    if student_filter == 'all':
-        students = list(gradebook.students.values())
-    else:
-        students = list(
-            student for student in gradebook.students.values()
-            if student.alias == student_filter
-        )
+    assignments = filter_assignments(gradebook, assignment_filter)
+    students = filter_students(gradebook, student_filter)
+    sort, descending = get_sort_order()
+    if sort is not None:
+        students = sort_students(gradebook, students, sort, descending)
     context = {
         'assignment_filter': assignment_filter,
         'student_filter': student_filter,
@@ -103,15 +336,145 @@ def view_assignments_students(assignment_filter, student_filter):
         'min_depth': assignments[0].depth,
         'assignments': assignments,
         'students': students,
+        'sort': sort,
+        'descending': descending,
+        'schema': client_schema(gradebook),
     }
-    return render_template('assignments-students.html', **context)
+    return stream_template('assignments-students.html', **context)
+
+
+@APP.route('/stats/<assignment_filter>/')
+def view_stats(assignment_filter):
+    # type: (str) -> Response
+    """Respond to a Flask route."""
+    gradebook = APP.config['gradebook']
+    assignments = filter_assignments(gradebook, assignment_filter)
+    context = {
+        'assignment_filter': assignment_filter,
+        'min_depth': assignments[0].depth,
+        'assignments': assignments,
+        'num_students': len(gradebook.students),
+    }
+    return render_template('stats.html', **context)
+
+
+@APP.route('/stats-json/<assignment_filter>/')
+def stats_json(assignment_filter):
+    # type: (str) -> Response
+    """Respond to a Flask route."""
+    gradebook = APP.config['gradebook']
+    result = {}
+    for assignment in filter_assignments(gradebook, assignment_filter):
+        stats = assignment.stats.to_dict()
+        if stats['count']:
+            stats['median'] = float(assignment.ranking.median)
+        result[assignment.qualified_name] = stats
+    return json.dumps(result)
+
+
+def data_response(records):
+    # type: (Iterable[Dict[str, Any]]) -> Response
+    """Respond with records as a JSON array, or streamed as NDJSON if requested.
+
+    NDJSON is sent if the format argument is "ndjson" or the client prefers it.
+    JSON responses carry an ETag, so that unchanged data can be polled cheaply.
+    """
+    best_mimetype = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    if request.args.get('format', 'ndjson' if best_mimetype == 'application/x-ndjson' else 'json') == 'ndjson':
+        return APP.response_class(
+            stream_with_context(join_chunks(json.dumps(record) + '\n' for record in records)),
+            mimetype='application/x-ndjson',
+        )
+    response = APP.response_class(json.dumps(list(records)), mimetype='application/json')
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def get_fields(available, default):
+    # type: (Dict[str, Any], Tuple[str, ...]) -> List[str]
+    """Get the fields selected by the fields argument."""
+    try:
+        return select_fields(request.args.get('fields'), available, default)
+    except ValueError:
+        return abort(400)
+
+
+@APP.route('/api/students/<student_filter>/')
+def api_students(student_filter):
+    # type: (str) -> Response
+    """List the students."""
+    gradebook = APP.config['gradebook']
+    fields = get_fields(STUDENT_FIELDS, DEFAULT_STUDENT_FIELDS)
+    return data_response(student_records(filter_students(gradebook, student_filter), fields))
+
+
+@APP.route('/api/schema/<assignment_filter>/')
+def api_schema(assignment_filter):
+    # type: (str) -> Response
+    """List the assignments of a subtree, in preorder."""
+    gradebook = APP.config['gradebook']
+    fields = get_fields(ASSIGNMENT_FIELDS, DEFAULT_ASSIGNMENT_FIELDS)
+    return data_response(assignment_records(filter_assignments(gradebook, assignment_filter), fields))
+
+
+@APP.route('/api/grades/<assignment_filter>/<student_filter>/')
+def api_grades(assignment_filter, student_filter):
+    # type: (str, str) -> Response
+    """List the grades of each student for the assignments of a subtree."""
+    gradebook = APP.config['gradebook']
+    fields = get_fields(GRADE_FIELDS, DEFAULT_GRADE_FIELDS)
+    subtree = filter_assignments(gradebook, assignment_filter)[0]
+    students = filter_students(gradebook, student_filter)
+    return data_response(grade_records(gradebook, subtree, students, fields))
+
+
+@APP.route('/metrics')
+def metrics():
+    # type: () -> Response
+    """Expose the metrics in the Prometheus text format.
+
+    With several processes, the metrics of all of them are added together.
+    """
+    if 'snapshots' not in APP.config:
+        return APP.response_class(METRICS.to_prometheus(), mimetype='text/plain; version=0.0.4')
+    store = APP.config['snapshots'].store
+    store.write_metrics(str(os.getpid()), METRICS.snapshot())
+    APP.config['metrics_shared'] = perf_counter()
+    combined = Metrics()
+    for snapshot in store.read_metrics():
+        combined.merge(snapshot)
+    return APP.response_class(combined.to_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+@APP.route('/export/<export_format>/<columns>')
+def export(export_format, columns):
+    # type: (str, str) -> Response
+    """Stream an export of the GradeBook as a download."""
+    gradebook = APP.config['gradebook']
+    if export_format not in EXPORT_FORMATS:
+        return abort(404)
+    try:
+        select_columns(gradebook.assignments, columns)
+    except ValueError:
+        return abort(404)
+    try:
+        check_export(export_format, columns)
+    except ValueError as error:
+        return abort(400, description=str(error))
+    export_class = EXPORT_FORMATS[export_format]
+    filename = f'{gradebook.csv_path.stem}-{columns}.{export_class.extension}'
+    return APP.response_class(
+        stream_with_context(export_lines(gradebook, export_format=export_format, columns=columns)),
+        mimetype=export_class.mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
 
 
 @APP.route('/save')
 def save():
     # type: () -> Response
     """Save the GradeBook to file."""
-    APP.config['gradebook'].write_csv()
+    APP.config['writer'].write_csv()
     return redirect(request.referrer)
 
 
@@ -119,7 +482,46 @@ def save():
 def reload():
     # type: () -> Response
     """Respond to a Flask route."""
-    APP.config['gradebook'] = GradeBook(APP.config['gradebook'].csv_path)
+    APP.config['writer'].reload()
+    return redirect(request.referrer)
+
+
+@APP.route('/undo')
+def undo():
+    # type: () -> Response
+    """Revert the last change."""
+    if APP.config['writer'].undo():
+        APP.config['changed'] = True
+    return redirect(request.referrer)
+
+
+@APP.route('/redo')
+def redo():
+    # type: () -> Response
+    """Reapply the last undone change."""
+    if APP.config['writer'].redo():
+        APP.config['changed'] = True
+    return redirect(request.referrer)
+
+
+@APP.route('/checkpoint', methods=['POST'])
+def checkpoint():
+    # type: () -> Response
+    """Name the current state of the GradeBook."""
+    data = json.loads(request.get_data())
+    APP.config['writer'].checkpoint(data['name'].strip())
+    return json.dumps(sorted(APP.config['gradebook'].history.checkpoints))
+
+
+@APP.route('/restore/<name>')
+def restore(name):
+    # type: (str) -> Response
+    """Return the GradeBook to a named checkpoint."""
+    gradebook = APP.config['gradebook']
+    if name not in gradebook.history.checkpoints:
+        return abort(404)
+    APP.config['writer'].restore_checkpoint(name)
+    APP.config['changed'] = True
     return redirect(request.referrer)
 
 
@@ -127,7 +529,7 @@ def reload():
 def move_up(qualified_name):
     # type: (str) -> Response
     """Respond to a Flask route."""
-    APP.config['gradebook'].move_assignment_up(qualified_name)
+    APP.config['writer'].move_assignment_up(qualified_name)
     return redirect(request.referrer)
 
 
@@ -135,7 +537,7 @@ def move_up(qualified_name):
 def move_down(qualified_name):
     # type: (str) -> Response
     """Respond to a Flask route."""
-    APP.config['gradebook'].move_assignment_down(qualified_name)
+    APP.config['writer'].move_assignment_down(qualified_name)
     return redirect(request.referrer)
 
 
@@ -144,7 +546,7 @@ def create_child():
     # type: () -> Response
     """Respond to a Flask route."""
     data = json.loads(request.get_data())
-    APP.config['gradebook'].add_assignment(data['qualified_name'].strip(), data['weight_str'].strip())
+    APP.config['writer'].add_assignment(data['qualified_name'].strip(), data['weight_str'].strip())
     return redirect(request.referrer)
 
 
@@ -152,7 +554,7 @@ def create_child():
 def delete(qualified_name):
     # type: (str) -> Response
     """Respond to a Flask route."""
-    APP.config['gradebook'].remove_assignment(qualified_name)
+    APP.config['writer'].remove_assignment(qualified_name)
     return redirect(request.referrer)
 
 
@@ -161,15 +563,18 @@ def update_score():
     # type: () -> Response
     """Respond to a Flask route."""
     data = json.loads(request.get_data())
-    grade = APP.config['gradebook'].get_grade(data['alias'], data['assignment'])
+    gradebook = APP.config['gradebook']
+    grade = gradebook.get_grade(data['alias'], data['assignment'])
     if grade.display_str == data['value']:
         return json.dumps([])
     try:
-        parse_fraction(data['value'])
+        gradebook.grade_scale.parse(data['value'])
     except ValueError:
-        return abort(500)
-    grade.set_grade(data['value'])
+        return abort(400)
+    APP.config['writer'].set_grade(data['alias'], data['assignment'], data['value'])
     APP.config['changed'] = True
+    # with several processes, catching up to the change may have reloaded the GradeBook
+    grade = APP.config['gradebook'].get_grade(data['alias'], data['assignment'])
     result = []
     while grade is not None:
         result.append({
@@ -182,43 +587,132 @@ def update_score():
     return json.dumps(result)
 
 
+@APP.route('/import', methods=['POST'])
+def import_grades():
+    # type: () -> Response
+    """Import a score sheet, or report what importing it would change.
+
+    The request is a JSON object with the score sheet as "text", and optionally
+    "columns", "student_column", and "dry_run" (which defaults to true); see
+    GradeBook.preview_import() for the report.
+    """
+    data = json.loads(request.get_data())
+    args = (data.get('text', ''), data.get('columns'), data.get('student_column'))
+    try:
+        if data.get('dry_run', True):
+            report = APP.config['gradebook'].preview_import(*args)
+        else:
+            report = APP.config['writer'].import_grades(*args)
+            if report['changes']:
+                APP.config['changed'] = True
+    except (ValueError, WriterError):
+        return abort(400)
+    return json.dumps(report)
+
+
+@APP.route('/scale', methods=['POST'])
+def set_scale():
+    # type: () -> Response
+    """Change the grade scale.
+
+    The request is a JSON object of each letter and its exclusive upper
+    boundary, from the lowest letter to the highest, eg. {"F": "60%", ...,
+    "A": "100%"}.
+    """
+    boundaries = json.loads(request.get_data())
+    if not isinstance(boundaries, dict) or not all(isinstance(value, str) for value in boundaries.values()):
+        return abort(400)
+    try:
+        APP.config['writer'].set_grade_scale(boundaries)
+    except (ValueError, WriterError) as error:
+        return abort(400, description=str(error))
+    APP.config['changed'] = True
+    return APP.response_class(status=204)
+
+
+def read_static(kind, filename):
+    # type: (str, str) -> Optional[Tuple[bytes, str]]
+    """Get the contents and content hash of a static file, re-reading it only if it changed."""
+    file_dir = APP.config['root_directory'].joinpath('static', kind)
+    file_path = file_dir.joinpath(filename)
+    if file_path.parent != file_dir or not file_path.is_file():
+        return None
+    mtime = file_path.stat().st_mtime_ns
+    cached = STATIC_FILES.get(file_path)
+    if cached is None or cached[0] != mtime:
+        contents = file_path.read_bytes()
+        cached = (mtime, contents, hashlib.blake2b(contents, digest_size=8).hexdigest())
+        STATIC_FILES[file_path] = cached
+    return cached[1], cached[2]
+
+
+@APP.context_processor
+def static_url_processor():
+    # type: () -> Dict[str, Any]
+    """Provide static_url() to templates."""
+
+    def static_url(kind, filename):
+        # type: (str, str) -> str
+        """Get the fingerprinted URL of a static file, which can be cached indefinitely."""
+        static_file = read_static(kind, filename)
+        if static_file is None:
+            return f'/static/{kind}/{filename}'
+        return f'/static/{kind}/{filename}?v={static_file[1]}'
+
+    return {'static_url': static_url}
+
+
+def serve_static(kind, filename, mimetype):
+    # type: (str, str, str) -> Response
+    """Serve a static file with a content hash ETag.
+
+    Fingerprinted requests (with the current hash as ?v=) are cached for a
+    year, since the URL changes with the contents; others must revalidate.
+    """
+    static_file = read_static(kind, filename)
+    if static_file is None:
+        return abort(404)
+    contents, content_hash = static_file
+    response = APP.response_class(contents, mimetype=mimetype)
+    response.set_etag(content_hash)
+    if request.args.get('v') == content_hash:
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
 @APP.route('/static/css/<filename>')
 def get_css(filename):
     # type: (str) -> Response
     """Serve CSS files."""
-    file_dir = APP.config['root_directory'].joinpath('static', 'css')
-    file_path = file_dir.joinpath(filename)
-    if file_path.exists():
-        return send_from_directory(str(file_dir), filename)
-    else:
-        return abort(404)
+    return serve_static('css', filename, 'text/css')
 
 
 @APP.route('/static/js/<filename>')
 def get_js(filename):
     # type: (str) -> Response
     """Serve JavaScript files."""
-    file_dir = APP.config['root_directory'].joinpath('static', 'js')
-    file_path = file_dir.joinpath(filename)
-    if file_path.exists():
-        return send_from_directory(str(file_dir), filename)
-    else:
-        return abort(404)
+    return serve_static('js', filename, 'text/javascript')
 
 
 def save_backup():
     # type: () -> None
-    """Save the GradeBook to a timestamped backup."""
-    gradebook = APP.config['gradebook']
-    csv_name = gradebook.csv_path.name
+    """Checkpoint the GradeBook as it was opened, under a timestamp."""
     timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    gradebook.write_csv(filename=f'{csv_name}.{timestamp}.bak')
+    APP.config['writer'].checkpoint(f'backup-{timestamp}')
 
 
-def configure_app(filepath):
-    # type: (Path) -> None
+def configure_app(filepath, watch=False):
+    # type: (Path, bool) -> None
     """Configure the app."""
     APP.config['gradebook'] = GradeBook(filepath)
+    # all changes go through the writer, which is the GradeBook itself
+    # unless pages are served by several processes (see run_workers())
+    APP.config['writer'] = APP.config['gradebook']
+    APP.config['watch'] = watch
     APP.config['root_directory'] = Path(__file__).parent.resolve()
     # The changed flag is necessary because, if Flask is run in debug
     # mode, two copies of the app will be created in separate threads.
@@ -243,18 +737,86 @@ def write_on_exit():
         APP.config['gradebook'].write_csv()
 
 
+def serve_reader(directory, csv_name, address, authkey, host, port, fd):
+    # type: (str, str, str, bytes, str, int, int) -> None
+    """Serve pages from the latest snapshot, forwarding changes to the writer."""
+    # only count what this process does; the writer reports its own metrics
+    METRICS.reset()
+    reader = SnapshotReader(SnapshotStore(Path(directory), csv_name))
+    APP.config['snapshots'] = reader
+    APP.config['gradebook'] = reader.sync()
+    APP.config['writer'] = WriterClient(address, authkey, reader)
+    make_server(host, port, APP, fd=fd).serve_forever()
+
+
+def run_workers(num_workers, host='127.0.0.1', port=5000):
+    # type: (int, str, int) -> None
+    """Serve the app from several processes, with this one as the only writer.
+
+    This process keeps the GradeBook and applies every change, publishing
+    each result as an immutable snapshot in shared memory (if available).
+    The worker processes share the listening socket and serve pages from the
+    latest snapshot, so rendering scales with the number of cores.
+    """
+    gradebook = APP.config['gradebook']
+    shared_memory = Path('/dev/shm')
+    with TemporaryDirectory(prefix='overunder-', dir=(shared_memory if shared_memory.is_dir() else None)) as directory:
+        store = SnapshotStore(Path(directory), gradebook.csv_path.name)
+        address = str(Path(directory, 'writer.sock'))
+        authkey = os.urandom(32)
+        writer = GradeBookWriter(gradebook, store, address, authkey)
+        server_socket = socket.create_server((host, port))
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(
+                target=serve_reader,
+                args=(directory, store.csv_name, address, authkey, host, port, server_socket.fileno()),
+                daemon=True,
+            )
+            for _ in range(num_workers)
+        ]
+        for worker in workers:
+            worker.start()
+        if APP.config['watch']:
+            threading.Thread(target=writer.watch_forever, daemon=True).start()
+        print(f' * Serving on http://{host}:{port}/ with {num_workers} workers')
+        # stop the same way on a termination signal as on a keyboard interrupt
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            writer.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # a second interrupt must not cut the final save short
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            for worker in workers:
+                worker.terminate()
+            writer.close()
+            store.close()
+            server_socket.close()
+            if writer.changed:
+                with writer.lock:
+                    gradebook.write_csv()
+
+
 def main():
     # type: () -> None
     """Start the app."""
     arg_parser = ArgumentParser()
     arg_parser.add_argument('grades_file', type=Path, help='The grades CSV file.')
     arg_parser.add_argument('--backup', default=False, help='Backup the grades file before launching')
+    arg_parser.add_argument('--watch', action='store_true', help='Reload the grades file when it changes on disk')
+    arg_parser.add_argument('--workers', type=int, default=1, help='The number of processes serving pages')
     args = arg_parser.parse_args()
-    configure_app(args.grades_file)
+    configure_app(args.grades_file, watch=args.watch)
     if args.backup:
         save_backup()
-    atexit.register(write_on_exit)
-    APP.run()
+    if args.workers > 1:
+        run_workers(args.workers)
+    else:
+        atexit.register(write_on_exit)
+        APP.run()
 
 
 if __name__ == '__main__':
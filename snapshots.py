@@ -0,0 +1,321 @@
+"""Share a GradeBook between one writer process and many reader processes."""
+
+import json
+import mmap
+import os
+import shutil
+import struct
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import METRICS
+from overunder import GradeBook
+
+# the latest version, then the latest full snapshot
+VERSION_FORMAT = '<QQ'
+
+# GradeBook methods that change it, which only the writer may call
+WRITE_METHODS = frozenset([
+    'set_grade', 'import_grades', 'set_grade_scale', 'add_assignment', 'move_assignment_up', 'move_assignment_down',
+    'remove_assignment', 'undo', 'redo', 'checkpoint', 'restore_checkpoint', 'write_csv', 'reload',
+])
+
+# write methods that leave the GradeBook different from its file
+UNSAVED_METHODS = WRITE_METHODS - {'checkpoint', 'write_csv', 'reload'}
+
+# write methods that readers can repeat on their own copy (see replay())
+REPLAYED_METHODS = WRITE_METHODS - {'reload'}
+
+
+class WriterError(Exception):
+    """An error raised by the writer while applying a change."""
+
+
+def replay(gradebook, method, args):
+    # type: (GradeBook, str, List[Any]) -> None
+    """Repeat a change made by the writer, without touching any files.
+
+    GradeBook changes are deterministic, so repeating the same call on an
+    identical copy leaves it identical, including its history.
+    """
+    if method == 'write_csv':
+        if not args or args[0] is None:
+            gradebook.history.saved = gradebook.history.current
+    elif method == 'checkpoint':
+        gradebook.history.checkpoint(*args)
+    else:
+        getattr(gradebook, method)(*args)
+
+
+class SnapshotStore:
+    """A directory of immutable, versioned GradeBook snapshots and deltas.
+
+    A version is either a full snapshot, which is a native grades file (and
+    its history) in its own subdirectory, or a delta, which is a single
+    GradeBook call in a small JSON file; either is written once and never
+    modified. The latest version and the latest full snapshot are kept in a
+    small memory-mapped file, so checking for a new version is a memory read
+    rather than a file system call.
+    """
+
+    KEEP_SNAPSHOTS = 4
+
+    def __init__(self, directory, csv_name):
+        # type: (Path, str) -> None
+        """Initialize the SnapshotStore."""
+        self.directory = Path(directory)
+        self.csv_name = csv_name
+        version_path = self.directory.joinpath('version')
+        size = struct.calcsize(VERSION_FORMAT)
+        if not version_path.exists():
+            version_path.write_bytes(bytes(size))
+        with version_path.open('r+b') as fd:
+            self._version_map = mmap.mmap(fd.fileno(), size)
+
+    @property
+    def version(self):
+        # type: () -> int
+        """Get the latest published version."""
+        return struct.unpack_from(VERSION_FORMAT, self._version_map)[0]
+
+    @property
+    def base_version(self):
+        # type: () -> int
+        """Get the version of the latest full snapshot."""
+        return struct.unpack_from(VERSION_FORMAT, self._version_map)[1]
+
+    def path(self, version):
+        # type: (int) -> Path
+        """Get the path of the grades file of a full snapshot."""
+        return self.directory.joinpath(str(version), self.csv_name)
+
+    def delta_path(self, version):
+        # type: (int) -> Path
+        """Get the path of a delta."""
+        return self.directory.joinpath(f'{version}.delta')
+
+    def publish(self, gradebook):
+        # type: (GradeBook) -> int
+        """Write the GradeBook as a new full snapshot and make it the latest version."""
+        version = self.version + 1
+        path = self.path(version)
+        path.parent.mkdir()
+        gradebook.export(path)
+        history = gradebook.history.to_dict(gradebook.hash_file(path))
+        # the snapshot holds the current state, so readers should treat it as saved
+        history['saved'] = history['current']
+        with path.with_name(path.name + '.history').open('w') as fd:
+            json.dump(history, fd, separators=(',', ':'))
+        struct.pack_into(VERSION_FORMAT, self._version_map, 0, version, version)
+        self._retire()
+        return version
+
+    def publish_delta(self, method, args):
+        # type: (str, Tuple[Any, ...]) -> int
+        """Write a GradeBook call as a new delta and make it the latest version."""
+        version = self.version + 1
+        path = self.delta_path(version)
+        temp_path = path.with_suffix('.tmp')
+        with temp_path.open('w') as fd:
+            json.dump([method, list(args)], fd, separators=(',', ':'))
+        # readers must never see a partial delta
+        os.replace(temp_path, path)
+        struct.pack_into(VERSION_FORMAT, self._version_map, 0, version, self.base_version)
+        return version
+
+    def read_delta(self, version):
+        # type: (int) -> Tuple[str, List[Any]]
+        """Read the GradeBook call of a delta."""
+        with self.delta_path(version).open() as fd:
+            method, args = json.load(fd)
+        return method, args
+
+    def _retire(self):
+        # type: () -> None
+        """Remove all but the last few full snapshots, and the deltas before them."""
+        snapshots = sorted(int(path.name) for path in self.directory.iterdir() if path.name.isdigit())
+        if len(snapshots) <= self.KEEP_SNAPSHOTS:
+            return
+        oldest = snapshots[-self.KEEP_SNAPSHOTS]
+        for version in snapshots[:-self.KEEP_SNAPSHOTS]:
+            shutil.rmtree(self.path(version).parent)
+        for path in self.directory.glob('*.delta'):
+            if int(path.stem) < oldest:
+                path.unlink()
+
+    def write_metrics(self, name, snapshot):
+        # type: (str, Dict[str, object]) -> None
+        """Share the metrics of one process under a name."""
+        path = self.directory.joinpath(f'metrics-{name}.json')
+        temp_path = path.with_suffix('.tmp')
+        with temp_path.open('w') as fd:
+            json.dump(snapshot, fd, separators=(',', ':'))
+        os.replace(temp_path, path)
+
+    def read_metrics(self):
+        # type: () -> List[Dict[str, object]]
+        """Get the shared metrics of all processes."""
+        snapshots = []
+        for path in self.directory.glob('metrics-*.json'):
+            with path.open() as fd:
+                snapshots.append(json.load(fd))
+        return snapshots
+
+    def close(self):
+        # type: () -> None
+        """Unmap the version file."""
+        self._version_map.close()
+
+
+class SnapshotReader:
+    """A process-local GradeBook that follows the latest version.
+
+    Deltas are replayed on the local GradeBook, so following a change costs
+    about as much as the change itself. Moving to a new full snapshot reuses
+    GradeBook.reload(), so only the rows that differ are parsed and
+    recomputed.
+    """
+
+    def __init__(self, store):
+        # type: (SnapshotStore) -> None
+        """Initialize the SnapshotReader."""
+        self.store = store
+        self.version = 0
+        self.gradebook = None # type: Optional[GradeBook]
+
+    def _load_snapshot(self, version):
+        # type: (int) -> None
+        """Move to a full snapshot."""
+        if self.gradebook is None:
+            self.gradebook = GradeBook(self.store.path(version))
+        else:
+            self.gradebook.csv_path = self.store.path(version)
+            self.gradebook.reload()
+            self.gradebook.read_history()
+        self.version = version
+
+    def sync(self):
+        # type: () -> GradeBook
+        """Get the GradeBook, updated to the latest version."""
+        while True:
+            version = self.store.version
+            if self.gradebook is not None and version <= self.version:
+                return self.gradebook
+            try:
+                base_version = self.store.base_version
+                if self.gradebook is None or base_version > self.version:
+                    self._load_snapshot(base_version)
+                for delta_version in range(self.version + 1, version + 1):
+                    replay(self.gradebook, *self.store.read_delta(delta_version))
+                    self.version = delta_version
+            except FileNotFoundError:
+                # this version was retired while it was being read; start from the latest snapshot
+                self.version = -1
+
+
+class GradeBookWriter:
+    """The owner of the GradeBook, which applies all changes and publishes them.
+
+    Changes arrive over a multiprocessing connection, one per change, and are
+    applied one at a time. Each is published as a delta, except that a full
+    snapshot is published after a reload, and after every SNAPSHOT_INTERVAL
+    deltas so that new readers have few deltas to replay.
+    """
+
+    SNAPSHOT_INTERVAL = 256
+
+    def __init__(self, gradebook, store, address, authkey):
+        # type: (GradeBook, SnapshotStore, str, bytes) -> None
+        """Initialize the GradeBookWriter."""
+        self.gradebook = gradebook
+        self.store = store
+        self.changed = False
+        self.lock = threading.Lock()
+        self.listener = Listener(address, authkey=authkey)
+        self.store.publish(self.gradebook)
+        self.store.write_metrics('writer', METRICS.snapshot())
+
+    def call(self, method, *args):
+        # type: (str, *Any) -> Tuple[int, Any]
+        """Apply a change, then publish the result and return its version."""
+        if method not in WRITE_METHODS:
+            raise ValueError(f'not a GradeBook write method: {method}')
+        with self.lock:
+            result = getattr(self.gradebook, method)(*args)
+            if method in UNSAVED_METHODS:
+                self.changed = True
+            elif method == 'write_csv':
+                self.changed = False
+            if method in REPLAYED_METHODS and self.store.version - self.store.base_version < self.SNAPSHOT_INTERVAL:
+                version = self.store.publish_delta(method, args)
+            else:
+                version = self.store.publish(self.gradebook)
+            self.store.write_metrics('writer', METRICS.snapshot())
+            return version, result
+
+    def serve_forever(self):
+        # type: () -> None
+        """Apply changes from readers until interrupted."""
+        while True:
+            try:
+                connection = self.listener.accept()
+            except AuthenticationError:
+                continue
+            with connection:
+                method, args = connection.recv()
+                try:
+                    version, result = self.call(method, *args)
+                except Exception as err: # pylint: disable = broad-except
+                    connection.send(('error', f'{type(err).__name__}: {err}'))
+                else:
+                    connection.send(('ok', version, result))
+
+    def watch_forever(self, interval=1.0):
+        # type: (float) -> None
+        """Reload the grades file whenever it changes on disk."""
+        while True:
+            time.sleep(interval)
+            with self.lock:
+                if self.gradebook.reload_if_changed():
+                    self.store.publish(self.gradebook)
+
+    def close(self):
+        # type: () -> None
+        """Stop accepting changes."""
+        self.listener.close()
+
+
+class WriterClient:
+    """A stand-in for the GradeBook in reader processes that forwards its write methods.
+
+    After each change, the reader catches up to the snapshot the writer
+    published, so a request always sees its own change.
+    """
+
+    def __init__(self, address, authkey, reader):
+        # type: (str, bytes, SnapshotReader) -> None
+        """Initialize the WriterClient."""
+        self.address = address
+        self.authkey = authkey
+        self.reader = reader
+
+    def __getattr__(self, method):
+        # type: (str) -> Callable[..., Any]
+        if method not in WRITE_METHODS:
+            raise AttributeError(method)
+
+        def call(*args):
+            # type: (*Any) -> Any
+            with Client(self.address, authkey=self.authkey) as connection:
+                connection.send((method, args))
+                reply = connection.recv()
+            if reply[0] == 'error':
+                raise WriterError(reply[1])
+            self.reader.sync()
+            return reply[2]
+
+        return call
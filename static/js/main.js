@@ -14,6 +14,273 @@ function blur_cell(input) {
     update_score(input);
 }
 
+// the assignment tree and scales, for recomputing grades without waiting for the server
+var ASSIGNMENTS = {};
+var GRADE_SCALE = [];
+var COLOR_SCALE = null;
+
+var PERCENT_REGEX = /^([0-9]*)(\.[0-9]+)?%$/;
+var FRACTION_REGEX = /^([0-9]*)(\.[0-9]+)?\/([0-9]*)(\.[0-9]+)?$/;
+var SCORE_REGEX = /^([0-9]*)(\.[0-9]+)?$/;
+var LETTER_REGEX = /^[A-F][+-]?(\/[A-F][+-]?)?$/;
+
+function load_schema(schema) {
+    ASSIGNMENTS = {};
+    for (var i = 0; i < schema.assignments.length; i++) {
+        var row = schema.assignments[i];
+        var parent = (row[1] === null ? null : schema.assignments[row[1]][0]);
+        ASSIGNMENTS[row[0]] = {
+            "parent": parent,
+            "children": [],
+            "weight": row[2],
+            "points": row[3],
+            "extra_credit": row[4],
+            "policy": row[5]
+        };
+        if (parent !== null) {
+            ASSIGNMENTS[parent].children.push(row[0]);
+        }
+    }
+    GRADE_SCALE = schema.grade_scale;
+    COLOR_SCALE = schema.color_scale;
+}
+
+function parse_number(string) {
+    // like Python's Fraction(), an empty string is not a number
+    if (string === "") {
+        return NaN;
+    }
+    return parseFloat(string);
+}
+
+function letter_boundary(letter) {
+    for (var i = 0; i < GRADE_SCALE.length; i++) {
+        if (GRADE_SCALE[i][0] === letter) {
+            return GRADE_SCALE[i][1];
+        }
+    }
+    return NaN;
+}
+
+// mirrors overunder.parse_fraction(); returns null for no grade and NaN if invalid
+function parse_grade(string, full_points) {
+    if (string.toLowerCase() === "none") {
+        return null;
+    }
+    string = string.replace(/^\++/, "");
+    var negative = (string.charAt(0) === "-");
+    if (negative) {
+        string = string.substring(1);
+    }
+    var fraction;
+    if (PERCENT_REGEX.test(string)) {
+        fraction = parse_number(string.slice(0, -1)) / 100;
+    } else if (FRACTION_REGEX.test(string)) {
+        var parts = string.split("/");
+        fraction = parse_number(parts[0] || "0") / parse_number(parts[1] || "1");
+    } else if (SCORE_REGEX.test(string)) {
+        fraction = parse_number(string) / full_points;
+    } else if (LETTER_REGEX.test(string)) {
+        var letters = string.split("/");
+        if (letters.length === 2) {
+            fraction = (letter_boundary(letters[0]) + letter_boundary(letters[1])) / 2;
+        } else {
+            fraction = letter_boundary(string);
+        }
+    } else {
+        return NaN;
+    }
+    if (!isFinite(fraction)) {
+        return NaN;
+    }
+    return (negative ? 1 - fraction : fraction);
+}
+
+function letter_grade(fraction) {
+    var index = 0;
+    // allow for floating point error, since grades often land exactly on a boundary
+    while (index < GRADE_SCALE.length - 1 && GRADE_SCALE[index][1] <= fraction + 1e-9) {
+        index += 1;
+    }
+    return GRADE_SCALE[index][0];
+}
+
+// mirrors ColorScale._index(), including rounding half to even
+function grade_color(fraction) {
+    var scaled = fraction * COLOR_SCALE.steps;
+    var step = Math.round(scaled);
+    if (Math.abs(scaled % 1) === 0.5) {
+        step = 2 * Math.round(scaled / 2);
+    }
+    if (step <= COLOR_SCALE.lowest_step) {
+        return COLOR_SCALE.colors[0];
+    } else if (step >= COLOR_SCALE.highest_step) {
+        return COLOR_SCALE.colors[COLOR_SCALE.highest_step - COLOR_SCALE.lowest_step];
+    } else {
+        return COLOR_SCALE.colors[step - COLOR_SCALE.lowest_step];
+    }
+}
+
+function percent_str(fraction) {
+    return (fraction * 100).toFixed(2) + "%";
+}
+
+// a recomputation of one student's grades from the values currently on the page
+function GradeEngine(alias) {
+    this.alias = alias;
+    this.leaves = {};
+}
+
+GradeEngine.prototype.leaf_grade = function (qualified_name) {
+    if (!(qualified_name in this.leaves)) {
+        var input = document.getElementById(this.alias + "__" + qualified_name);
+        var grade = null;
+        if (input !== null) {
+            grade = parse_grade($.trim(input.value), ASSIGNMENTS[qualified_name].points);
+            if (isNaN(grade)) {
+                grade = null;
+            }
+        }
+        this.leaves[qualified_name] = grade;
+    }
+    return this.leaves[qualified_name];
+};
+
+GradeEngine.prototype.has_grade = function (qualified_name) {
+    var children = ASSIGNMENTS[qualified_name].children;
+    if (children.length === 0) {
+        return this.leaf_grade(qualified_name) !== null;
+    }
+    for (var i = 0; i < children.length; i++) {
+        if (this.has_grade(children[i])) {
+            return true;
+        }
+    }
+    return false;
+};
+
+// mirrors AssignmentGrade._weighted_grade()
+GradeEngine.prototype.weighted_grade = function (qualified_name, default_grade) {
+    var children = ASSIGNMENTS[qualified_name].children;
+    if (children.length === 0) {
+        var grade = this.leaf_grade(qualified_name);
+        if (grade !== null) {
+            return grade;
+        }
+        return (default_grade === null ? 0 : default_grade);
+    }
+    var policy = ASSIGNMENTS[qualified_name].policy;
+    var counted = [];
+    for (var i = 0; i < children.length; i++) {
+        if (default_grade === null && !this.has_grade(children[i])) {
+            continue;
+        }
+        var child = ASSIGNMENTS[children[i]];
+        counted.push({
+            "name": children[i],
+            "grade": this.weighted_grade(children[i], default_grade),
+            "weight": child.weight,
+            "extra_credit": child.extra_credit
+        });
+    }
+    var dropped = {};
+    if (policy !== null) {
+        // mirrors PolicyGrades: drop the lowest regular grades, ties broken by name
+        var regular = counted.filter(function (entry) { return !entry.extra_credit; });
+        regular.sort(function (a, b) {
+            return (a.grade - b.grade) || (a.name < b.name ? -1 : (a.name > b.name ? 1 : 0));
+        });
+        var num_dropped = policy[0];
+        if (policy[1] !== null) {
+            num_dropped = Math.max(num_dropped, regular.length - policy[1]);
+        }
+        num_dropped = Math.max(Math.min(num_dropped, regular.length - 1), 0);
+        for (var j = 0; j < num_dropped; j++) {
+            dropped[regular[j].name] = true;
+        }
+    }
+    var total_grade = 0;
+    var total_weight = 0;
+    for (var k = 0; k < counted.length; k++) {
+        if (counted[k].name in dropped) {
+            continue;
+        }
+        total_grade += counted[k].weight * counted[k].grade;
+        if (!counted[k].extra_credit) {
+            total_weight += counted[k].weight;
+        }
+    }
+    var result = (total_weight === 0 ? 0 : total_grade / total_weight);
+    if (policy !== null && policy[2]) {
+        result = Math.min(result, 1);
+    }
+    return result;
+};
+
+GradeEngine.prototype.cell = function (qualified_name) {
+    var minimum_grade = this.weighted_grade(qualified_name, 0);
+    var partial_grade = this.weighted_grade(qualified_name, null);
+    var maximum_grade = this.weighted_grade(qualified_name, 1);
+    return {
+        "qname": this.alias + "__" + qualified_name,
+        "display": percent_str(partial_grade),
+        "projection": [
+            "Minimum: " + percent_str(minimum_grade) + " (" + letter_grade(minimum_grade) + ")",
+            "Partial: " + percent_str(partial_grade) + " (" + letter_grade(partial_grade) + ")",
+            "Maximum: " + percent_str(maximum_grade) + " (" + letter_grade(maximum_grade) + ")"
+        ].join("\n"),
+        "color": (this.has_grade(qualified_name) ? grade_color(partial_grade) : "#FFFFFF")
+    };
+};
+
+// the cells that change with a leaf, in the same form as the /update_score response
+function recompute_cells(alias, qualified_name, value) {
+    if (!(qualified_name in ASSIGNMENTS) || isNaN(parse_grade(value, ASSIGNMENTS[qualified_name].points))) {
+        return [];
+    }
+    var engine = new GradeEngine(alias);
+    var leaf_grade = engine.leaf_grade(qualified_name);
+    var cells = [{
+        "qname": alias + "__" + qualified_name,
+        "color": (leaf_grade === null ? "#FFFFFF" : grade_color(leaf_grade))
+    }];
+    var ancestor = ASSIGNMENTS[qualified_name].parent;
+    // only ancestors shown on this page can be recomputed from it
+    while (ancestor !== null && document.getElementById(alias + "__" + ancestor) !== null) {
+        cells.push(engine.cell(ancestor));
+        ancestor = ASSIGNMENTS[ancestor].parent;
+    }
+    return cells;
+}
+
+function show_cells(input_id, cells) {
+    var corrected = 0;
+    for (var i = 0; i < cells.length; i++) {
+        var element = document.getElementById(cells[i]['qname']);
+        if (element === null) {
+            continue;
+        }
+        var ancestor = $(element);
+        if (cells[i]['qname'] === input_id) {
+            if (ancestor.parent().data("color") !== cells[i]['color']) {
+                ancestor.parent().data("color", cells[i]['color']);
+                ancestor.parent().css("background-color", cells[i]['color']);
+                corrected += 1;
+            }
+        } else {
+            var html = '<abbr title="' + cells[i]['projection'] + '">' + cells[i]['display'] + '</abbr>';
+            if (ancestor.data("html") !== html || ancestor.data("color") !== cells[i]['color']) {
+                ancestor.data("html", html);
+                ancestor.data("color", cells[i]['color']);
+                ancestor.html(html);
+                ancestor.css("background-color", cells[i]['color']);
+                corrected += 1;
+            }
+        }
+    }
+    return corrected;
+}
+
 function update_score(input) {
     input = $(input);
     var input_id = input.attr("id");
@@ -30,18 +297,12 @@ function update_score(input) {
     }
     SAVING[input_id] += 1;
     input.parent().addClass("parsing");
+    // show the locally computed grades immediately; the server has the final say
+    show_cells(input_id, recompute_cells(alias, assignment, value));
     $.post("/update_score", JSON.stringify(data))
         .done(function (response) {
-            response = JSON.parse(response);
-            for (var i = 0; i < response.length; i++) {
-                var ancestor_id = response[i]['qname'];
-                var ancestor = $("#" + ancestor_id);
-                if (ancestor_id === input_id) {
-                    ancestor.parent().css("background-color", response[i]['color']);
-                } else {
-                    ancestor.html('<abbr title="' + response[i]['projection'] + '">' + response[i]['display'] + '</abbr>');
-                    ancestor.css("background-color", response[i]['color']);
-                }
+            if (show_cells(input_id, JSON.parse(response)) > 0 && window.console) {
+                console.log("server corrected the local grades for " + input_id);
             }
             SAVING[input_id] -= 1;
             if (SAVING[input_id] === 0) {
@@ -69,6 +330,18 @@ function create_child(qualified_name) {
     return false;
 }
 
+function create_checkpoint() {
+    var name = prompt("What is the name of the checkpoint?");
+    if (!name) {
+        return false;
+    }
+    $.post("/checkpoint", JSON.stringify({"name": name}))
+        .done(function (response) {
+            location.reload();
+        });
+    return false;
+}
+
 function toggle_descendants(qualified_name) {
     var expander = $("#" + qualified_name + "-expander");
     if (expander.html() === "-") {
@@ -1,59 +1,1062 @@
-from overunder import Assignment
+import gzip
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import threading
+from fractions import Fraction
+from math import ceil
+from pathlib import Path
+
+import pytest
+
+from benchmark import compare
+from generate import generate_gradebook
+from grade import from_fraction, from_fractions, from_gpa, from_gpas, from_percent, from_percents
+from metrics import Metrics
+from overunder import (
+    GRADE_FIELDS, Assignment, AssignmentGrade, AssignmentStats, GradeBook, GradeScale, NamedNode,
+    export_lines, grade_records, select_fields, student_records,
+)
+from overunder import main as report_main
+import overunder
+from snapshots import GradeBookWriter, SnapshotReader, SnapshotStore, WriterClient
 
 data_structures_assignments = [
     'Data Structures (100.00%)',
     '__Final (20.00%)',
-    '____Page 2 (24.00pts)',
-    '____Page 3 (30.00pts)',
-    '____Page 4 (25.00pts)',
-    '____Page 5 (24.00pts)',
-    '____Page 6 (36.00pts)',
-    '____Page 7 (30.00pts)',
-    '____Page 8 (10.00pts)',
-    '____Page 9 (21.00pts)',
+    '____Page 2 (24.00)',
+    '____Page 3 (30.00)',
+    '____Page 4 (25.00)',
+    '____Page 5 (24.00)',
+    '____Page 6 (36.00)',
+    '____Page 7 (30.00)',
+    '____Page 8 (10.00)',
+    '____Page 9 (21.00)',
     '__Midterm (12.00%)',
-    '____Q1 (36.00pts)',
-    '____Q2 (30.00pts)',
-    '____Q3 (30.00pts)',
-    '____Q4 (24.00pts)',
+    '____Q1 (36.00)',
+    '____Q2 (30.00)',
+    '____Q3 (30.00)',
+    '____Q4 (24.00)',
     '__HW1 (12.00%)',
-    '____Questions (84.00pts)',
-    '____Code (24.00pts)',
+    '____Questions (84.00)',
+    '____Code (24.00)',
     '__HW2 (12.00%)',
-    '____Questions (72.00pts)',
-    '____Code (48.00pts)',
-    '____Removal* (18.00pts)',
+    '____Questions (72.00)',
+    '____Code (48.00)',
+    '____Removal* (18.00)',
     '__HW3 (12.00%)',
     '__HW4 (12.00%)',
-    '____Questions (70.00pts)',
-    '____Code (50.00pts)',
+    '____Questions (70.00)',
+    '____Code (50.00)',
     '__HW5 (12.00%)',
-    '____Q1 (48.00pts)',
-    '____Q2 (72.00pts)',
-    '____Q3* (10.00pts)',
+    '____Q1 (48.00)',
+    '____Q2 (72.00)',
+    '____Q3* (10.00)',
     '__Readings (8.00%)',
-    '____2019-08-30 (1.00pts)',
-    '____2019-09-04 (1.00pts)',
-    '____2019-09-06 (1.00pts)',
-    '____2019-09-09 (1.00pts)',
-    '____2019-09-11 (1.00pts)',
-    '____2019-09-13 (1.00pts)',
-    '____2019-09-16 (1.00pts)',
-    '____2019-09-18 (1.00pts)',
-    '____2019-09-20 (1.00pts)',
-    '____2019-09-23 (1.00pts)',
-    '____2019-09-25 (1.00pts)',
-    '____2019-09-27 (1.00pts)',
-    '____2019-09-30 (1.00pts)',
-    '____2019-10-18 (1.00pts)',
-    '____2019-10-21 (1.00pts)',
-    '____2019-10-23 (1.00pts)',
-    '____2019-10-25 (1.00pts)',
-    '____2019-10-28 (1.00pts)',
-    '____2019-10-30 (1.00pts)',
-    '____2019-11-01 (1.00pts)',
-    '____2019-11-06 (1.00pts)',
+    '____2019-08-30 (1.00)',
+    '____2019-09-04 (1.00)',
+    '____2019-09-06 (1.00)',
+    '____2019-09-09 (1.00)',
+    '____2019-09-11 (1.00)',
+    '____2019-09-13 (1.00)',
+    '____2019-09-16 (1.00)',
+    '____2019-09-18 (1.00)',
+    '____2019-09-20 (1.00)',
+    '____2019-09-23 (1.00)',
+    '____2019-09-25 (1.00)',
+    '____2019-09-27 (1.00)',
+    '____2019-09-30 (1.00)',
+    '____2019-10-18 (1.00)',
+    '____2019-10-21 (1.00)',
+    '____2019-10-23 (1.00)',
+    '____2019-10-25 (1.00)',
+    '____2019-10-28 (1.00)',
+    '____2019-10-30 (1.00)',
+    '____2019-11-01 (1.00)',
+    '____2019-11-06 (1.00)',
 ]
 
-print('\n'.join(list(Assignment.from_strings(data_structures_assignments).to_headings())))
-assert data_structures_assignments == list(Assignment.from_strings(data_structures_assignments).to_headings())
+
+def test_headings_round_trip():
+    assert data_structures_assignments == list(Assignment.from_strings(data_structures_assignments).to_headings())
+
+
+def test_shared_grade_values(tmp_path):
+    csv_path = tmp_path.joinpath('grades.csv')
+    generate_gradebook(csv_path, 40, 6, seed=6)
+    gradebook = GradeBook(csv_path)
+    leaves = [assignment.qualified_name for assignment in gradebook.assignments.traversal if assignment.is_leaf]
+
+    def check():
+        # pylint: disable = protected-access
+        for qualified_name in leaves:
+            grade_strs = {}
+            percent_grades = {}
+            for alias in gradebook.students:
+                grade = gradebook.get_grade(alias, qualified_name)
+                assert grade_strs.setdefault(grade._grade_str, grade._grade_str) is grade._grade_str
+                if grade.has_grade:
+                    assert percent_grades.setdefault(grade._grade_str, grade._percent_grade) is grade._percent_grade
+            # most cells hold one of a few values
+            assert len(grade_strs) < len(gradebook.students)
+
+    check()
+    aliases = list(gradebook.students)
+    for alias in aliases[:10]:
+        # a string built at runtime, as when it comes from a request
+        gradebook.set_grade(alias, leaves[0], ''.join(['10', '0%']))
+    check()
+    gradebook.write_csv()
+    lines = csv_path.read_text().splitlines()
+    for i in (1, 2):
+        lines[i] = lines[i].rsplit('\t', 1)[0] + '\t' + ''.join(['5', '0%'])
+    csv_path.write_text('\n'.join(lines) + '\n')
+    assert gradebook.reload_if_changed()
+    check()
+
+
+def test_custom_grade_scale(tmp_path):
+    scale = GradeScale.from_string('Scale\tC (70%)\tB (85%)\tA (100%)')
+    assert str(scale) == 'Scale\tC (70.00%)\tB (85.00%)\tA (100.00%)'
+    assert GradeScale.from_string(str(scale)) == scale
+    assert scale.lower_bounds == [0, Fraction(7, 10), Fraction(85, 100)]
+    # boundaries are exclusive, and grades outside the scale clamp to its ends
+    fractions = [Fraction(-1, 10), Fraction(0), Fraction(699, 1000), Fraction(7, 10), Fraction(85, 100), Fraction(3, 2)]
+    assert [scale.letter(fraction) for fraction in fractions] == ['C', 'C', 'C', 'B', 'A', 'A']
+    assert scale.letters(fractions) == [scale.letter(fraction) for fraction in fractions]
+    assert scale.parse('B') == (Fraction(85, 100), 'letter')
+    assert scale.parse('B/A') == (Fraction(185, 200), 'letter')
+    for string in ('Scale\tA', 'Scale\tA (100%)\tB (100%)', 'Scale'):
+        try:
+            GradeScale.from_string(string)
+            assert False
+        except ValueError:
+            pass
+    csv_path = tmp_path.joinpath('grades.csv')
+    csv_path.write_text('\n'.join([
+        str(scale),
+        'Student\tCourse (100%)\t__Essay (50%)\t__Exam (50%)',
+        'Doe, Jane <jdoe@example.edu>\tNone\tB\t70%',
+    ]) + '\n')
+    gradebook = GradeBook(csv_path)
+    assert gradebook.grade_scale == scale
+    course = gradebook.get_grade('jdoe', 'Course')
+    assert course.partial_grade == Fraction(155, 200)
+    assert course.letter_grade(course.partial_grade) == 'B'
+    assert 'Partial: 77.50% (B)' in course.projection_str
+
+
+def test_letter_not_on_grade_scale(tmp_path):
+    import overunderapp # pylint: disable = import-outside-toplevel
+    csv_path = tmp_path.joinpath('grades.csv')
+    csv_path.write_text('\n'.join([
+        'Scale\tC (70%)\tB (85%)\tA (100%)',
+        'Student\tCourse (100%)\t__Essay (50%)\t__Exam (50%)',
+        'Doe, Jane <jdoe@example.edu>\tNone\tB\t70%',
+    ]) + '\n')
+    for string in ('D+', 'B/D', 'D/B'):
+        try:
+            GradeScale.from_string('Scale\tC (70%)\tB (85%)\tA (100%)').parse(string)
+            assert False
+        except ValueError:
+            pass
+    overunderapp.configure_app(csv_path)
+    gradebook = overunderapp.APP.config['gradebook']
+    client = overunderapp.APP.test_client()
+    data = {'alias': 'jdoe', 'assignment': 'Course__Essay', 'value': 'D+'}
+    assert client.post('/update_score', data=json.dumps(data)).status_code == 400
+    essay = gradebook.get_grade('jdoe', 'Course__Essay')
+    assert essay.display_str == 'B'
+    assert not gradebook.history.can_undo
+    try:
+        essay.set_grade('D+')
+        assert False
+    except ValueError:
+        pass
+    assert essay.display_str == 'B'
+    data['value'] = 'A'
+    assert client.post('/update_score', data=json.dumps(data)).status_code == 200
+    gradebook.write_csv()
+    assert GradeBook(csv_path).get_grade('jdoe', 'Course__Essay').display_str == 'A'
+
+
+def test_batch_conversions():
+    fractions = [Fraction(numerator, 300) for numerator in range(301)]
+    letters, gpas = from_fractions(fractions)
+    assert list(zip(letters, gpas)) == [
+        from_fraction(fraction.numerator, fraction.denominator)[:2] for fraction in fractions
+    ]
+    try:
+        from_fractions([Fraction(1, 2), Fraction(3, 2)])
+        assert False
+    except ValueError:
+        pass
+    percents = [numerator / 1000 for numerator in range(1001)]
+    letters, gpas = from_percents(percents)
+    assert list(zip(letters, gpas)) == [from_percent(percent)[:2] for percent in percents]
+    orig_gpas = [numerator / 100 for numerator in range(401)]
+    letters, gpas = from_gpas(orig_gpas)
+    assert gpas == orig_gpas
+    assert letters == [from_gpa(gpa).letter for gpa in orig_gpas]
+    for convert, values in ((from_percents, [0.5, 1.5]), (from_gpas, [3.0, -0.5])):
+        try:
+            convert(values)
+            assert False
+        except ValueError:
+            pass
+
+
+def test_set_grade_scale(tmp_path):
+    import overunderapp # pylint: disable = import-outside-toplevel
+    csv_path = tmp_path.joinpath('grades.csv')
+    csv_path.write_text('\n'.join([
+        'Student\tCourse (100%)\t__Essay (50%)\t__Exam (50%)',
+        'Doe, Jane <jdoe@example.edu>\tNone\tB\t80%',
+    ]) + '\n')
+    overunderapp.configure_app(csv_path)
+    gradebook = overunderapp.APP.config['gradebook']
+    assert gradebook.get_grade('jdoe', 'Course__Essay').partial_grade == Fraction(260, 300)
+    client = overunderapp.APP.test_client()
+    response = client.post('/scale', data=json.dumps({'F': '50%', 'C': '70%', 'B': '85%', 'A': '100%'}))
+    assert response.status_code == 204
+    # the letter grade is re-scored, and the course re-lettered
+    assert gradebook.get_grade('jdoe', 'Course__Essay').partial_grade == Fraction(85, 100)
+    course = gradebook.get_grade('jdoe', 'Course')
+    assert course.partial_grade == Fraction(165, 200)
+    assert course.letter_grade(course.partial_grade) == 'B'
+    scale = list(gradebook.grade_scale.items())
+    for boundaries in (
+        {'A': 'Pass'}, {'A': 'B'}, {'A': '100%', 'B': '1'}, {'A': '100%', 'C': '70%'}, ['100%'],
+        {'A': '100%', 'B': '85%', 'C': '70%'}, {'C': '70%', 'B': '70%', 'A': '100%'},
+        {'C': '70%', 'B': '85%', 'A': '110%'}, {'C': '-110%', 'B': '85%', 'A': '100%'},
+    ):
+        assert client.post('/scale', data=json.dumps(boundaries)).status_code == 400
+    assert list(gradebook.grade_scale.items()) == scale
+    assert not gradebook.history.can_undo
+    gradebook.write_csv()
+    assert GradeBook(csv_path).grade_scale == gradebook.grade_scale
+
+
+def test_batch_colors(tmp_path):
+    csv_path = tmp_path.joinpath('grades.csv')
+    generate_gradebook(csv_path, 20, 10, seed=7)
+    gradebook = GradeBook(csv_path)
+    alias = next(iter(gradebook.students))
+    leaf = [assignment.qualified_name for assignment in gradebook.assignments.traversal if assignment.is_leaf][0]
+    gradebook.set_grade(alias, leaf, 'None')
+    grades = [assignment_grade for root in gradebook.grades.values() for assignment_grade in root.traversal]
+    assert AssignmentGrade.as_colors(grades) == [assignment_grade.as_color for assignment_grade in grades]
+    color_scale = AssignmentGrade.COLOR_SCALE
+    fractions = [Fraction(numerator, 1000) for numerator in range(-100, 1200, 7)]
+    assert color_scale.colors([*fractions, None]) == [*(color_scale[fraction] for fraction in fractions), '#FFFFFF']
+    import overunderapp # pylint: disable = import-outside-toplevel
+    students = list(gradebook.students.values())
+    cells = overunderapp.grade_cells(gradebook, students, list(gradebook.assignments.traversal))
+    assert [color for _, color in cells] == [assignment_grade.as_color for assignment_grade, _ in cells]
+    assert len(cells) == len(grades)
+
+
+def test_incremental_reload(tmp_path):
+    csv_path = tmp_path.joinpath('grades.csv')
+    generate_gradebook(csv_path, 20, 10, seed=8)
+    gradebook = GradeBook(csv_path)
+    lines = csv_path.read_text().splitlines()
+    lines[1] = lines[1].rsplit('\t', 3)[0] + '\t0\t0\t0'
+    del lines[2]
+    csv_path.write_text('\n'.join(lines) + '\n')
+    propagate_calls = overunder.COUNTERS['propagate_calls']
+    assert gradebook.reload_if_changed()
+    # the changed cells are recomputed together, not propagated one by one
+    assert overunder.COUNTERS['propagate_calls'] == propagate_calls
+    fresh = GradeBook(csv_path)
+    assert list(gradebook.students) == list(fresh.students)
+    for assignment, fresh_assignment in zip(gradebook.assignments.traversal, fresh.assignments.traversal):
+        assert assignment.stats.to_dict() == fresh_assignment.stats.to_dict()
+        for alias in fresh.students:
+            grade = gradebook.get_grade(alias, assignment.qualified_name)
+            assert grade.projection_str == fresh.get_grade(alias, assignment.qualified_name).projection_str
+    # saving computes the same hashes as reading the saved file, with and without a scale line
+    boundaries = {letter: str(boundary) for letter, boundary in gradebook.grade_scale.items()}
+    boundaries['F'] = str(Fraction(boundaries['F']) / 2)
+    for change in (lambda: gradebook.set_grade(alias, 'Course', '0'), lambda: gradebook.set_grade_scale(boundaries)):
+        change()
+        gradebook.write_csv()
+        saved = GradeBook(csv_path)
+        # pylint: disable = protected-access
+        assert (gradebook._header_hash, gradebook._row_hashes) == (saved._header_hash, saved._row_hashes)
+        assert json.loads(gradebook.history_path.read_text())['file_hash'] == GradeBook.hash_file(csv_path)
+        assert not gradebook.reload_if_changed()
+    assert csv_path.read_text().startswith('Scale\t')
+
+
+def test_stats_and_ranking_match_recompute(tmp_path):
+    csv_path = tmp_path.joinpath('grades.csv')
+    generate_gradebook(csv_path, 30, 12, seed=11)
+    gradebook = GradeBook(csv_path)
+
+    def check():
+        for assignment in gradebook.assignments.traversal:
+            grades = [
+                gradebook.get_grade(alias, assignment.qualified_name)
+                for alias in gradebook.students
+            ]
+            fractions = sorted(grade.partial_grade for grade in grades if grade.has_grade)
+            stats = AssignmentStats()
+            for fraction in fractions:
+                stats.add(fraction)
+            assert (assignment.stats.count, assignment.stats.total, assignment.stats.total_squares) == (
+                stats.count, stats.total, stats.total_squares,
+            )
+            assert assignment.stats.histogram == stats.histogram
+            assert len(assignment.ranking) == len(fractions)
+            assert [
+                gradebook.get_grade(alias, assignment.qualified_name).partial_grade
+                for alias in assignment.ranking.aliases(descending=False)
+            ] == fractions
+            if fractions:
+                middle = len(fractions) // 2
+                median = fractions[middle] if len(fractions) % 2 else (fractions[middle - 1] + fractions[middle]) / 2
+                assert assignment.ranking.median == median
+            ranked = [
+                (alias, gradebook.get_grade(alias, assignment.qualified_name).partial_grade)
+                for alias in assignment.ranking.aliases()
+            ]
+            for k in (0, 1, 5, len(fractions) + 1):
+                assert assignment.ranking.top(k) == ranked[:k]
+                assert assignment.ranking.bottom(k) == ranked[::-1][:k]
+                assert [grade for _, grade in assignment.ranking.top(k)] == fractions[::-1][:k]
+            quarter = ceil(len(fractions) / 4)
+            assert assignment.ranking.top_percent(Fraction(1, 4)) == assignment.ranking.top(quarter)
+            assert assignment.ranking.bottom_percent(Fraction(1, 4)) == assignment.ranking.bottom(quarter)
+            for grade in grades:
+                if not grade.has_grade:
+                    assert grade.rank is None
+                    continue
+                below = sum(1 for fraction in fractions if fraction < grade.partial_grade)
+                above = sum(1 for fraction in fractions if fraction > grade.partial_grade)
+                assert grade.rank == above + 1
+                assert grade.percentile == Fraction(2 * below + len(fractions) - below - above, 2 * len(fractions))
+
+    check()
+    rng = random.Random(11)
+    aliases = list(gradebook.students)
+    leaves = [assignment.qualified_name for assignment in gradebook.assignments.traversal if assignment.is_leaf]
+    for _ in range(200):
+        gradebook.set_grade(rng.choice(aliases), rng.choice(leaves), rng.choice(['None', '0', '1', '50%', '100%', 'B']))
+    check()
+    gradebook.remove_assignment(leaves[0])
+    check()
+    gradebook.undo()
+    check()
+    gradebook.write_csv()
+    lines = csv_path.read_text().splitlines()
+    del lines[3], lines[5]
+    csv_path.write_text('\n'.join(lines) + '\n')
+    assert gradebook.reload_if_changed()
+    check()
+
+
+def test_reload_discards_unsaved_edits(tmp_path):
+    csv_path = tmp_path.joinpath('grades.csv')
+    generate_gradebook(csv_path, 10, 8, seed=2)
+    gradebook = GradeBook(csv_path)
+    alias = next(iter(gradebook.students))
+    leaf = [assignment.qualified_name for assignment in gradebook.assignments.traversal if assignment.is_leaf][0]
+    original = gradebook.get_grade(alias, 'Course').projection_str
+    gradebook.set_grade(alias, leaf, '0')
+    gradebook.reload()
+    assert gradebook.get_grade(alias, 'Course').projection_str == original
+    assert not gradebook.history.can_undo
+    gradebook.add_assignment('Course__Extra', '10')
+    gradebook.reload()
+    assert 'Course__Extra' not in gradebook.assignments
+
+
+def test_undo_and_checkpoints(tmp_path):
+    csv_path = tmp_path.joinpath('grades.csv')
+    generate_gradebook(csv_path, 10, 12, seed=3)
+    gradebook = GradeBook(csv_path)
+
+    def snapshot():
+        return [
+            (assignment_grade.qualified_name, assignment_grade.projection_str)
+            for alias in gradebook.students
+            for assignment_grade in gradebook.grades[alias].traversal
+        ]
+
+    original = snapshot()
+    gradebook.checkpoint('original')
+    alias = next(iter(gradebook.students))
+    category, leaf = [assignment.qualified_name for assignment in gradebook.assignments.traversal][1:3]
+    gradebook.set_grade(alias, leaf, '0')
+    gradebook.remove_assignment(category)
+    gradebook.add_assignment('Course__Final', '50%')
+    changed = snapshot()
+    assert gradebook.undo() and gradebook.undo() and gradebook.undo()
+    assert not gradebook.undo()
+    assert snapshot() == original
+    assert gradebook.redo() and gradebook.redo() and gradebook.redo()
+    assert snapshot() == changed
+    gradebook.write_csv()
+    gradebook = GradeBook(csv_path)
+    gradebook.restore_checkpoint('original')
+    assert snapshot() == original
+
+
+def test_history_merges_cell_edits(tmp_path):
+    csv_path = tmp_path.joinpath('grades.csv')
+    generate_gradebook(csv_path, 5, 6, seed=5)
+    gradebook = GradeBook(csv_path)
+    alias = next(iter(gradebook.students))
+    first, second = [assignment.qualified_name for assignment in gradebook.assignments.traversal if assignment.is_leaf][:2]
+    original = gradebook.get_grade(alias, first).display_str
+    for grade_str in ('1', '12', '123'):
+        gradebook.set_grade(alias, first, grade_str)
+    assert len(gradebook.history.changes) == 1
+    gradebook.set_grade(alias, second, '1')
+    gradebook.set_grade(alias, first, '4')
+    assert len(gradebook.history.changes) == 3
+    gradebook.set_grade(alias, first, '123')
+    assert len(gradebook.history.changes) == 2
+    assert gradebook.undo() and gradebook.undo() and not gradebook.undo()
+    assert gradebook.get_grade(alias, first).display_str == original
+    # saved and checkpointed versions are never merged into
+    gradebook.set_grade(alias, first, '5')
+    gradebook.checkpoint('five')
+    gradebook.set_grade(alias, first, '6')
+    gradebook.write_csv()
+    gradebook.set_grade(alias, first, '7')
+    assert gradebook.undo() and gradebook.undo()
+    assert gradebook.get_grade(alias, first).display_str == '5'
+
+
+def test_grade_policies(tmp_path):
+    csv_path = tmp_path.joinpath('grades.csv')
+    csv_path.write_text('\n'.join([
+        '\t'.join([
+            'Student', 'Course (100%)', '__Homework (50%, drop 1)', '____HW1 (10)', '____HW2 (10)', '____HW3 (10)',
+            '__Quizzes (50%, keep 1, cap)', '____Q1 (10)', '____Q2 (10)', '____Bonus* (10)',
+        ]),
+        '\t'.join(['Doe, Jane <jdoe@example.edu>', 'None', 'None', '2', '8', 'None', 'None', '6', '9', '5']),
+    ]) + '\n')
+    gradebook = GradeBook(csv_path)
+    assert gradebook.get_grade('jdoe', 'Course__Homework').partial_grade == Fraction(8, 10)
+    assert gradebook.get_grade('jdoe', 'Course__Homework').minimum_grade == Fraction(5, 10)
+    assert gradebook.get_grade('jdoe', 'Course__Homework').maximum_grade == Fraction(9, 10)
+    assert gradebook.get_grade('jdoe', 'Course__Quizzes').partial_grade == 1
+    gradebook.set_grade('jdoe', 'Course__Homework__HW3', '10')
+    assert gradebook.get_grade('jdoe', 'Course__Homework').partial_grade == Fraction(9, 10)
+    gradebook.set_grade('jdoe', 'Course__Quizzes__Bonus', '0')
+    assert gradebook.get_grade('jdoe', 'Course__Quizzes').partial_grade == Fraction(9, 10)
+    assert '__Quizzes (50%, keep 1, cap)' in gradebook.assignments.to_headings()
+
+
+def test_slotted_nodes(tmp_path):
+    csv_path = tmp_path.joinpath('grades.csv')
+    generate_gradebook(csv_path, 3, 4, seed=5)
+    gradebook = GradeBook(csv_path)
+    alias = next(iter(gradebook.students))
+    leaf = [assignment for assignment in gradebook.assignments.traversal if assignment.is_leaf][0]
+    leaf_grade = gradebook.get_grade(alias, leaf.qualified_name)
+    for node in (NamedNode('node'), gradebook.assignments, leaf, gradebook.grades[alias], leaf_grade):
+        assert not hasattr(node, '__dict__')
+        try:
+            node.unexpected = 1
+            assert False
+        except AttributeError:
+            pass
+    # leaves share an empty tuple instead of each having a list of children
+    # pylint: disable = protected-access
+    assert leaf._children is NamedNode.NO_CHILDREN
+    assert leaf_grade._children is NamedNode.NO_CHILDREN
+
+
+def test_percent_weight_cache(tmp_path):
+    csv_path = tmp_path.joinpath('grades.csv')
+    csv_path.write_text('\n'.join([
+        '\t'.join(['Student', 'Course (100%)', '__Work (100%)', '____A (10)', '____B (30)']),
+        '\t'.join(['Doe, Jane <jdoe@example.edu>', 'None', 'None', '10', '0']),
+    ]) + '\n')
+    gradebook = GradeBook(csv_path)
+
+    def check(*weights):
+        children = gradebook.assignments['Course__Work'].children
+        assert [child.percent_weight for child in children] == [Fraction(weight) for weight in weights]
+        fresh = GradeBook(csv_path)
+        assert gradebook.get_grade('jdoe', 'Course').partial_grade == fresh.get_grade('jdoe', 'Course').partial_grade
+
+    check('1/4', '3/4')
+    gradebook.add_assignment('Course__Work__C', '40')
+    gradebook.set_grade('jdoe', 'Course__Work__C', '40')
+    gradebook.write_csv()
+    check('1/8', '3/8', '1/2')
+    gradebook.remove_assignment('Course__Work__B')
+    gradebook.write_csv()
+    check('1/5', '4/5')
+    gradebook.undo()
+    gradebook.write_csv()
+    check('1/8', '3/8', '1/2')
+    csv_path.write_text(csv_path.read_text().replace('____A (10)', '____A (50)'))
+    gradebook.reload()
+    check('5/12', '1/4', '1/3')
+
+
+def test_import_grades(tmp_path):
+    csv_path = tmp_path.joinpath('grades.csv')
+    generate_gradebook(csv_path, 20, 12, seed=5)
+    gradebook = GradeBook(csv_path)
+    reference = GradeBook(csv_path)
+    leaves = [assignment.qualified_name for assignment in gradebook.assignments.traversal if assignment.is_leaf]
+    lines = ['Email,' + ','.join([leaves[0].split('__')[-1], leaves[1], 'Status'])]
+    for i, (alias, student) in enumerate(gradebook.students.items()):
+        lines.append(f'{student.email},{i % 11},{"" if i % 2 else "90%"},done')
+    lines.append('nobody@example.edu,1,1,done')
+    lines.append(f'{next(iter(gradebook.students))},,oops,done')
+    text = '\n'.join(lines)
+    report = gradebook.preview_import(text)
+    assert report['columns'] == {leaves[0].split('__')[-1]: leaves[0], leaves[1]: leaves[1]}
+    assert report['unmatched_columns'] == ['Status']
+    assert report['unmatched_rows'] == ['nobody@example.edu']
+    assert len(report['invalid']) == 1
+    assert report == gradebook.import_grades(text)
+    for alias, qualified_name, _, grade_str in report['changes']:
+        reference.set_grade(alias, qualified_name, grade_str)
+    for alias in gradebook.students:
+        for assignment_grade in gradebook.grades[alias].traversal:
+            expected = reference.get_grade(alias, assignment_grade.qualified_name)
+            assert assignment_grade.display_str == expected.display_str
+            assert assignment_grade.projection_str == expected.projection_str
+    for assignment in gradebook.assignments.traversal:
+        assert assignment.stats.to_dict() == reference.assignments[assignment.qualified_name].stats.to_dict()
+    assert gradebook.undo()
+    assert gradebook.preview_import(text)['changes'] == report['changes']
+
+
+def test_data_records(tmp_path):
+    csv_path = tmp_path.joinpath('grades.csv')
+    generate_gradebook(csv_path, 5, 8, seed=6)
+    gradebook = GradeBook(csv_path)
+    students = list(gradebook.students.values())
+    assert [record['alias'] for record in student_records(students, ['alias'])] == list(gradebook.students)
+    subtree = gradebook.assignments.preorder[1]
+    fields = select_fields('partial,letter', GRADE_FIELDS, ())
+    records = list(grade_records(gradebook, subtree, students, fields))
+    assert len(records) == len(students)
+    for record in records:
+        assert list(record['grades']) == [assignment.qualified_name for assignment in subtree.subtree]
+        assignment_grade = gradebook.get_grade(record['alias'], subtree.qualified_name)
+        assert record['grades'][subtree.qualified_name] == {
+            'partial': float(assignment_grade.partial_grade),
+            'letter': assignment_grade.letter_grade(assignment_grade.partial_grade),
+        }
+        # unselected projections are not computed
+        assert assignment_grade._maximum_grade is None # pylint: disable = protected-access
+
+
+def test_report_with_custom_scale(tmp_path, monkeypatch, capsys):
+    csv_path = tmp_path.joinpath('grades.csv')
+    csv_path.write_text('\n'.join([
+        'Scale\tFail (60%)\tPass (100%)',
+        'Student\tCourse (100%)\t__Exam (10)',
+        'Doe, Jane <jdoe@example.edu>\tNone\t9',
+        'Roe, Rick <rroe@example.edu>\tNone\t3',
+    ]) + '\n')
+    monkeypatch.setattr(sys, 'argv', ['overunder.py', str(csv_path), '--format', 'json'])
+    report_main()
+    rows = json.loads(capsys.readouterr().out)
+    assert [(row['alias'], row['letter'], row['gpa']) for row in rows] == [('jdoe', 'Pass', None), ('rroe', 'Fail', None)]
+
+
+def test_export_formats(tmp_path):
+    csv_path = tmp_path.joinpath('grades.csv')
+    csv_path.write_text('\n'.join([
+        'Scale\tFail (60%)\tPass (100%)',
+        'Student\tCourse (100%)\t__Exams (50%)\t____Midterm (10)\t____Final (10)\t__Project (50%)',
+        'Doe, Jane <jdoe@example.edu>\tNone\tNone\t9\t8\t90%',
+        'Roe, Rick <rroe@example.edu>\tNone\tNone\t3\tNone\t40%',
+    ]) + '\n')
+    gradebook = GradeBook(csv_path)
+
+    def export(export_format, columns):
+        return list(export_lines(gradebook, export_format=export_format, columns=columns))
+
+    # the native format reloads to the same book
+    export_path = tmp_path.joinpath('export.csv')
+    gradebook.export(export_path)
+    exported = GradeBook(export_path)
+    assert list(exported.assignments.to_headings()) == list(gradebook.assignments.to_headings())
+    assert exported.grade_scale == gradebook.grade_scale
+    for alias in gradebook.students:
+        assert exported.get_grade(alias, 'Course').projection_str == gradebook.get_grade(alias, 'Course').projection_str
+    # column selections
+    assert export('lms', 'leaves')[0].split(',')[4:] == [
+        'Course > Exams > Midterm', 'Course > Exams > Final', 'Course > Project\r\n',
+    ]
+    assert export('summary', 'categories')[0].split('\t')[1::2] == ['Course (%)', 'Course__Exams (%)']
+    # the final column comes with its letter on the book's scale
+    assert export('lms', 'final') == [
+        'Last Name,First Name,Email,Alias,Course,Course Letter\r\n',
+        'Doe,Jane,jdoe@example.edu,jdoe,87.50,Pass\r\n',
+        'Roe,Rick,rroe@example.edu,rroe,35.00,Fail\r\n',
+    ]
+    assert export('summary', 'final')[1:] == [
+        'Doe, Jane <jdoe@example.edu>\t87.50%\tPass\n',
+        'Roe, Rick <rroe@example.edu>\t35.00%\tFail\n',
+    ]
+    rows = [json.loads(line) for line in export('jsonl', 'final')]
+    assert [row['grades']['Course']['letter'] for row in rows] == ['Pass', 'Fail']
+    # the native format has no letters, and must be read back as a whole tree
+    for columns in ('leaves', 'categories', 'final'):
+        try:
+            export('native', columns)
+            assert False
+        except ValueError as error:
+            assert str(error).endswith('use one of: lms, jsonl, summary')
+
+
+def test_interrupted_save_keeps_file(tmp_path, monkeypatch):
+    csv_path = tmp_path.joinpath('grades.csv')
+    generate_gradebook(csv_path, 10, 8, seed=7)
+    contents = csv_path.read_text()
+    gradebook = GradeBook(csv_path)
+    gradebook.set_grade(next(iter(gradebook.students)), 'Course', '0')
+
+    def interrupted_lines(*args, **kwargs):
+        lines = original_export_lines(*args, **kwargs)
+        yield next(lines)
+        raise KeyboardInterrupt()
+
+    original_export_lines = overunder.export_lines
+    monkeypatch.setattr(overunder, 'export_lines', interrupted_lines)
+    try:
+        gradebook.write_csv()
+    except KeyboardInterrupt:
+        pass
+    assert csv_path.read_text() == contents
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['grades.csv']
+
+
+def test_snapshot_readers_follow_writer(tmp_path):
+    csv_path = tmp_path.joinpath('grades.csv')
+    generate_gradebook(csv_path, 10, 8, seed=4)
+    gradebook = GradeBook(csv_path)
+    store = SnapshotStore(tmp_path, csv_path.name)
+    writer = GradeBookWriter(gradebook, store, str(tmp_path.joinpath('writer.sock')), b'key')
+    reader = SnapshotReader(SnapshotStore(tmp_path, csv_path.name))
+    alias = next(iter(gradebook.students))
+    leaf = [assignment.qualified_name for assignment in gradebook.assignments.traversal][-1]
+    assert reader.sync().get_grade(alias, leaf).display_str == gradebook.get_grade(alias, leaf).display_str
+    writer.call('set_grade', alias, leaf, '0')
+    writer.call('remove_assignment', leaf)
+    writer.call('undo')
+    snapshot = reader.sync()
+    assert snapshot.get_grade(alias, leaf).display_str == '0'
+    assert snapshot.get_grade(alias, 'Course').projection_str == gradebook.get_grade(alias, 'Course').projection_str
+    assert snapshot.history.can_undo and snapshot.history.can_redo
+    writer.close()
+
+
+def test_snapshot_readers_replay_deltas(tmp_path):
+    csv_path = tmp_path.joinpath('grades.csv')
+    generate_gradebook(csv_path, 10, 8, seed=9)
+    gradebook = GradeBook(csv_path)
+    store = SnapshotStore(tmp_path, csv_path.name)
+    writer = GradeBookWriter(gradebook, store, str(tmp_path.joinpath('writer.sock')), b'key')
+    reader = SnapshotReader(SnapshotStore(tmp_path, csv_path.name))
+    reader.sync()
+    aliases = list(gradebook.students)
+    leaves = [assignment.qualified_name for assignment in gradebook.assignments.traversal if assignment.is_leaf]
+    writer.call('set_grade', aliases[0], leaves[0], '0')
+    writer.call('import_grades', f'email,{leaves[1]}\n{gradebook.students[aliases[1]].email},1', None, None)
+    writer.call('checkpoint', 'middle')
+    writer.call('add_assignment', 'Course__Extra', '10')
+    writer.call('undo')
+    writer.call('write_csv')
+    writer.call('restore_checkpoint', 'middle')
+    # only the initial full snapshot was written
+    assert store.base_version == 1 and store.version == 8
+    for snapshot in (reader.sync(), SnapshotReader(SnapshotStore(tmp_path, csv_path.name)).sync()):
+        assert list(snapshot.assignments.to_headings()) == list(gradebook.assignments.to_headings())
+        for alias in aliases:
+            assert snapshot.get_grade(alias, 'Course').projection_str == gradebook.get_grade(alias, 'Course').projection_str
+        assert snapshot.history.checkpoints.keys() == gradebook.history.checkpoints.keys()
+        assert (snapshot.history.can_undo, snapshot.history.can_redo) == (gradebook.history.can_undo, gradebook.history.can_redo)
+    writer.call('reload')
+    assert store.base_version == 9
+    assert reader.sync().get_grade(aliases[0], leaves[0]).display_str == gradebook.get_grade(aliases[0], leaves[0]).display_str
+    writer.close()
+
+
+def test_update_score_after_concurrent_change(tmp_path, monkeypatch):
+    import overunderapp # pylint: disable = import-outside-toplevel
+    csv_path = tmp_path.joinpath('grades.csv')
+    csv_path.write_text('\n'.join([
+        'Student\tCourse (100%)\t__Essay (50%)\t__Exam (50%)\t__Quiz (0%)',
+        'Doe, Jane <jdoe@example.edu>\tNone\t80%\t80%\t0%',
+    ]) + '\n')
+    overunderapp.configure_app(csv_path)
+    address = str(tmp_path.joinpath('writer.sock'))
+    writer = GradeBookWriter(overunderapp.APP.config['gradebook'], SnapshotStore(tmp_path, csv_path.name), address, b'key')
+    # publish every change as a full snapshot, so the reader reloads
+    writer.SNAPSHOT_INTERVAL = 0
+    reader = SnapshotReader(SnapshotStore(tmp_path, csv_path.name))
+    monkeypatch.setitem(overunderapp.APP.config, 'snapshots', reader)
+    monkeypatch.setitem(overunderapp.APP.config, 'writer', WriterClient(address, b'key', reader))
+    monkeypatch.setitem(overunderapp.APP.config, 'metrics_shared', None)
+    call = writer.call
+
+    def call_after_other_change(method, *args):
+        # another worker changes the structure just before this change arrives
+        if method == 'set_grade':
+            call('remove_assignment', 'Course__Quiz')
+        return call(method, *args)
+
+    monkeypatch.setattr(writer, 'call', call_after_other_change)
+    threading.Thread(target=writer.serve_forever, daemon=True).start()
+    client = overunderapp.APP.test_client()
+    data = {'alias': 'jdoe', 'assignment': 'Course__Essay', 'value': '100%'}
+    result = json.loads(client.post('/update_score', data=json.dumps(data)).get_data())
+    gradebook = reader.sync()
+    assert [cell['qname'] for cell in result] == ['jdoe__Course__Essay', 'jdoe__Course']
+    for cell in result:
+        grade = gradebook.get_grade('jdoe', cell['qname'].split('__', 1)[1])
+        assert (cell['display'], cell['projection']) == (grade.display_str, grade.projection_str)
+    assert '90.00%' in result[-1]['projection']
+    # the metrics are shared after the first request, but not after every one
+    metrics_path = tmp_path.joinpath(f'metrics-{os.getpid()}.json')
+    shared = metrics_path.read_text()
+    assert client.post('/update_score', data=json.dumps(data)).get_data() == b'[]'
+    assert metrics_path.read_text() == shared
+
+
+def test_metrics_merge():
+    first, second = Metrics(), Metrics()
+    first.increment('edits', 2)
+    second.increment('edits', 3)
+    first.observe('request_seconds', 0.002, labels={'route': '/'})
+    second.observe('request_seconds', 0.2, labels={'route': '/'})
+    second.observe('request_seconds', 20, labels={'route': '/'})
+    combined = Metrics()
+    combined.merge(first.snapshot())
+    combined.merge(second.snapshot())
+    assert combined.counters['edits'] == 5
+    histogram = combined.histogram('request_seconds', {'route': '/'})
+    assert histogram.count == 3
+    assert dict(histogram.cumulative_counts())['0.25'] == 2
+    assert dict(histogram.cumulative_counts())['+Inf'] == 3
+
+
+def test_gzip_and_conditional_responses(tmp_path):
+    import overunderapp # pylint: disable = import-outside-toplevel
+    csv_path = tmp_path.joinpath('grades.csv')
+    generate_gradebook(csv_path, 20, 8, seed=6)
+    overunderapp.configure_app(csv_path)
+    client = overunderapp.APP.test_client()
+    identity = client.get('/api/grades/all/all/')
+    gzipped = client.get('/api/grades/all/all/', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in identity.headers
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in identity.vary and 'Accept-Encoding' in gzipped.vary
+    assert gzip.decompress(gzipped.get_data()) == identity.get_data()
+    # both encodings share a weak ETag, which revalidates either of them
+    assert gzipped.headers['ETag'] == identity.headers['ETag']
+    assert identity.get_etag()[1]
+    for encoding in ('identity', 'gzip'):
+        response = client.get(
+            '/api/grades/all/all/',
+            headers={'Accept-Encoding': encoding, 'If-None-Match': identity.headers['ETag']},
+        )
+        assert response.status_code == 304 and not response.get_data()
+        assert response.headers['ETag'] == identity.headers['ETag']
+    # streamed pages are compressed too
+    page = client.get('/assignments-students/all/all/', headers={'Accept-Encoding': 'gzip'})
+    assert page.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(page.get_data()) == client.get('/assignments-students/all/all/').get_data()
+
+
+def test_static_caching(tmp_path):
+    import overunderapp # pylint: disable = import-outside-toplevel
+    csv_path = tmp_path.joinpath('grades.csv')
+    generate_gradebook(csv_path, 5, 4, seed=6)
+    overunderapp.configure_app(csv_path)
+    client = overunderapp.APP.test_client()
+    content_hash = overunderapp.read_static('css', 'style.css')[1]
+    assert f'/static/css/style.css?v={content_hash}' in client.get('/assignments-students/all/all/').get_data(as_text=True)
+    fingerprinted = client.get(f'/static/css/style.css?v={content_hash}')
+    assert fingerprinted.cache_control.immutable and fingerprinted.cache_control.public
+    assert fingerprinted.cache_control.max_age == overunderapp.STATIC_MAX_AGE
+    unversioned = client.get('/static/css/style.css')
+    assert unversioned.cache_control.no_cache and not unversioned.cache_control.immutable
+    revalidated = client.get('/static/css/style.css', headers={'If-None-Match': unversioned.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert client.get('/static/css/missing.css').status_code == 404
+    assert client.get('/static/css/..%2F..%2Foverunder.py').status_code == 404
+
+
+def test_metrics_prometheus_format(tmp_path):
+    metrics = Metrics(prefix='test')
+    metrics.register('loads')
+    metrics.increment('edits', 3)
+    metrics.observe('request_seconds', 0.003, labels={'route': '/a', 'method': 'GET'})
+    metrics.observe('request_seconds', 0.3, labels={'route': '/a', 'method': 'GET'})
+    metrics.observe('request_seconds', 30, labels={'route': '/a', 'method': 'GET'})
+    metrics.observe('request_seconds', 0.001, labels={'route': 'say "hi"\n'})
+    lines = metrics.to_prometheus().splitlines()
+    assert lines[:4] == [
+        '# TYPE test_edits_total counter',
+        'test_edits_total 3',
+        '# TYPE test_loads_total counter',
+        'test_loads_total 0',
+    ]
+    assert lines.count('# TYPE test_request_seconds histogram') == 1
+    assert 'test_request_seconds_bucket{method="GET",route="/a",le="0.001"} 0' in lines
+    assert 'test_request_seconds_bucket{method="GET",route="/a",le="0.005"} 1' in lines
+    assert 'test_request_seconds_bucket{method="GET",route="/a",le="0.5"} 2' in lines
+    assert 'test_request_seconds_bucket{method="GET",route="/a",le="10"} 2' in lines
+    assert 'test_request_seconds_bucket{method="GET",route="/a",le="+Inf"} 3' in lines
+    assert 'test_request_seconds_count{method="GET",route="/a"} 3' in lines
+    assert 'test_request_seconds_bucket{route="say \\"hi\\"\\n",le="0.001"} 1' in lines
+    for line in lines:
+        if not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            assert name.startswith('test_') and float(value) >= 0
+    # the endpoint serves the process's registry in the same format
+    import overunderapp # pylint: disable = import-outside-toplevel
+    csv_path = tmp_path.joinpath('grades.csv')
+    generate_gradebook(csv_path, 5, 4, seed=1)
+    overunderapp.configure_app(csv_path)
+    client = overunderapp.APP.test_client()
+    client.get('/stats/all/')
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    count_prefix = 'overunder_request_seconds_count{method="GET",route="/stats/<assignment_filter>/"} '
+    assert any(line.startswith(count_prefix) for line in response.get_data(as_text=True).splitlines())
+
+
+def test_preorder_subtrees(tmp_path):
+    csv_path = tmp_path.joinpath('grades.csv')
+    csv_path.write_text('\n'.join([
+        '\t'.join([
+            'Student', 'Course (100%)', '__HW1 (50%)', '____Code (10)', '____Essay (10)',
+            '__HW10 (50%)', '____Code (10)',
+        ]),
+        '\t'.join(['Doe, Jane <jdoe@example.edu>', 'None', 'None', '5', '6', 'None', '7']),
+    ]) + '\n')
+    gradebook = GradeBook(csv_path)
+
+    def check():
+        root = gradebook.assignments
+        assert root.preorder == list(root.traversal)
+        for assignment in root.traversal:
+            assert assignment.subtree == [
+                other for other in root.traversal
+                if other is assignment or assignment in other.ancestors
+            ]
+            for other in root.traversal:
+                assert assignment.is_ancestor_of(other) == (other is assignment or assignment in other.ancestors)
+
+    check()
+    # a sibling that shares a name prefix is not in the subtree
+    assert [assignment.qualified_name for assignment in gradebook.assignments['Course__HW1'].subtree] == [
+        'Course__HW1', 'Course__HW1__Code', 'Course__HW1__Essay',
+    ]
+    gradebook.add_assignment('Course__HW1__Tests', '5')
+    check()
+    gradebook.add_assignment('Course__HW2', '10%')
+    check()
+    gradebook.move_assignment_down('Course__HW1')
+    check()
+    gradebook.move_assignment_up('Course__HW1__Essay')
+    check()
+    gradebook.remove_assignment('Course__HW10')
+    check()
+    gradebook.undo()
+    check()
+    assert [assignment.name for assignment in gradebook.assignments.preorder] == [
+        'Course', 'HW10', 'Code', 'HW1', 'Essay', 'Code', 'Tests', 'HW2',
+    ]
+    import overunderapp # pylint: disable = import-outside-toplevel
+    overunderapp.configure_app(csv_path)
+    client = overunderapp.APP.test_client()
+    records = json.loads(client.get('/api/schema/Course__HW1/?fields=qualified_name').get_data())
+    assert [record['qualified_name'] for record in records] == ['Course__HW1', 'Course__HW1__Code', 'Course__HW1__Essay']
+    assert client.get('/api/schema/Course__HW/').status_code == 404
+
+
+def test_student_index(tmp_path):
+    csv_path = tmp_path.joinpath('grades.csv')
+    csv_path.write_text('\n'.join([
+        'Student\tCourse (100%)\t__Exam (10)',
+        'Adams, Zed <zadams@example.edu>\tNone\t5',
+        'Brown, Amy <abrown@example.edu>\tNone\t9',
+        'Clark, Bob <bclark@example.edu>\tNone\tNone',
+        'Brown, Cat <cbrown@example.edu>\tNone\t7',
+    ]) + '\n')
+    gradebook = GradeBook(csv_path)
+    students = gradebook.students
+
+    def check(by_name, by_grade, brown):
+        assert [student.alias for student in students.by_name()] == by_name
+        assert [student.alias for student in students.by_name(descending=True)] == by_name[::-1]
+        assert [student.alias for student in students.by_grade(gradebook.assignments['Course__Exam'])] == by_grade
+        assert [student.alias for student in students.search('BROWN')] == brown
+
+    check(['zadams', 'abrown', 'cbrown', 'bclark'], ['abrown', 'cbrown', 'zadams', 'bclark'], ['abrown', 'cbrown'])
+    assert [student.alias for student in students.search('amy brown')] == ['abrown']
+    assert [student.alias for student in students.search('example.edu bob')] == ['bclark']
+    # imported grades reorder the grade order, but not the name order
+    gradebook.import_grades('email,Exam\nbclark@example.edu,10\nabrown@example.edu,1')
+    check(['zadams', 'abrown', 'cbrown', 'bclark'], ['bclark', 'cbrown', 'zadams', 'abrown'], ['abrown', 'cbrown'])
+    # a removed student and a renamed one are picked up on reload
+    gradebook.write_csv()
+    lines = csv_path.read_text().splitlines()
+    csv_path.write_text('\n'.join([
+        lines[0],
+        lines[1].replace('Adams, Zed', 'Young, Zed'),
+        lines[2],
+        lines[3],
+    ]) + '\n')
+    gradebook.reload()
+    students = gradebook.students
+    assert 'cbrown' not in students and len(students) == 3
+    check(['abrown', 'bclark', 'zadams'], ['bclark', 'zadams', 'abrown'], ['abrown'])
+    assert [student.alias for student in students.search('young')] == ['zadams']
+    assert students['zadams'].last_name == 'Young'
+    # a rename alone keeps the index, but not its cached name order
+    csv_path.write_text(csv_path.read_text().replace('Brown, Amy', 'Zimmer, Amy'))
+    gradebook.reload()
+    assert gradebook.students is students
+    check(['bclark', 'zadams', 'abrown'], ['bclark', 'zadams', 'abrown'], ['abrown'])
+
+
+def test_streamed_pages_match_render(tmp_path, monkeypatch):
+    import overunderapp # pylint: disable = import-outside-toplevel
+    csv_path = tmp_path.joinpath('grades.csv')
+    generate_gradebook(csv_path, 30, 10, seed=12)
+    overunderapp.configure_app(csv_path)
+    client = overunderapp.APP.test_client()
+    monkeypatch.setattr(overunderapp, 'STREAM_CHUNK_SIZE', 1024)
+    urls = [
+        '/assignments-students/all/all/',
+        '/students-assignments/all/all/?sort=name',
+        '/assignments-students/all/all/?sort=Course&order=asc&q=example',
+    ]
+    streamed = {}
+    for url in urls:
+        response = client.get(url)
+        assert response.is_streamed
+        chunks = list(response.response)
+        assert len(chunks) > 1
+        assert all(len(chunk) >= 1024 for chunk in chunks[:-1])
+        streamed[url] = b''.join(chunks)
+    monkeypatch.setattr(overunderapp, 'stream_template', overunderapp.render_template)
+    for url in urls:
+        assert client.get(url).get_data() == streamed[url]
+
+
+def test_generate_gradebook(tmp_path):
+    csv_path = tmp_path.joinpath('grades.csv')
+    generate_gradebook(csv_path, 12, 30, depth=3, fanout=2, extra_credit_ratio=0.3, seed=3)
+    contents = csv_path.read_text()
+    # the same seed generates the same book
+    generate_gradebook(csv_path, 12, 30, depth=3, fanout=2, extra_credit_ratio=0.3, seed=3)
+    assert csv_path.read_text() == contents
+    gradebook = GradeBook(csv_path)
+    assert len(gradebook.students) == 12
+    assignments = list(gradebook.assignments.traversal)
+    assert len(assignments) == 1 + 2 + 4 + 30
+    assert sum(1 for assignment in assignments if assignment.is_leaf) == 30
+    assert all(assignment.depth == 3 for assignment in assignments if assignment.is_leaf)
+    # only leaves are extra credit, marked with a * after the name
+    headings = contents.splitlines()[0].split('\t')[1:]
+    marked = [heading.lstrip('_').split(' ')[0][:-1] for heading in headings if '*' in heading]
+    assert marked == [assignment.name for assignment in assignments if assignment.extra_credit]
+    assert marked and all(name.startswith('Assignment') for name in marked)
+
+
+def test_benchmark_compare(capsys):
+    baseline = {
+        'small': {
+            'load': {'seconds': 1.0, 'throughput': 100.0, 'unit': 'nodes/s'},
+            'set_grade': {'seconds': 1.0, 'throughput': 200.0, 'unit': 'edits/s'},
+            'memory': {'peak_bytes': 1000, 'bytes_per_node': 10.0},
+        },
+    }
+    results = {
+        'small': {
+            'load': {'seconds': 1.3, 'throughput': 77.0, 'unit': 'nodes/s'},
+            'set_grade': {'seconds': 1.2, 'throughput': 167.0, 'unit': 'edits/s'},
+            'memory': {'peak_bytes': 900, 'bytes_per_node': 12.6},
+        },
+        'large': {
+            'load': {'seconds': 10.0, 'throughput': 10.0, 'unit': 'nodes/s'},
+        },
+    }
+    # only slowdowns beyond the tolerance are regressions, and tiers without a baseline are not compared
+    assert compare(results, baseline, 0.25) == ['small load seconds', 'small memory bytes_per_node']
+    assert compare(results, baseline, 0.5) == []
+    output = capsys.readouterr().out
+    assert output.count('REGRESSION') == 2
+    assert '[1.30x baseline] REGRESSION' in output
+
+
+CLIENT_ENGINE_HARNESS = """
+const fs = require('fs');
+const vm = require('vm');
+const [main_js, data_path] = process.argv.slice(2);
+const data = JSON.parse(fs.readFileSync(data_path, 'utf8'));
+const context = {
+    document: {getElementById: id => (id in data.leaves ? {value: data.leaves[id]} : null)},
+    $: {trim: string => string.trim()},
+    window: {},
+};
+vm.createContext(context);
+vm.runInContext(fs.readFileSync(main_js, 'utf8'), context);
+context.load_schema(data.schema);
+const cells = data.cells.map(([alias, qualified_name]) => {
+    const cell = new context.GradeEngine(alias).cell(qualified_name);
+    return [cell.display, cell.projection, cell.color];
+});
+process.stdout.write(JSON.stringify(cells));
+"""
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='running the client engine needs node')
+def test_client_engine_matches_server(tmp_path):
+    import overunderapp # pylint: disable = import-outside-toplevel
+    headings = 'Student\tCourse (100%)\t__Homework (40%, drop 1)\t____HW1 (10)\t____HW2 (10)\t____HW3 (10)' + (
+        '\t__Quizzes (20%, keep 2, cap)\t____Q1 (5)\t____Q2 (50%)\t____Q3 (5)\t____Bonus* (5)'
+        '\t__Exams (40%)\t____Midterm (50%)\t____Final (50%)\t__Participation* (5%)'
+    )
+    rows = [
+        'Doe, Jane <jdoe@example.edu>\tNone\tNone\t9\t10\t4\tNone\t5\t80%\t3\t5\tNone\tA-\tB/B+\t100%',
+        'Roe, Rick <rroe@example.edu>\tNone\tNone\t7.5\tNone\t1/2\tNone\tNone\tNone\t4\tNone\tNone\tC+\tNone\tNone',
+        'Poe, Pat <ppoe@example.edu>\tNone\tNone\tNone\tNone\tNone\tNone\tNone\tNone\tNone\tNone\tNone\tNone\tNone\t0',
+    ]
+    for scale_lines in ([], ['Scale\tF (60%)\tD (70%)\tC+ (78%)\tC (80%)\tB+ (88%)\tB (90%)\tA- (95%)\tA (100%)']):
+        csv_path = tmp_path.joinpath('grades.csv')
+        csv_path.write_text('\n'.join([*scale_lines, headings, *rows]) + '\n')
+        gradebook = GradeBook(csv_path)
+        data = {'schema': overunderapp.client_schema(gradebook), 'leaves': {}, 'cells': []}
+        expected = []
+        for alias, assignment_grade_root in gradebook.grades.items():
+            for grade in assignment_grade_root.traversal:
+                if grade.is_leaf:
+                    data['leaves'][f'{alias}__{grade.qualified_name}'] = grade.display_str
+                else:
+                    data['cells'].append([alias, grade.qualified_name])
+                    expected.append([grade.display_str, grade.projection_str, grade.as_color])
+        data_path = tmp_path.joinpath('data.json')
+        data_path.write_text(json.dumps(data))
+        harness_path = tmp_path.joinpath('harness.js')
+        harness_path.write_text(CLIENT_ENGINE_HARNESS)
+        main_js = Path(__file__).parent.joinpath('static', 'js', 'main.js')
+        output = subprocess.run(
+            ['node', str(harness_path), str(main_js), str(data_path)],
+            capture_output=True, check=True, text=True,
+        ).stdout
+        assert json.loads(output) == expected